@@ -0,0 +1,226 @@
+"""
+Admission control for prediction submissions.
+
+Every prediction takes a `Ticket` from the process-wide `AdmissionController`
+before anything is sent to the backend. At most ``max_in_flight`` predictions
+run at once, and each user at most ``max_per_user`` of them. Waiting tickets are
+kept in one queue per user, and free slots go round-robin across users: users
+who have not been served yet go first, then the others in the order they were
+last served, so somebody re-running a large file cannot starve everyone else. A user may not
+submit the same file again while it is still queued or running.
+"""
+import os
+import time
+import hashlib
+import threading
+import collections
+
+from metrics import PREDICTIONS_IN_FLIGHT, PREDICTIONS_QUEUED, PREDICTION_QUEUE_SECONDS, ADMISSION_REJECTIONS
+
+# Predictions sent to the backend at once by this process (override with OSIRIS_MAX_IN_FLIGHT)
+MAX_IN_FLIGHT = int(os.environ.get("OSIRIS_MAX_IN_FLIGHT", "4"))
+
+# Running predictions per user (override with OSIRIS_MAX_IN_FLIGHT_PER_USER)
+MAX_IN_FLIGHT_PER_USER = int(os.environ.get("OSIRIS_MAX_IN_FLIGHT_PER_USER", "1"))
+
+# Waiting predictions per user before further submissions are turned away (override with OSIRIS_MAX_QUEUED_PER_USER)
+MAX_QUEUED_PER_USER = int(os.environ.get("OSIRIS_MAX_QUEUED_PER_USER", "3"))
+
+# Bytes hashed from each end of a file to recognize resubmissions without hashing gigabytes
+FINGERPRINT_BYTES = 1024 * 1024
+
+
+class AdmissionError(Exception):
+    """A submission was turned away before it was queued"""
+
+
+class DuplicateSubmissionError(AdmissionError):
+    """The same user already has this file queued or running"""
+
+
+class QueueFullError(AdmissionError):
+    """The user already has the maximum number of predictions waiting"""
+
+
+def file_fingerprint(name, content, sample_bytes=FINGERPRINT_BYTES):
+    """Identity of an upload from its name, size and both ends of its content"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(name.encode())
+    digest.update(len(content).to_bytes(8, "little"))
+    digest.update(content[:sample_bytes])
+    digest.update(content[-sample_bytes:])
+    return digest.hexdigest()
+
+
+class Ticket:
+    """
+    One submission's place in the admission queue.
+
+    Use it as a context manager: leaving the block gives the slot back, or
+    leaves the queue if the ticket was never admitted.
+    """
+
+    def __init__(self, controller, user, fingerprint):
+        self.controller = controller
+        self.user = user
+        self.fingerprint = fingerprint
+        self.state = "queued"
+        self.submitted_at = time.time()
+        self.started_at = None
+        self._admitted = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the ticket is admitted or ``timeout`` seconds pass; returns whether it was admitted"""
+        return self._admitted.wait(timeout)
+
+    def position(self):
+        """1-based place in the order waiting tickets are admitted, or 0 once admitted"""
+        return self.controller.position(self)
+
+    def release(self):
+        self.controller.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Global and per-user concurrency limits with a round-robin queue across users.
+
+    Parameters:
+    -----------
+    max_in_flight : int
+        Predictions allowed to run at once
+    max_per_user : int
+        Predictions one user may have running at once
+    max_queued_per_user : int
+        Predictions one user may have waiting
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_per_user=MAX_IN_FLIGHT_PER_USER,
+                 max_queued_per_user=MAX_QUEUED_PER_USER):
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.max_queued_per_user = max_queued_per_user
+        self._lock = threading.Lock()
+        self._waiting = {}
+        # Users with tickets queued or running that were admitted before, least recently served first
+        self._served = collections.OrderedDict()
+        self._running = collections.Counter()
+        self._active = set()
+
+    def submit(self, user, fingerprint):
+        """
+        Queue a submission and admit it right away if a slot is free.
+
+        Raises:
+        -------
+        DuplicateSubmissionError
+            When the user already has this file queued or running
+        QueueFullError
+            When the user already has ``max_queued_per_user`` predictions waiting
+        """
+        with self._lock:
+            if (user, fingerprint) in self._active:
+                ADMISSION_REJECTIONS.inc(reason="duplicate")
+                raise DuplicateSubmissionError("This file is already being predicted; wait for the running prediction to finish.")
+            if len(self._waiting.get(user, ())) >= self.max_queued_per_user:
+                ADMISSION_REJECTIONS.inc(reason="queue_full")
+                raise QueueFullError(f"You already have {self.max_queued_per_user} predictions waiting; try again once one has started.")
+
+            ticket = Ticket(self, user, fingerprint)
+            self._active.add((user, fingerprint))
+            self._waiting.setdefault(user, collections.deque()).append(ticket)
+            self._dispatch()
+            self._update_gauges()
+        return ticket
+
+    def release(self, ticket):
+        """Give back a running ticket's slot, or take a waiting ticket out of the queue"""
+        with self._lock:
+            if ticket.state == "running":
+                self._running[ticket.user] -= 1
+                if not self._running[ticket.user]:
+                    del self._running[ticket.user]
+            elif ticket.state == "queued":
+                queue = self._waiting[ticket.user]
+                queue.remove(ticket)
+                if not queue:
+                    del self._waiting[ticket.user]
+            else:
+                return
+            # A user with nothing left queued or running starts over as a new user
+            if ticket.user not in self._running and ticket.user not in self._waiting:
+                self._served.pop(ticket.user, None)
+            ticket.state = "done"
+            self._active.discard((ticket.user, ticket.fingerprint))
+            self._dispatch()
+            self._update_gauges()
+
+    def _rotation(self):
+        """
+        Users with waiting tickets in the order they are served (lock held).
+
+        Users not served yet come first, in the order they started waiting,
+        then the others by when they were last served. The order is kept
+        whether or not a user has anything waiting, so a user whose queue ran
+        empty does not move ahead of others by submitting again.
+        """
+        new = [user for user in self._waiting if user not in self._served]
+        return new + [user for user in self._served if user in self._waiting]
+
+    def _dispatch(self):
+        """Start waiting tickets while slots are free, taking users in turn (lock held)"""
+        while sum(self._running.values()) < self.max_in_flight:
+            user = next((u for u in self._rotation() if self._running[u] < self.max_per_user), None)
+            if user is None:
+                return
+            # The user just served goes to the back of the rotation
+            self._served.pop(user, None)
+            self._served[user] = True
+            ticket = self._waiting[user].popleft()
+            if not self._waiting[user]:
+                del self._waiting[user]
+
+            ticket.state = "running"
+            ticket.started_at = time.time()
+            self._running[user] += 1
+            PREDICTION_QUEUE_SECONDS.observe(ticket.started_at - ticket.submitted_at)
+            ticket._admitted.set()
+
+    def position(self, ticket):
+        """
+        Place of a waiting ticket in the round-robin order.
+
+        Each round admits the next ticket of every user in rotation order, so
+        the tickets ahead are those from earlier rounds plus those of users
+        ahead in the rotation in the same round.
+        """
+        with self._lock:
+            if ticket.state != "queued":
+                return 0
+            rotation = self._rotation()
+            round_index = self._waiting[ticket.user].index(ticket)
+            turn = rotation.index(ticket.user)
+            ahead = sum(
+                min(len(self._waiting[user]), round_index + (1 if i < turn else 0))
+                for i, user in enumerate(rotation)
+            )
+            return ahead + 1
+
+    def snapshot(self):
+        """Running and waiting predictions per user"""
+        with self._lock:
+            users = set(self._running) | set(self._waiting)
+            return {
+                user: {"running": self._running.get(user, 0), "waiting": len(self._waiting.get(user, ()))}
+                for user in users
+            }
+
+    def _update_gauges(self):
+        PREDICTIONS_IN_FLIGHT.set(sum(self._running.values()))
+        PREDICTIONS_QUEUED.set(sum(len(queue) for queue in self._waiting.values()))
@@ -0,0 +1,802 @@
+"""
+Per-cell analysis of the count matrices held in the experiment store.
+
+Cells are aggregated into groups (timepoints) with a sparse indicator matrix:
+``G`` has one row per group and one column per cell, so ``G @ X`` sums every
+per-cell feature of every group in a single sparse product. The pseudobulk
+frame built this way has the same columns as the demo time series, which lets
+the dashboard charts run on real uploads without touching raw cells at render
+time.
+
+Gene signatures (stemness, lineages or user-defined lists) are scored the same
+way: a sparse genes x sets membership matrix scores every set in one product
+per block of cells, on within-cell ranks that are cached in the store.
+"""
+import os
+import hashlib
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy import stats
+
+from metrics import cache_result
+from frame_compaction import compact_and_record
+from count_readers import SUPPORTED_EXTENSIONS
+
+# Cell metadata columns that name a cell's timepoint, in order of preference
+TIMEPOINT_COLUMNS = ("timepoint", "time_point", "day", "date", "collection_date")
+
+# Day number in a timepoint label: "day 7", "Day_7", "D7", "rep1_d7", or a bare "7".
+# Other digits (replicate numbers, "h5" in file names) are not days.
+DAY_PATTERN = r"(?i)(?:^|[^a-z])d(?:ay)?[\s_-]*(\d+(?:\.\d+)?)|^\s*(\d+(?:\.\d+)?)\s*$"
+
+# Genes charted on the dashboard, with the symbols they may appear under in count matrices
+PANEL_GENES = {
+    "CD34": ("CD34",), "KIT": ("KIT",), "GATA2": ("GATA2",), "RUNX1": ("RUNX1",),
+    "TAL1": ("TAL1",), "BMI1": ("BMI1",), "HOXA9": ("HOXA9",), "MEIS1": ("MEIS1",),
+    "MECOM": ("MECOM",), "MYB": ("MYB",), "GATA1": ("GATA1",), "PU.1": ("SPI1", "PU.1"),
+    "CEBPA": ("CEBPA",), "FLT3": ("FLT3",), "MPL": ("MPL",), "IL7R": ("IL7R",), "KLF1": ("KLF1",)
+}
+
+# Gene signatures scored per cell; symbols are matched case-insensitively, and through SYMBOL_ALIASES
+GENE_SETS = {
+    "Stem Cell": ("CD34", "PROM1", "HLF", "MECOM", "HOXA9", "MEIS1", "PROCR", "CRHBP", "AVP", "MLLT3", "BMI1", "KIT"),
+    "Myeloid": ("SPI1", "CEBPA", "CEBPB", "CEBPE", "MPO", "ELANE", "AZU1", "LYZ", "CSF1R", "CSF3R", "CD14", "ITGAM"),
+    "Lymphoid": ("FLT3", "IL7R", "DNTT", "CD79A", "CD79B", "VPREB1", "EBF1", "PAX5", "CD19", "RAG1", "LTB", "BLNK"),
+    "Erythroid": ("GATA1", "KLF1", "TFRC", "GYPA", "EPOR", "ALAS2", "HBB", "HBA1", "HBD", "CA1", "AHSP", "TAL1"),
+}
+SYMBOL_ALIASES = {"PU.1": "SPI1"}
+
+# Signatures used to call a cell's lineage when the backend did not return per-cell lineage predictions
+LINEAGES = ("Myeloid", "Lymphoid", "Erythroid")
+LINEAGE_GENE_SETS = {lineage: GENE_SETS[lineage] for lineage in LINEAGES}
+
+# Cell-cycle genes; a cell expressing any of them counts as proliferating
+PROLIFERATION_GENES = ("MKI67", "TOP2A")
+
+# Expression is reported as counts per this many counts of the cell's library
+NORMALIZATION_TARGET = 1e4
+
+PSEUDOBULK_FRAME = "pseudobulk"
+
+# Bump when the pseudobulk is computed differently so cached frames are rebuilt
+PSEUDOBULK_FORMAT = 3
+
+# Cells per block when differential expression statistics are accumulated in parallel
+DE_BLOCK_CELLS = 20000
+DE_WORKERS = min(8, os.cpu_count() or 1)
+
+# Bootstrap resamples per timepoint and the seed that makes them reproducible
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_SEED = 20240601
+
+# Thresholds for calling a gene differentially expressed
+DE_MAX_PADJ = 0.05
+DE_MIN_LOG2FC = 0.25
+
+# Cells per block when gene sets are ranked and scored in parallel
+SCORE_BLOCK_CELLS = 20000
+SCORE_WORKERS = min(8, os.cpu_count() or 1)
+
+# Gene-set scoring methods: within-cell ranks, or mean log-normalized expression centered across cells
+SCORE_METHODS = ("rank", "mean")
+
+
+def group_indicator(labels):
+    """
+    Build the sparse group-by-cell indicator matrix for a vector of labels.
+
+    Returns:
+    --------
+    tuple
+        (group labels, CSR matrix of shape groups x cells with ones where a
+        cell belongs to a group, number of cells per group)
+    """
+    codes, groups = pd.factorize(pd.Series(labels), sort=True)
+    n_cells = len(codes)
+    indicator = sp.csr_matrix(
+        (np.ones(n_cells, dtype=np.float32), (codes, np.arange(n_cells))),
+        shape=(len(groups), n_cells)
+    )
+    return np.asarray(groups), indicator, np.bincount(codes, minlength=len(groups))
+
+
+def _gene_positions(genes, symbols):
+    """Column of the first symbol found in genes (case-insensitive), or -1"""
+    lookup = {}
+    for i, gene in enumerate(genes):
+        lookup.setdefault(str(gene).upper(), i)
+    for symbol in symbols:
+        if symbol.upper() in lookup:
+            return lookup[symbol.upper()]
+    return -1
+
+
+def cell_timepoints(store, experiment_id, name):
+    """Timepoint label of every cell of a stored matrix, falling back to the matrix name without its extension"""
+    obs = store.read_matrix_obs(experiment_id, name)
+    for column in TIMEPOINT_COLUMNS:
+        if column in obs.columns:
+            return obs[column].to_numpy(dtype=object)
+    stem, extension = os.path.splitext(name)
+    label = stem if extension[1:].lower() in SUPPORTED_EXTENSIONS else name
+    return np.full(len(obs), label, dtype=object)
+
+
+def timepoint_dates(labels, start_date=None):
+    """
+    Place timepoint labels on a calendar.
+
+    ISO dates are used as they are; labels naming a day ("day 7", "D14", or
+    just "7", see DAY_PATTERN) are offset by that many days from start_date;
+    otherwise labels are spaced one day apart, those without a day (such as a
+    control) first and the rest by their day.
+    """
+    labels = pd.Series(labels, dtype=object).astype(str)
+    start = pd.Timestamp(start_date or datetime.date.today()).normalize()
+
+    if len(labels) and labels.str.match(r"^\d{4}-\d{2}-\d{2}").all():
+        return pd.to_datetime(labels).to_numpy()
+    matches = labels.str.extract(DAY_PATTERN)
+    days = matches[0].fillna(matches[1]).astype(float)
+    if days.notna().all() and days.is_unique:
+        return (start + pd.to_timedelta(days, unit="D")).to_numpy()
+    # Stable, so labels with the same day (or none) keep their order
+    order = np.argsort(days.fillna(-np.inf).to_numpy(), kind="stable")
+    offsets = np.empty(len(labels))
+    offsets[order] = np.arange(len(labels))
+    return (start + pd.to_timedelta(offsets, unit="D")).to_numpy()
+
+
+def _predicted_lineages(rows, cells):
+    """Per-cell lineage codes (-1 when unknown) from a sample's stored prediction rows"""
+    if rows is None:
+        return None
+    frame = rows.to_pandas()
+    frame = frame[(frame["model"] == "lineage") & frame["cell"].notna()]
+    if not len(frame):
+        return None
+    frame = frame.astype({"cell": str, "class": str})
+    top = frame.sort_values("probability", ascending=False).drop_duplicates("cell").set_index("cell")["class"]
+    codes = pd.Series(top).map({lineage: i for i, lineage in enumerate(LINEAGES)})
+
+    matched = pd.Index(cells).isin(codes.index)
+    if matched.any():
+        return codes.reindex(cells).fillna(-1).to_numpy(dtype=np.int64)
+    if len(codes) == len(cells):
+        # Backend cell names differ from the matrix's; fall back to row order
+        return codes.fillna(-1).to_numpy(dtype=np.int64)
+    return None
+
+
+def gene_set_membership(genes, gene_sets):
+    """
+    Sparse genes x sets matrix with a one where a gene belongs to a set.
+
+    Symbols are matched case-insensitively and through SYMBOL_ALIASES; genes
+    of a set missing from ``genes`` are left out.
+
+    Returns:
+    --------
+    tuple
+        (CSR membership matrix of shape genes x sets, number of genes found per set)
+    """
+    lookup = {}
+    for i, gene in enumerate(genes):
+        lookup.setdefault(str(gene).upper(), i)
+    rows, columns = [], []
+    for j, symbols in enumerate(gene_sets.values()):
+        found = set()
+        for symbol in symbols:
+            symbol = str(symbol).strip().upper()
+            for candidate in (symbol, SYMBOL_ALIASES.get(symbol)):
+                if candidate in lookup:
+                    found.add(lookup[candidate])
+        rows.extend(sorted(found))
+        columns.extend([j] * len(found))
+    membership = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(genes), len(gene_sets))
+    )
+    return membership, np.bincount(columns, minlength=len(gene_sets))
+
+
+def rank_cells(matrix):
+    """
+    Rank every cell's genes by expression, ties sharing their average rank.
+
+    A cell's zeros tie for the lowest ranks, so only the stored entries need
+    ranking: one lexsort by (cell, value) over the nonzeros of the block.
+
+    Returns:
+    --------
+    numpy.ndarray
+        float32 rank of every stored entry, aligned with ``matrix.data``
+    """
+    n_stored = np.diff(matrix.indptr)
+    rows = np.repeat(np.arange(matrix.shape[0]), n_stored)
+    order = np.lexsort((matrix.data, rows))
+    sorted_rows = rows[order]
+    sorted_values = matrix.data[order]
+
+    # Position within the cell, and the runs of equal values that share a rank
+    position = np.arange(len(order)) - (matrix.indptr[:-1] - matrix.indptr[0])[sorted_rows]
+    run_starts = np.ones(len(order), dtype=bool)
+    run_starts[1:] = (sorted_rows[1:] != sorted_rows[:-1]) | (sorted_values[1:] != sorted_values[:-1])
+    run = np.cumsum(run_starts) - 1
+    run_first = position[run_starts]
+    run_length = np.bincount(run)
+
+    n_zeros = matrix.shape[1] - n_stored
+    ranks = np.empty(len(order), dtype=np.float32)
+    ranks[order] = n_zeros[sorted_rows] + run_first[run] + (run_length[run] - 1) / 2 + 1
+    return ranks
+
+
+def load_cell_ranks(store, experiment_id, name, block_size=SCORE_BLOCK_CELLS, max_workers=SCORE_WORKERS):
+    """
+    Within-cell ranks of a stored matrix, computed once per version of the matrix.
+
+    The ranks are kept in the store as a frame aligned with the matrix's
+    stored entries, so scoring other signatures later only costs sparse
+    products.
+    """
+    frame = f"ranks_{name}"
+    version = store.matrix_version(experiment_id, name)
+    versions = store.read_meta(experiment_id).get("rank_versions", {})
+    hit = versions.get(name) == version and store.has_frame(experiment_id, frame)
+    cache_result("cell_ranks", hit)
+    if hit:
+        return store.read_frame(experiment_id, frame)["rank"].to_numpy()
+
+    n_cells = store.read_matrix(experiment_id, name).shape[0]
+    blocks = [slice(start, min(start + block_size, n_cells)) for start in range(0, n_cells, block_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        ranks = list(pool.map(lambda cells: rank_cells(store.read_matrix(experiment_id, name, cells=cells)), blocks))
+    ranks = np.concatenate(ranks) if ranks else np.zeros(0, dtype=np.float32)
+    store.write_frame(experiment_id, frame, pd.DataFrame({"rank": ranks}))
+    with store.experiment_lock(experiment_id):
+        versions = store.read_meta(experiment_id).get("rank_versions", {})
+        store.write_meta(experiment_id, rank_versions={**versions, name: version})
+    return ranks
+
+
+def _score_block(matrix, membership, set_sizes, method, ranks=None):
+    """
+    Scores of every cell of a block for every set, as a cells x sets array.
+
+    ``rank`` is the mean within-cell rank of a set's genes, scaled to
+    [-0.5, 0.5] with 0 expected for randomly drawn genes; ``mean`` is the mean
+    log1p(CP10k) of a set's genes, before centering. Sets without any gene in
+    the matrix score NaN.
+    """
+    n_genes = matrix.shape[1]
+    sizes = set_sizes.astype(np.float64)
+    if method == "rank":
+        ranked = sp.csr_matrix((ranks, matrix.indices, matrix.indptr), shape=matrix.shape)
+        stored = sp.csr_matrix((np.ones_like(ranks), matrix.indices, matrix.indptr), shape=matrix.shape)
+        rank_sums = (ranked @ membership).toarray()
+        n_stored = (stored @ membership).toarray()
+        # Genes of the set a cell did not express sit at the middle rank of its zeros
+        zero_rank = (n_genes - np.diff(matrix.indptr) + 1) / 2
+        totals = rank_sums + (sizes - n_stored) * zero_rank[:, None]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(sizes > 0, (totals / sizes - (n_genes + 1) / 2) / n_genes, np.nan)
+
+    library_size = np.asarray(matrix.sum(axis=1)).ravel()
+    scale = np.divide(NORMALIZATION_TARGET, library_size, out=np.zeros_like(library_size, dtype=np.float64), where=library_size > 0)
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    logged = sp.csr_matrix((np.log1p(matrix.data * scale[rows]), matrix.indices, matrix.indptr), shape=matrix.shape)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(sizes > 0, (logged @ membership).toarray() / sizes, np.nan)
+
+
+def score_matrix(store, experiment_id, name, gene_sets, method="rank", block_size=SCORE_BLOCK_CELLS, max_workers=SCORE_WORKERS):
+    """
+    Score every cell of one stored matrix for every gene set at once.
+
+    All sets go through one sparse genes x sets product per block of cells,
+    and blocks run in parallel on memory-mapped slices of the matrix. Rank
+    scores read the cached rankings of load_cell_ranks.
+
+    Returns:
+    --------
+    numpy.ndarray
+        cells x sets scores, uncentered for ``mean``
+    """
+    if method not in SCORE_METHODS:
+        raise ValueError(f"Unknown scoring method {method!r}; expected one of {SCORE_METHODS}")
+    genes, _ = store.read_matrix_names(experiment_id, name)
+    membership, set_sizes = gene_set_membership(genes, gene_sets)
+    indptr = store.read_matrix(experiment_id, name).indptr
+    n_cells = len(indptr) - 1
+    ranks = load_cell_ranks(store, experiment_id, name, block_size, max_workers) if method == "rank" else None
+
+    def run(start):
+        stop = min(start + block_size, n_cells)
+        block = store.read_matrix(experiment_id, name, cells=slice(start, stop))
+        block_ranks = ranks[indptr[start]:indptr[stop]] if ranks is not None else None
+        return _score_block(block, membership, set_sizes, method, block_ranks)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        blocks = list(pool.map(run, range(0, n_cells, block_size)))
+    return np.vstack(blocks) if blocks else np.zeros((0, len(gene_sets)))
+
+
+def score_gene_sets(store, experiment_id, gene_sets=GENE_SETS, method="rank"):
+    """
+    Per-cell gene-set scores of every stored matrix of an experiment.
+
+    Parameters:
+    -----------
+    store : ExperimentStore
+        Store holding the experiment
+    experiment_id : str
+        Experiment to score
+    gene_sets : dict
+        Signature name to gene symbols
+    method : str
+        ``rank`` for rank-based scores, comparable between cells of any
+        depth, or ``mean`` for mean log-normalized expression centered on
+        the mean over all cells of the experiment
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per cell with ``Sample``, ``Cell``, ``Timepoint`` and one
+        column per gene set
+    """
+    frames = []
+    for name in store.list_matrices(experiment_id):
+        scores = score_matrix(store, experiment_id, name, gene_sets, method)
+        if not len(scores):
+            continue
+        _, cells = store.read_matrix_names(experiment_id, name)
+        frame = pd.DataFrame(scores, columns=list(gene_sets))
+        frame.insert(0, "Sample", name)
+        frame.insert(1, "Cell", cells)
+        frame.insert(2, "Timepoint", cell_timepoints(store, experiment_id, name))
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["Sample", "Cell", "Timepoint"] + list(gene_sets))
+    frame = pd.concat(frames, ignore_index=True)
+    if method == "mean":
+        frame[list(gene_sets)] -= frame[list(gene_sets)].mean()
+    return frame
+
+
+def call_lineages(store, experiment_id, name):
+    """Per-cell lineage codes (-1 when unassigned) from rank scores of the lineage signatures"""
+    scores = score_matrix(store, experiment_id, name, LINEAGE_GENE_SETS, "rank")
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    # A cell is assigned to its best signature only if that signature ranks above random genes
+    return np.where(scores.max(axis=1) > 0, scores.argmax(axis=1), -1)
+
+
+def _cell_features(matrix, genes, lineage_codes):
+    """
+    Per-cell feature matrix that the group indicator is multiplied with.
+
+    Columns are the normalized panel genes, CD34 positivity, proliferation,
+    one-hot lineage calls and a lineage-assigned flag. Only the panel columns
+    of the counts are touched.
+    """
+    library_size = np.asarray(matrix.sum(axis=1)).ravel()
+    scale = np.divide(NORMALIZATION_TARGET, library_size, out=np.zeros_like(library_size, dtype=np.float64), where=library_size > 0)
+
+    panel = [_gene_positions(genes, symbols) for symbols in PANEL_GENES.values()]
+    found = [j for j, p in enumerate(panel) if p >= 0]
+    expression = sp.csr_matrix((matrix.shape[0], len(panel)), dtype=np.float32)
+    if found:
+        selected = sp.diags(scale.astype(np.float32)) @ matrix[:, [panel[j] for j in found]]
+        # Move the found genes to their panel columns; missing genes stay zero
+        placement = sp.csr_matrix(
+            (np.ones(len(found), dtype=np.float32), (np.arange(len(found)), found)),
+            shape=(len(found), len(panel))
+        )
+        expression = (selected @ placement).tocsr()
+
+    panel_names = list(PANEL_GENES)
+    cd34 = expression[:, panel_names.index("CD34")]
+    cd34_positive = (cd34 > 0).astype(np.float32)
+
+    cycling = [p for p in (_gene_positions(genes, (g,)) for g in PROLIFERATION_GENES) if p >= 0]
+    if cycling:
+        proliferating = sp.csr_matrix((np.asarray(matrix[:, cycling].sum(axis=1)).ravel() > 0).astype(np.float32)[:, None])
+    else:
+        proliferating = sp.csr_matrix((matrix.shape[0], 1), dtype=np.float32)
+
+    assigned = lineage_codes >= 0
+    lineages = sp.csr_matrix(
+        (np.ones(assigned.sum(), dtype=np.float32), (np.flatnonzero(assigned), lineage_codes[assigned])),
+        shape=(matrix.shape[0], len(LINEAGES))
+    )
+
+    return sp.hstack([
+        expression,
+        cd34_positive,
+        proliferating,
+        lineages,
+        sp.csr_matrix(assigned.astype(np.float32)[:, None])
+    ], format="csr")
+
+
+def timepoint_calendar(store, experiment_id, start_date=None):
+    """Return {timepoint label: date} for every timepoint of an experiment's stored cells"""
+    labels = set()
+    for name in store.list_matrices(experiment_id):
+        labels.update(cell_timepoints(store, experiment_id, name))
+    labels = sorted(labels)
+    return dict(zip(labels, pd.to_datetime(timepoint_dates(labels, start_date))))
+
+
+def mark_protocol_changes(frame, changes):
+    """
+    Flag the timepoint at or after each recorded protocol change.
+
+    ``changes`` is a list of dicts with ``date``, ``change`` and ``target``, as
+    kept in the experiment's meta.json.
+    """
+    frame["Protocol_Change"] = False
+    frame["Change_Description"] = None
+    frame["Change_Target"] = None
+    for change in changes:
+        after = np.flatnonzero(frame["Date"] >= pd.Timestamp(change["date"]))
+        if len(after):
+            frame.loc[after[0], "Protocol_Change"] = True
+            frame.loc[after[0], "Change_Description"] = change["change"]
+            frame.loc[after[0], "Change_Target"] = change.get("target", "")
+    return frame
+
+
+def calculate_self_renewal_score(proliferation_rate, cd34_expression):
+    """
+    Calculate self-renewal score based on proliferation rate and CD34 expression.
+    This is a placeholder for future AI model integration.
+    """
+    # Normalize inputs to 0-1 scale
+    norm_prolif = min(max(proliferation_rate / 100, 0), 1)
+    norm_cd34 = min(max(cd34_expression / 100, 0), 1)
+
+    # Simple weighted average - to be replaced with ML model
+    score = (norm_prolif * 0.6) + (norm_cd34 * 0.4)
+    return score * 100  # Convert to 0-100 scale
+
+
+def calculate_multipotency_score(lineage_markers):
+    """
+    Calculate multipotency score based on lineage marker diversity.
+    This is a placeholder for future AI model integration.
+    """
+    # Count number of lineages with significant expression
+    significant_lineages = sum(1 for marker in lineage_markers.values() if marker > 20)
+
+    # Calculate evenness of distribution (Shannon diversity index-inspired)
+    total = sum(lineage_markers.values())
+    if total == 0:
+        return 0
+
+    proportions = [marker/total for marker in lineage_markers.values() if marker > 0]
+    evenness = -sum(p * np.log(p) for p in proportions) / np.log(len(proportions)) if proportions else 0
+
+    # Combine metrics - to be replaced with ML model
+    score = (significant_lineages / len(lineage_markers) * 0.5) + (evenness * 0.5)
+    return score * 100  # Convert to 0-100 scale
+
+
+def score_pseudobulk(df):
+    """Add the score columns to a pseudobulk frame using the same models as the demo data"""
+    df["Self_Renewal_Score"] = [
+        calculate_self_renewal_score(proliferation, cd34)
+        for proliferation, cd34 in zip(df["Proliferation_Rate"], df["CD34_Expression"])
+    ]
+    df["Multipotency_Score"] = [
+        calculate_multipotency_score({"myeloid": myeloid, "lymphoid": lymphoid, "erythroid": erythroid})
+        for myeloid, lymphoid, erythroid in zip(df["Myeloid_Percentage"], df["Lymphoid_Percentage"], df["Erythroid_Percentage"])
+    ]
+    return df
+
+
+def _iter_timepoint_features(store, experiment_id):
+    """Yield (groups, indicator, group sizes, per-cell features) for every stored matrix of an experiment"""
+    for name in store.list_matrices(experiment_id):
+        matrix = store.read_matrix(experiment_id, name)
+        if matrix.shape[0] == 0:
+            continue
+        genes, cells = store.read_matrix_names(experiment_id, name)
+        lineage_codes = _predicted_lineages(store.open_predictions(experiment_id, name), cells)
+        if lineage_codes is None:
+            lineage_codes = call_lineages(store, experiment_id, name)
+        features = _cell_features(matrix, genes, lineage_codes)
+        groups, indicator, group_sizes = group_indicator(cell_timepoints(store, experiment_id, name))
+        yield groups, indicator, group_sizes, features
+
+
+def pseudobulk(store, experiment_id, start_date=None):
+    """
+    Aggregate every stored matrix of an experiment into one row per timepoint.
+
+    Cells are grouped by their timepoint metadata, or by the matrix (sample)
+    they came from when there is none. Per-cell lineage predictions are used
+    when the backend returned them; otherwise each cell is called from rank
+    scores of the full lineage signatures.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per timepoint with ``Date``, ``Timepoint``, ``N_Cells``, the
+        lineage percentages, ``CD34_Expression`` (% CD34+ cells),
+        ``Proliferation_Rate`` (% cycling cells) and ``Gene_<symbol>`` mean
+        normalized expression, sorted by date. Empty when the experiment has
+        no per-cell data.
+    """
+    sums, counts = {}, {}
+    for groups, indicator, group_sizes, features in _iter_timepoint_features(store, experiment_id):
+        group_sums = np.asarray((indicator @ features).todense())
+        for group, row, size in zip(groups, group_sums, group_sizes):
+            sums[group] = sums.get(group, 0) + row
+            counts[group] = counts.get(group, 0) + size
+
+    if not sums:
+        return pd.DataFrame()
+
+    labels = sorted(sums)
+    totals = np.vstack([sums[label] for label in labels])
+    n_cells = np.array([counts[label] for label in labels], dtype=np.float64)
+
+    n_panel = len(PANEL_GENES)
+    means = totals / n_cells[:, None]
+    lineage_counts = totals[:, n_panel + 2:n_panel + 2 + len(LINEAGES)]
+    assigned = totals[:, -1]
+    lineage_pct = np.divide(lineage_counts * 100, assigned[:, None], out=np.zeros_like(lineage_counts), where=assigned[:, None] > 0)
+
+    frame = pd.DataFrame({
+        "Date": timepoint_dates(labels, start_date),
+        "Timepoint": labels,
+        "N_Cells": n_cells.astype(np.int64),
+        "Myeloid_Percentage": lineage_pct[:, 0],
+        "Lymphoid_Percentage": lineage_pct[:, 1],
+        "Erythroid_Percentage": lineage_pct[:, 2],
+        "CD34_Expression": means[:, n_panel] * 100,
+        "Proliferation_Rate": means[:, n_panel + 1] * 100,
+    })
+    for i, gene in enumerate(PANEL_GENES):
+        frame[f"Gene_{gene}"] = means[:, i]
+    frame["Protocol_Change"] = False
+    return frame.sort_values("Date", ignore_index=True)
+
+
+def load_pseudobulk(store, experiment_id, start_date=None):
+    """
+    Return the experiment's pseudobulk frame, recomputing it only when its per-cell inputs changed.
+
+    The frame is cached in the store next to the data it was built from, so it
+    is shared by every session and survives restarts.
+    """
+    version = f"{PSEUDOBULK_FORMAT}:{store.cell_data_version(experiment_id)}"
+    meta = store.read_meta(experiment_id)
+    hit = meta.get("pseudobulk_version") == version and store.has_frame(experiment_id, PSEUDOBULK_FRAME)
+    cache_result("pseudobulk", hit)
+    if hit:
+        return store.read_frame(experiment_id, PSEUDOBULK_FRAME)
+
+    frame = pseudobulk(store, experiment_id, start_date)
+    if not frame.empty:
+        frame = compact_and_record(store, experiment_id, PSEUDOBULK_FRAME, frame)
+        store.write_frame(experiment_id, PSEUDOBULK_FRAME, frame)
+        store.write_meta(experiment_id, pseudobulk_version=version)
+    return frame
+
+
+def _benjamini_hochberg(pvalues):
+    """False discovery rate adjusted p-values"""
+    n = len(pvalues)
+    order = np.argsort(pvalues)
+    ranked = pvalues[order] * n / np.arange(1, n + 1)
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty(n)
+    result[order] = np.minimum(adjusted, 1)
+    return result
+
+
+def _group_moments(matrix, group_codes):
+    """
+    Per-group sums, sums of squares and nonzero counts of log-normalized expression.
+
+    ``group_codes`` holds 0 or 1 for cells in the two compared groups and -1
+    for cells outside both. Returns a (3, 2, genes) array.
+    """
+    keep = np.flatnonzero(group_codes >= 0)
+    if len(keep) == 0:
+        return np.zeros((3, 2, matrix.shape[1]))
+    if len(keep) < matrix.shape[0]:
+        matrix = matrix[keep]
+    codes = group_codes[keep]
+
+    library_size = np.asarray(matrix.sum(axis=1)).ravel()
+    scale = np.divide(NORMALIZATION_TARGET, library_size, out=np.zeros_like(library_size, dtype=np.float64), where=library_size > 0)
+    # log1p(CP10k) touching only the stored nonzeros; zeros stay zero
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    logged = sp.csr_matrix((np.log1p(matrix.data * scale[rows]), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+    indicator = sp.csr_matrix(
+        (np.ones(len(codes)), (codes, np.arange(len(codes)))),
+        shape=(2, len(codes))
+    )
+    return np.stack([
+        (indicator @ logged).toarray(),
+        (indicator @ logged.multiply(logged)).toarray(),
+        (indicator @ (logged > 0).astype(np.float64)).toarray()
+    ])
+
+
+def differential_expression(store, experiment_id, labels_a, labels_b, block_size=DE_BLOCK_CELLS, max_workers=DE_WORKERS):
+    """
+    Compare every gene between two groups of timepoints.
+
+    Group moments are accumulated with sparse indicator products over blocks
+    of cells, which are zero-copy slices of the stored CSR matrices, on a
+    thread pool. A Welch t-test on log1p(CP10k) expression is then computed for
+    all genes at once.
+
+    Parameters:
+    -----------
+    labels_a, labels_b : list of str
+        Timepoint labels of the reference ("before") and test ("after") groups
+
+    Returns:
+    --------
+    pandas.DataFrame
+        gene, mean_a, mean_b, pct_a, pct_b, log2fc (b vs a), t, pvalue and
+        padj, one row per gene detected in either group
+    """
+    labels_a, labels_b = set(labels_a), set(labels_b)
+    matrices = store.list_matrices(experiment_id)
+
+    # Union of the genes of every matrix; each matrix scatters into it
+    gene_index = {}
+    for name in matrices:
+        genes, _ = store.read_matrix_names(experiment_id, name)
+        for gene in genes:
+            gene_index.setdefault(gene, len(gene_index))
+    moments = np.zeros((3, 2, len(gene_index)))
+
+    tasks = []
+    n = np.zeros(2)
+    for name in matrices:
+        timepoints = cell_timepoints(store, experiment_id, name)
+        codes = np.where(np.isin(timepoints, list(labels_a)), 0, np.where(np.isin(timepoints, list(labels_b)), 1, -1))
+        n += [(codes == 0).sum(), (codes == 1).sum()]
+        if not (codes >= 0).any():
+            continue
+        genes, _ = store.read_matrix_names(experiment_id, name)
+        positions = np.array([gene_index[gene] for gene in genes], dtype=np.int64)
+        for start in range(0, len(codes), block_size):
+            stop = min(start + block_size, len(codes))
+            if (codes[start:stop] >= 0).any():
+                tasks.append((name, positions, codes[start:stop], start, stop))
+
+    if (n < 2).any():
+        raise ValueError("Each group needs at least two cells")
+
+    def run(task):
+        name, positions, block_codes, start, stop = task
+        return positions, _group_moments(store.read_matrix(experiment_id, name, cells=slice(start, stop)), block_codes)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for positions, block in pool.map(run, tasks):
+            moments[:, :, positions] += block
+
+    sums, squares, nonzero = moments
+
+    means = sums / n[:, None]
+    variances = np.maximum(squares - n[:, None] * means ** 2, 0) / (n[:, None] - 1)
+    standard_error = variances / n[:, None]
+    se_total = standard_error.sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (means[1] - means[0]) / np.sqrt(se_total)
+        dof = se_total ** 2 / (standard_error[0] ** 2 / (n[0] - 1) + standard_error[1] ** 2 / (n[1] - 1))
+    detected = nonzero.sum(axis=0) > 0
+    t = np.where(detected & (se_total > 0), t, 0.0)
+    dof = np.where(np.isfinite(dof), dof, 1.0)
+    pvalues = 2 * stats.t.sf(np.abs(t), dof)
+
+    frame = pd.DataFrame({
+        "gene": list(gene_index),
+        "mean_a": means[0],
+        "mean_b": means[1],
+        "pct_a": nonzero[0] / n[0] * 100,
+        "pct_b": nonzero[1] / n[1] * 100,
+        "log2fc": (means[1] - means[0]) / np.log(2),
+        "t": t,
+        "pvalue": pvalues,
+    })[detected].reset_index(drop=True)
+    frame["padj"] = _benjamini_hochberg(frame["pvalue"].to_numpy())
+    frame["significant"] = (frame["padj"] < DE_MAX_PADJ) & (frame["log2fc"].abs() >= DE_MIN_LOG2FC)
+    return frame
+
+
+def load_differential_expression(store, experiment_id, labels_a, labels_b):
+    """Differential expression for one comparison, cached in the store per comparison and data version"""
+    key = "|".join([store.cell_data_version(experiment_id), ",".join(sorted(labels_a)), ",".join(sorted(labels_b))])
+    name = f"de_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+    hit = store.has_frame(experiment_id, name)
+    cache_result("differential_expression", hit)
+    if hit:
+        return store.read_frame(experiment_id, name)
+    frame = differential_expression(store, experiment_id, labels_a, labels_b)
+    store.write_frame(experiment_id, name, frame)
+    return frame
+
+
+def _state_codes(features):
+    """
+    Encode every cell's score inputs as one of 16 states.
+
+    The scores only depend on whether a cell is CD34+, whether it is cycling
+    and its lineage call, so a cell is fully described by
+    ``8 * cd34 + 4 * cycling + (lineage + 1)``.
+    """
+    n_panel = len(PANEL_GENES)
+    flags = features[:, n_panel:].toarray()
+    cd34, cycling = flags[:, 0] > 0, flags[:, 1] > 0
+    lineage = np.where(flags[:, -1] > 0, flags[:, 2:2 + len(LINEAGES)].argmax(axis=1), -1)
+    return 8 * cd34 + 4 * cycling + lineage + 1
+
+
+def bootstrap_timepoints(store, experiment_id, n_resamples=BOOTSTRAP_RESAMPLES, seed=BOOTSTRAP_SEED):
+    """
+    Resample cells with replacement within every timepoint.
+
+    Resampling n cells with replacement is the same as drawing their state
+    counts from a multinomial over the observed state frequencies, so each
+    resample costs 16 numbers instead of n, and thousands of resamples over
+    100k cells take milliseconds.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        ``n_resamples`` rows per timepoint with ``Timepoint``, ``Resample``,
+        ``CD34_Expression``, ``Proliferation_Rate`` and the lineage
+        percentages, the inputs of the score functions
+    """
+    state_counts = {}
+    for groups, indicator, _, features in _iter_timepoint_features(store, experiment_id):
+        codes = _state_codes(features)
+        states = sp.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)), shape=(len(codes), 16))
+        for group, row in zip(groups, (indicator @ states).toarray()):
+            state_counts[group] = state_counts.get(group, 0) + row
+
+    rng = np.random.default_rng(seed)
+    states = np.arange(16)
+    cd34, cycling, lineage = states >= 8, (states % 8) >= 4, states % 4 - 1
+    frames = []
+    for label in sorted(state_counts):
+        counts = state_counts[label]
+        n_cells = int(counts.sum())
+        draws = rng.multinomial(n_cells, counts / n_cells, size=n_resamples).astype(np.float64)
+        lineage_counts = np.column_stack([draws[:, lineage == i].sum(axis=1) for i in range(len(LINEAGES))])
+        assigned = lineage_counts.sum(axis=1)
+        lineage_pct = np.divide(lineage_counts * 100, assigned[:, None], out=np.zeros_like(lineage_counts), where=assigned[:, None] > 0)
+        frames.append(pd.DataFrame({
+            "Timepoint": label,
+            "Resample": np.arange(n_resamples),
+            "CD34_Expression": draws[:, cd34].sum(axis=1) / n_cells * 100,
+            "Proliferation_Rate": draws[:, cycling].sum(axis=1) / n_cells * 100,
+            "Myeloid_Percentage": lineage_pct[:, 0],
+            "Lymphoid_Percentage": lineage_pct[:, 1],
+            "Erythroid_Percentage": lineage_pct[:, 2],
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def confidence_bands(resamples, columns, level=0.95):
+    """Per-timepoint percentile interval of each column, as ``<column>_Low`` / ``<column>_High``"""
+    grouped = resamples.groupby("Timepoint")[list(columns)]
+    low = grouped.quantile((1 - level) / 2).add_suffix("_Low")
+    high = grouped.quantile(1 - (1 - level) / 2).add_suffix("_High")
+    return low.join(high).reset_index()
@@ -0,0 +1,395 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import scipy.io
+import scipy.sparse as sp
+
+# Extensions accepted by the upload widgets, grouped by reader
+TABLE_EXTENSIONS = ("csv", "tsv")
+MTX_EXTENSIONS = ("mtx",)
+HDF5_EXTENSIONS = ("h5ad", "h5")
+SUPPORTED_EXTENSIONS = TABLE_EXTENSIONS + MTX_EXTENSIONS + HDF5_EXTENSIONS
+
+# Stored entries held in memory at once when a CSC matrix is converted to CSR on disk
+CSC_BLOCK_ENTRIES = 20_000_000
+
+
+def _decode(values):
+    """Turn an HDF5 string dataset (bytes or str) into a list of str"""
+    values = np.asarray(values)
+    if values.dtype.kind in ("S", "O"):
+        return [v.decode() if isinstance(v, bytes) else str(v) for v in values]
+    return [str(v) for v in values]
+
+
+def _contiguous_runs(positions):
+    """Split sorted integer positions into (start, stop) runs of consecutive values"""
+    if len(positions) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(positions) != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    stops = np.concatenate((breaks, [len(positions)]))
+    return [(int(positions[a]), int(positions[b - 1]) + 1) for a, b in zip(starts, stops)]
+
+
+def _as_positions(selection, size):
+    """Normalise a slice, boolean mask or index list into sorted unique positions"""
+    if selection is None:
+        return np.arange(size)
+    if isinstance(selection, slice):
+        return np.arange(size)[selection]
+    selection = np.asarray(selection)
+    if selection.dtype == bool:
+        return np.flatnonzero(selection)
+    return np.unique(selection.astype(np.int64))
+
+
+def _column_blocks(indptr, max_entries):
+    """(start, stop) column ranges of a CSC matrix with at most max_entries entries each, or a single column"""
+    blocks, start, n_columns = [], 0, len(indptr) - 1
+    while start < n_columns:
+        stop = int(np.searchsorted(indptr, indptr[start] + max_entries, side="right")) - 1
+        stop = min(max(stop, start + 1), n_columns)
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+class CountMatrixReader:
+    """
+    Common interface over the count matrix formats the dashboard accepts.
+
+    A reader always presents the data as cells x genes. Metadata (cell and gene
+    names, obs/var tables) is available without touching the count values, and
+    ``read`` only loads the cells and genes that are asked for.
+    """
+
+    def __init__(self, genes, cells):
+        self.genes = list(genes)
+        self.cells = list(cells)
+        self._gene_lookup = None
+
+    @property
+    def shape(self):
+        return (len(self.cells), len(self.genes))
+
+    def obs(self):
+        """Per-cell metadata table"""
+        return pd.DataFrame(index=pd.Index(self.cells, name="cell"))
+
+    def var(self):
+        """Per-gene metadata table"""
+        return pd.DataFrame(index=pd.Index(self.genes, name="gene"))
+
+    def gene_positions(self, names):
+        """Column positions of the given gene names; unknown genes are skipped"""
+        if self._gene_lookup is None:
+            self._gene_lookup = {gene: i for i, gene in enumerate(self.genes)}
+        return np.array([self._gene_lookup[n] for n in names if n in self._gene_lookup], dtype=np.int64)
+
+    def _read_rows(self, start, stop):
+        """Return rows [start, stop) as a CSR matrix with all genes"""
+        raise NotImplementedError
+
+    def read(self, cells=None, genes=None):
+        """
+        Load a slice of the matrix.
+
+        Parameters:
+        -----------
+        cells : slice, bool mask or list of int, optional
+            Rows to load. Defaults to every cell.
+        genes : slice, bool mask or list of int, optional
+            Columns to keep. Defaults to every gene.
+
+        Returns:
+        --------
+        scipy.sparse.csr_matrix
+            The selected cells x genes, in ascending row and column order
+        """
+        rows = _as_positions(cells, self.shape[0])
+        blocks = [self._read_rows(start, stop) for start, stop in _contiguous_runs(rows)]
+        matrix = sp.vstack(blocks, format="csr") if blocks else sp.csr_matrix((0, self.shape[1]), dtype=np.float32)
+        if genes is not None:
+            matrix = matrix[:, _as_positions(genes, self.shape[1])]
+        return matrix
+
+    def iter_cell_blocks(self, block_size=10000):
+        """Yield (row slice, CSR block) pairs covering every cell"""
+        for start in range(0, self.shape[0], block_size):
+            stop = min(start + block_size, self.shape[0])
+            yield slice(start, stop), self._read_rows(start, stop)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class InMemoryReader(CountMatrixReader):
+    """Reader for formats without random access (CSV, TSV, MTX) that are parsed up front"""
+
+    def __init__(self, matrix, genes, cells):
+        super().__init__(genes, cells)
+        self.matrix = sp.csr_matrix(matrix, dtype=np.float32)
+
+    def _read_rows(self, start, stop):
+        return self.matrix[start:stop]
+
+
+class CellSubsetReader(CountMatrixReader):
+    """View of another reader restricted to some of its cells, such as the ones that passed QC"""
+
+    def __init__(self, reader, cells):
+        self.reader = reader
+        self.positions = _as_positions(cells, reader.shape[0])
+        super().__init__(reader.genes, [reader.cells[i] for i in self.positions])
+
+    def obs(self):
+        return self.reader.obs().iloc[self.positions]
+
+    def var(self):
+        return self.reader.var()
+
+    def _read_rows(self, start, stop):
+        return self.reader.read(cells=self.positions[start:stop])
+
+
+class _CompressedRowsReader(CountMatrixReader):
+    """
+    Backed reader for HDF5 sparse groups stored so that each cell is contiguous.
+
+    Only ``indptr`` is read eagerly; ``data`` and ``indices`` are sliced from the
+    file for the rows that are requested.
+    """
+
+    def __init__(self, h5file, group, genes, cells):
+        super().__init__(genes, cells)
+        self._file = h5file
+        self._data = group["data"]
+        self._indices = group["indices"]
+        self._indptr = group["indptr"][:]
+
+    def _read_rows(self, start, stop):
+        lo, hi = int(self._indptr[start]), int(self._indptr[stop])
+        return sp.csr_matrix(
+            (
+                self._data[lo:hi].astype(np.float32),
+                self._indices[lo:hi],
+                self._indptr[start:stop + 1] - lo
+            ),
+            shape=(stop - start, len(self.genes))
+        )
+
+    def close(self):
+        self._file.close()
+
+
+class H5adReader(_CompressedRowsReader):
+    """
+    Backed reader for AnnData ``.h5ad`` files.
+
+    Supports CSR (the AnnData default), CSC and dense ``X``. Dense matrices
+    are read one row range at a time. In CSC every range of cells touches all
+    of the file, so the first time rows are read a CSC ``X`` is converted to
+    CSR in scratch files on disk, and rows are then sliced from those.
+    """
+
+    def __init__(self, source):
+        import h5py
+
+        h5file = h5py.File(source, "r")
+        self._obs_group = h5file["obs"]
+        self._var_group = h5file["var"]
+        cells = self._read_index(self._obs_group)
+        genes = self._read_index(self._var_group)
+
+        X = h5file["X"]
+        self._encoding = X.attrs.get("encoding-type", "array") if isinstance(X, h5py.Group) else "array"
+        if isinstance(self._encoding, bytes):
+            self._encoding = self._encoding.decode()
+
+        self._scratch = None
+        if self._encoding == "csr_matrix":
+            super().__init__(h5file, X, genes, cells)
+        else:
+            CountMatrixReader.__init__(self, genes, cells)
+            self._file = h5file
+            self._X = X
+
+    @staticmethod
+    def _read_index(group):
+        """Read the obs/var index without loading any other column"""
+        if hasattr(group, "dtype") and group.dtype.names:
+            # Legacy AnnData stored obs/var as one compound dataset
+            return _decode(group["index"])
+        index_key = group.attrs.get("_index", "_index")
+        if isinstance(index_key, bytes):
+            index_key = index_key.decode()
+        return _decode(group[index_key][:])
+
+    @staticmethod
+    def _read_columns(group, index):
+        """Read obs/var metadata columns, decoding categorical groups"""
+        import h5py
+
+        frame = pd.DataFrame(index=pd.Index(index))
+        if hasattr(group, "dtype") and group.dtype.names:
+            for name in group.dtype.names:
+                if name != "index":
+                    frame[name] = group[name]
+            return frame
+
+        index_key = group.attrs.get("_index", "_index")
+        for name, item in group.items():
+            if name in (index_key, "__categories"):
+                continue
+            if isinstance(item, h5py.Group) and "codes" in item:
+                categories = _decode(item["categories"][:])
+                frame[name] = pd.Categorical.from_codes(item["codes"][:], categories=categories)
+            elif isinstance(item, h5py.Dataset) and item.shape == (len(index),):
+                values = item[:]
+                frame[name] = _decode(values) if values.dtype.kind in ("S", "O") else values
+        return frame
+
+    def obs(self):
+        return self._read_columns(self._obs_group, self.cells)
+
+    def var(self):
+        return self._read_columns(self._var_group, self.genes)
+
+    def _read_rows(self, start, stop):
+        if self._encoding == "csc_matrix" and self._scratch is None:
+            self._write_csr_scratch()
+        if self._encoding in ("csr_matrix", "csc_matrix"):
+            return super()._read_rows(start, stop)
+        return sp.csr_matrix(self._X[start:stop].astype(np.float32))
+
+    def _write_csr_scratch(self, max_entries=CSC_BLOCK_ENTRIES):
+        """
+        Convert the CSC ``X`` to CSR in memory-mapped scratch files.
+
+        The first pass over the file's column blocks counts the entries of
+        every cell; the second copies each block's entries to their cells'
+        places. Only one block is held in memory at a time.
+        """
+        n_cells, _ = self.shape
+        column_ptr = self._X["indptr"][:]
+        blocks = _column_blocks(column_ptr, max_entries)
+
+        counts = np.zeros(n_cells, dtype=np.int64)
+        for g0, g1 in blocks:
+            counts += np.bincount(self._X["indices"][int(column_ptr[g0]):int(column_ptr[g1])], minlength=n_cells)
+        row_ptr = np.concatenate(([0], np.cumsum(counts)))
+
+        self._scratch = tempfile.TemporaryDirectory(prefix="csc_as_csr_")
+        size = max(int(row_ptr[-1]), 1)
+        data = np.memmap(os.path.join(self._scratch.name, "data.bin"), dtype=np.float32, mode="w+", shape=size)
+        indices = np.memmap(os.path.join(self._scratch.name, "indices.bin"), dtype=np.int64, mode="w+", shape=size)
+        cursor = row_ptr[:-1].copy()
+        for g0, g1 in blocks:
+            lo, hi = int(column_ptr[g0]), int(column_ptr[g1])
+            block = sp.csc_matrix(
+                (self._X["data"][lo:hi].astype(np.float32), self._X["indices"][lo:hi], column_ptr[g0:g1 + 1] - lo),
+                shape=(n_cells, g1 - g0)
+            ).tocsr()
+            # Blocks go in gene order, so every cell's entries end up sorted by gene
+            per_row = np.diff(block.indptr)
+            rows = np.repeat(np.arange(n_cells), per_row)
+            destination = cursor[rows] + np.arange(block.nnz) - block.indptr[rows]
+            data[destination] = block.data
+            indices[destination] = block.indices + g0
+            cursor += per_row
+        data.flush()
+        indices.flush()
+        self._data, self._indices, self._indptr = data, indices, row_ptr
+
+    def close(self):
+        self._file.close()
+        if self._scratch is not None:
+            self._data = self._indices = None
+            self._scratch.cleanup()
+
+
+class TenxH5Reader(_CompressedRowsReader):
+    """
+    Backed reader for Cell Ranger ``filtered_feature_bc_matrix.h5`` files.
+
+    Cell Ranger stores genes x cells in CSC layout, which is the same on disk as
+    cells x genes in CSR, so cell slices map directly to ranges of the file.
+    Handles both the v3 ``/matrix`` layout and the v2 per-genome layout.
+    """
+
+    def __init__(self, source):
+        import h5py
+
+        h5file = h5py.File(source, "r")
+        if "matrix" in h5file:
+            group = h5file["matrix"]
+            features = group["features"]
+            genes = _decode(features["name"][:])
+            self._gene_ids = _decode(features["id"][:])
+            self._feature_types = _decode(features["feature_type"][:]) if "feature_type" in features else None
+        else:
+            # Cell Ranger v2 writes one group per reference genome
+            group = h5file[next(iter(h5file.keys()))]
+            genes = _decode(group["gene_names"][:])
+            self._gene_ids = _decode(group["genes"][:])
+            self._feature_types = None
+
+        cells = _decode(group["barcodes"][:])
+        super().__init__(h5file, group, genes, cells)
+
+    def var(self):
+        frame = pd.DataFrame({"gene_id": self._gene_ids}, index=pd.Index(self.genes, name="gene"))
+        if self._feature_types is not None:
+            frame["feature_type"] = self._feature_types
+        return frame
+
+
+def read_table(source, sep):
+    """Parse a CSV/TSV with one row per cell and gene names in the header"""
+    counts = pd.read_csv(source, sep=sep, index_col=0)
+    return InMemoryReader(counts.to_numpy(dtype=np.float32), counts.columns.tolist(), counts.index.astype(str).tolist())
+
+
+def read_mtx(source):
+    """Parse a Matrix Market file stored in the 10x genes x cells orientation"""
+    matrix = scipy.io.mmread(source).T.tocsr()
+    genes = [f"gene_{i}" for i in range(matrix.shape[1])]
+    cells = [f"cell_{i}" for i in range(matrix.shape[0])]
+    return InMemoryReader(matrix, genes, cells)
+
+
+def open_count_matrix(source, name=None):
+    """
+    Open a count file with the reader that matches its extension.
+
+    Parameters:
+    -----------
+    source : str or file-like
+        Path on disk or an uploaded file object
+    name : str, optional
+        File name used to pick the format when source is a file object
+
+    Returns:
+    --------
+    CountMatrixReader
+    """
+    name = name or getattr(source, "name", None) or str(source)
+    extension = os.path.splitext(name)[1].lstrip(".").lower()
+
+    if extension == "h5ad":
+        return H5adReader(source)
+    if extension == "h5":
+        return TenxH5Reader(source)
+    if extension == "mtx":
+        return read_mtx(source)
+    if extension in TABLE_EXTENSIONS:
+        return read_table(source, "\t" if extension == "tsv" else ",")
+    raise ValueError(f"Unsupported file type: .{extension}")
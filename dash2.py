@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+from prediction_client import sniff_table
 
 st.title("Osiris: HSC Fate + Lineage Bias Predictor")
 
@@ -12,7 +13,14 @@ uploaded_file = st.file_uploader("Upload your `.tsv` file here", type=["tsv"])
 backend_url = "http://localhost:8080/predict"
 
 if uploaded_file is not None:
-    if st.button("Run Prediction"):
+    # Reject malformed files from their first few KB instead of after a full upload
+    sniffed = sniff_table(uploaded_file.name, uploaded_file)
+    for warning in sniffed["warnings"]:
+        st.warning(warning)
+    for error in sniffed["errors"]:
+        st.error(error)
+
+    if st.button("Run Prediction", disabled=bool(sniffed["errors"])):
         try:
             # Send the file as multipart/form-data
             files = {"file": uploaded_file}
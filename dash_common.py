@@ -0,0 +1,511 @@
+"""
+Shared helpers for the dashboard pages.
+
+dash.py is the entrypoint and runs on every full rerun; the pages it navigates
+to (page_*.py) import what they need from here. Module-level code in this file
+runs once per server process rather than on every rerun.
+"""
+import os
+import uuid
+import logging
+import functools
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import streamlit_shadcn_ui as ui
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from experiment_store import ExperimentStore
+from experiment_catalog import ExperimentCatalog, PAGE_SIZE
+from experiment_summary import load_summary
+from frame_compaction import write_compact_timeseries
+from exporters import ExportServer
+from session_memory import ExperimentMemoryManager
+from metrics import MetricsServer, cache_result, touch_session
+from admission import AdmissionController
+from rerun_timings import timed_fragment
+
+# Pages that show one experiment, by the tab that switches to them
+EXPERIMENT_PAGES = {
+    "Overview": "page_overview.py",
+    "Protocol Recommendations": "page_recommendations.py"
+}
+
+# Helper functions for future AI model integration
+
+def generate_protocol_response(user_input, experiment_data):
+    """
+    Generate a response for the protocol recommendations chat based on user input and experiment data.
+    This is a simple keyword-based response system that will be replaced with a more sophisticated AI model in the future.
+    
+    Parameters:
+    -----------
+    user_input : str
+        The user's message
+    experiment_data : DataFrame
+        The current experiment data
+        
+    Returns:
+    --------
+    str
+        A response message
+    """
+    # Get the latest data point
+    latest_data = experiment_data.iloc[-1]
+    
+    # Convert user input to lowercase for easier matching
+    user_input_lower = user_input.lower()
+    
+    # Check for specific keywords and provide relevant responses
+    if any(word in user_input_lower for word in ["hello", "hi", "hey", "greetings"]):
+        return "Hello! How can I help with your HSC expansion protocol today?"
+    
+    elif any(word in user_input_lower for word in ["self-renewal", "self renewal", "renewal"]):
+        sr_score = latest_data["Self_Renewal_Score"]
+        if sr_score > 75:
+            return f"Your current self-renewal score is {sr_score:.1f}, which is excellent! I recommend maintaining your current cytokine concentrations, particularly SCF and TPO levels."
+        elif sr_score > 50:
+            return f"Your current self-renewal score is {sr_score:.1f}, which is good but could be improved. Consider increasing SCF by 10% and ensuring TPO is at 50ng/mL to enhance self-renewal capacity."
+        else:
+            return f"Your current self-renewal score is {sr_score:.1f}, which is below optimal levels. I recommend increasing both SCF and TPO by 20%, and reducing differentiation-inducing cytokines like GM-CSF if present in your media."
+    
+    elif any(word in user_input_lower for word in ["multipotency", "multipotent", "potency"]):
+        mp_score = latest_data["Multipotency_Score"]
+        if mp_score > 75:
+            return f"Your current multipotency score is {mp_score:.1f}, which indicates excellent maintenance of HSC potential! Your current cytokine balance is working well."
+        elif mp_score > 50:
+            return f"Your current multipotency score is {mp_score:.1f}, which is reasonable but could be improved. Consider adding IL-6 at low concentration (10ng/mL) to your media to enhance multipotency."
+        else:
+            return f"Your current multipotency score is {mp_score:.1f}, which suggests your HSCs may be losing multipotency. I recommend a complete media change with fresh cytokines, particularly ensuring a balance of SCF, TPO, and FLT3L to support multipotency."
+    
+    elif any(word in user_input_lower for word in ["myeloid", "granulocyte", "macrophage"]):
+        myeloid_pct = latest_data["Myeloid_Percentage"]
+        if myeloid_pct > 70:
+            return f"Your culture shows a strong myeloid bias ({myeloid_pct:.1f}%). To reduce this bias, consider decreasing G-CSF and GM-CSF if present, and slightly increasing FLT3L to promote lymphoid potential."
+        elif myeloid_pct < 30:
+            return f"Your culture shows low myeloid output ({myeloid_pct:.1f}%). To increase myeloid differentiation, consider adding GM-CSF at 10ng/mL or increasing IL-3 concentration."
+        else:
+            return f"Your myeloid percentage ({myeloid_pct:.1f}%) is within a balanced range. Current cytokine conditions appear appropriate for balanced lineage output."
+    
+    elif any(word in user_input_lower for word in ["lymphoid", "lymphocyte", "b cell", "t cell"]):
+        lymphoid_pct = latest_data["Lymphoid_Percentage"]
+        if lymphoid_pct > 70:
+            return f"Your culture shows a strong lymphoid bias ({lymphoid_pct:.1f}%). To balance lineage output, consider adding IL-3 at low concentration to promote myeloid differentiation."
+        elif lymphoid_pct < 30:
+            return f"Your culture shows low lymphoid output ({lymphoid_pct:.1f}%). To increase lymphoid differentiation, consider adding FLT3L and IL-7 to your media."
+        else:
+            return f"Your lymphoid percentage ({lymphoid_pct:.1f}%) is within a balanced range. Current conditions appear appropriate for balanced lineage output."
+    
+    elif any(word in user_input_lower for word in ["erythroid", "red", "erythrocyte", "rbc"]):
+        erythroid_pct = latest_data["Erythroid_Percentage"]
+        if erythroid_pct > 50:
+            return f"Your culture shows a strong erythroid bias ({erythroid_pct:.1f}%). To reduce erythroid differentiation, consider decreasing EPO concentration by 50% in your next media change."
+        elif erythroid_pct < 10:
+            return f"Your culture shows very low erythroid output ({erythroid_pct:.1f}%). If erythroid potential is desired, consider adding EPO at 3U/mL to your media."
+        else:
+            return f"Your erythroid percentage ({erythroid_pct:.1f}%) is within an acceptable range. Current conditions appear appropriate."
+    
+    elif any(word in user_input_lower for word in ["cytokine", "growth factor", "medium", "media"]):
+        return "For optimal HSC expansion, I recommend a base medium of StemSpan SFEM II with the following cytokines: SCF (100ng/mL), TPO (50ng/mL), FLT3L (100ng/mL), and IL-6 (20ng/mL). Adjust based on your specific goals: increase SCF and TPO for self-renewal, or add lineage-specific cytokines for directed differentiation."
+    
+    elif any(word in user_input_lower for word in ["protocol", "recommend", "suggestion", "advice"]):
+        sr_score = latest_data["Self_Renewal_Score"]
+        mp_score = latest_data["Multipotency_Score"]
+        myeloid_pct = latest_data["Myeloid_Percentage"]
+        lymphoid_pct = latest_data["Lymphoid_Percentage"]
+        erythroid_pct = latest_data["Erythroid_Percentage"]
+        
+        # Determine the main issue to address
+        if sr_score < 50:
+            return "Based on your current data, I recommend focusing on improving self-renewal capacity. Increase SCF to 150ng/mL and TPO to 100ng/mL. Ensure your cells are at optimal density (5-10 × 10^4 cells/mL) and perform a 50% media change every 2 days rather than complete media changes."
+        elif mp_score < 50:
+            return "Your data indicates declining multipotency. I recommend a complete media change with fresh cytokines: SCF (100ng/mL), TPO (50ng/mL), FLT3L (100ng/mL), and IL-6 (10ng/mL). Also, reduce culture density if currently above 2 × 10^5 cells/mL to minimize paracrine differentiation signals."
+        elif max(myeloid_pct, lymphoid_pct, erythroid_pct) > 70:
+            # Determine which lineage is dominant
+            dominant = "myeloid" if myeloid_pct > 70 else "lymphoid" if lymphoid_pct > 70 else "erythroid"
+            return f"Your culture shows a strong {dominant} bias. To rebalance, I recommend adjusting cytokines: {'reduce G-CSF and GM-CSF' if dominant == 'myeloid' else 'reduce IL-7 and FLT3L' if dominant == 'lymphoid' else 'reduce EPO by 50%'}. A partial media change with rebalanced cytokines should help restore multipotency."
+        else:
+            return "Your current protocol appears to be working well with balanced lineage output. Continue with your current cytokine regimen and schedule. For optimal results, ensure you're performing media changes every 2-3 days and maintaining cell density between 5-20 × 10^4 cells/mL."
+    
+    else:
+        return "I'm not sure I understand your question. Could you ask about specific aspects of your HSC protocol? I can provide recommendations on cytokines, media composition, self-renewal enhancement, or lineage balancing based on your current data."
+
+
+
+
+
+def get_protocol_recommendation(self_renewal_score, multipotency_score, lineage_bias, constraints=None):
+    """
+    Generate protocol recommendations based on scores and lineage bias.
+    This is a placeholder for future AI model integration.
+    """
+    recommendations = []
+    
+    # Self-renewal recommendations
+    if self_renewal_score < 40:
+        recommendations.append({
+            "type": "self-renewal",
+            "action": "Add 20 ng/mL SCF",
+            "rationale": "Boosts self-renewal capacity",
+            "evidence": "Based on 12 studies",
+            "confidence": 0.85
+        })
+        recommendations.append({
+            "type": "self-renewal",
+            "action": "Increase TPO to 50 ng/mL",
+            "rationale": "Enhances HSC maintenance",
+            "evidence": "Based on 8 studies",
+            "confidence": 0.78
+        })
+    
+    # Multipotency recommendations
+    if multipotency_score < 50:
+        recommendations.append({
+            "type": "multipotency",
+            "action": "Add 10 ng/mL FLT3L",
+            "rationale": "Promotes lymphoid differentiation potential",
+            "evidence": "Based on 15 studies",
+            "confidence": 0.82
+        })
+    
+    # Lineage bias adjustments
+    if "myeloid" in lineage_bias and lineage_bias["myeloid"] > 70:
+        recommendations.append({
+            "type": "lineage",
+            "action": "Reduce SCF by 20%",
+            "rationale": "Balances lymphoid potential",
+            "evidence": "Based on 7 studies",
+            "confidence": 0.75
+        })
+    elif "lymphoid" in lineage_bias and lineage_bias["lymphoid"] > 70:
+        recommendations.append({
+            "type": "lineage",
+            "action": "Add 5 ng/mL IL-3",
+            "rationale": "Enhances myeloid differentiation",
+            "evidence": "Based on 10 studies",
+            "confidence": 0.8
+        })
+    
+    # Apply constraints if provided
+    if constraints:
+        if "no_small_molecules" in constraints and constraints["no_small_molecules"]:
+            recommendations = [r for r in recommendations if "small molecule" not in r["action"].lower()]
+        if "budget" in constraints:
+            # Simple budget filter - would be more sophisticated in real implementation
+            if constraints["budget"] < 200:
+                recommendations = recommendations[:2]  # Limit to top 2 recommendations
+    
+    return recommendations
+
+def generate_sample_data(days=30):
+    """Generate sample data for demonstration purposes"""
+    dates = pd.date_range(end=pd.Timestamp.now(), periods=days)
+    
+    # Create base trends with some randomness
+    self_renewal_trend = np.linspace(40, 75, days) + np.random.normal(0, 5, days)
+    multipotency_trend = np.linspace(30, 65, days) + np.random.normal(0, 7, days)
+    
+    # Ensure values are within reasonable ranges
+    self_renewal_trend = np.clip(self_renewal_trend, 0, 100)
+    multipotency_trend = np.clip(multipotency_trend, 0, 100)
+    
+    # Create lineage markers with some correlation to the scores
+    myeloid_bias = 70 - (multipotency_trend - 30) * 0.5 + np.random.normal(0, 5, days)
+    lymphoid_bias = 30 + (multipotency_trend - 30) * 0.5 + np.random.normal(0, 5, days)
+    erythroid_bias = np.random.normal(15, 3, days)
+    
+    # Ensure percentages sum to 100
+    total = myeloid_bias + lymphoid_bias + erythroid_bias
+    myeloid_bias = (myeloid_bias / total) * 100
+    lymphoid_bias = (lymphoid_bias / total) * 100
+    erythroid_bias = (erythroid_bias / total) * 100
+    
+    # Protocol changes - simulate 3 protocol changes
+    protocol_changes = []
+    change_days = [7, 15, 22]
+    changes = [
+        {"day": 7, "change": "Added 10 ng/mL FLT3L", "target": "Increase lymphoid potential"},
+        {"day": 15, "change": "Reduced SCF by 15%", "target": "Balance lineage output"},
+        {"day": 22, "change": "Added 5 ng/mL IL-6", "target": "Boost proliferation"}
+    ]
+    
+    # Generate gene expression data for HSC-related genes
+    # Define a list of important HSC-related genes
+    hsc_genes = [
+        "CD34", "KIT", "GATA2", "RUNX1", "TAL1", "BMI1", "HOXA9", 
+        "MEIS1", "MECOM", "MYB", "GATA1", "PU.1", "CEBPA", "FLT3", "MPL"
+    ]
+    
+    # Generate expression values for each gene
+    # Some genes will have higher expression based on lineage bias
+    gene_expression = {}
+    
+    # Stem cell maintenance genes (correlated with self-renewal score)
+    gene_expression["CD34"] = (60 + self_renewal_trend * 0.3 + np.random.normal(0, 15, days)).astype(int)
+    gene_expression["KIT"] = (70 + self_renewal_trend * 0.25 + np.random.normal(0, 12, days)).astype(int)
+    gene_expression["BMI1"] = (50 + self_renewal_trend * 0.35 + np.random.normal(0, 10, days)).astype(int)
+    gene_expression["HOXA9"] = (45 + self_renewal_trend * 0.4 + np.random.normal(0, 8, days)).astype(int)
+    
+    # Myeloid lineage genes (correlated with myeloid bias)
+    gene_expression["PU.1"] = (30 + myeloid_bias * 0.7 + np.random.normal(0, 15, days)).astype(int)
+    gene_expression["CEBPA"] = (25 + myeloid_bias * 0.8 + np.random.normal(0, 10, days)).astype(int)
+    
+    # Lymphoid lineage genes (correlated with lymphoid bias)
+    gene_expression["FLT3"] = (20 + lymphoid_bias * 0.9 + np.random.normal(0, 12, days)).astype(int)
+    gene_expression["IL7R"] = (15 + lymphoid_bias * 0.8 + np.random.normal(0, 10, days)).astype(int)
+    
+    # Erythroid lineage genes (correlated with erythroid bias)
+    gene_expression["GATA1"] = (25 + erythroid_bias * 1.2 + np.random.normal(0, 15, days)).astype(int)
+    gene_expression["KLF1"] = (20 + erythroid_bias * 1.0 + np.random.normal(0, 12, days)).astype(int)
+    
+    # Multipotency-related genes (correlated with multipotency score)
+    gene_expression["GATA2"] = (40 + multipotency_trend * 0.5 + np.random.normal(0, 10, days)).astype(int)
+    gene_expression["RUNX1"] = (35 + multipotency_trend * 0.45 + np.random.normal(0, 8, days)).astype(int)
+    gene_expression["TAL1"] = (30 + multipotency_trend * 0.4 + np.random.normal(0, 12, days)).astype(int)
+    gene_expression["MYB"] = (45 + multipotency_trend * 0.3 + np.random.normal(0, 15, days)).astype(int)
+    gene_expression["MECOM"] = (25 + multipotency_trend * 0.35 + np.random.normal(0, 10, days)).astype(int)
+    
+    # Ensure all gene expression values are positive
+    for gene in gene_expression:
+        gene_expression[gene] = np.clip(gene_expression[gene], 0, None)
+    
+    # Create the dataframe
+    data = {
+        "Date": dates,
+        "Self_Renewal_Score": self_renewal_trend,
+        "Multipotency_Score": multipotency_trend,
+        "Myeloid_Percentage": myeloid_bias,
+        "Lymphoid_Percentage": lymphoid_bias,
+        "Erythroid_Percentage": erythroid_bias,
+        "CD34_Expression": 60 + np.random.normal(0, 10, days),
+        "Proliferation_Rate": 50 + np.random.normal(0, 15, days)
+    }
+    
+    # Add gene expression data to the dataframe
+    for gene, values in gene_expression.items():
+        data[f"Gene_{gene}"] = values
+    
+    df = pd.DataFrame(data)
+    
+    # Add protocol change markers
+    df["Protocol_Change"] = False
+    for change in changes:
+        df.loc[change["day"], "Protocol_Change"] = True
+        df.loc[change["day"], "Change_Description"] = change["change"]
+        df.loc[change["day"], "Change_Target"] = change["target"]
+    
+    return df, changes
+
+_cache_calls = threading.local()
+
+def counted_cache_data(cache, **kwargs):
+    """st.cache_data that also counts hits and misses of ``cache`` on the metrics endpoint"""
+    def decorator(func):
+        @functools.wraps(func)
+        def compute(*args, **kw):
+            # Only runs when Streamlit had no cached value
+            _cache_calls.missed = True
+            return func(*args, **kw)
+
+        cached = st.cache_data(**kwargs)(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kw):
+            _cache_calls.missed = False
+            result = cached(*args, **kw)
+            cache_result(cache, not _cache_calls.missed)
+            return result
+
+        wrapper.clear = cached.clear
+        return wrapper
+    return decorator
+
+def format_band(row, column):
+    """Confidence interval text for a metric tile, or an empty string without bands"""
+    if f"{column}_Low" not in row or pd.isna(row[f"{column}_Low"]):
+        return ""
+    return f"<br>95% CI {row[f'{column}_Low']:.1f}–{row[f'{column}_High']:.1f}"
+
+@st.cache_resource
+def get_experiment_store():
+    """Shared on-disk experiment store, opened once per server process"""
+    return ExperimentStore()
+
+@st.cache_resource
+def get_experiment_catalog():
+    """Catalog of the experiments in the shared store, opened once per server process"""
+    return ExperimentCatalog.for_store(get_experiment_store())
+
+@st.cache_resource
+def get_export_server():
+    """Side-port server that streams experiment exports, started once per server process"""
+    return ExportServer(get_experiment_store())
+
+@st.cache_resource
+def get_metrics_server():
+    """Side-port Prometheus endpoint, started once per server process (None if its port is taken)"""
+    try:
+        return MetricsServer()
+    except OSError as e:
+        logging.getLogger(__name__).warning("Metrics endpoint disabled: %s", e)
+        return None
+
+def track_session():
+    """
+    Start the metrics endpoint if needed and count the current session as active.
+
+    Called at the top of every run: the current experiment is restored if it
+    was spilled, least recently viewed ones are spilled while the session is
+    over its memory budget, and the session's totals are published for the
+    admin view and the session state gauge.
+    """
+    get_metrics_server()
+    ctx = get_script_run_ctx()
+    touch_session(ctx.session_id if ctx is not None else "local")
+
+    memory_manager = get_memory_manager()
+    current = st.session_state.get("current_experiment")
+    if current is not None:
+        memory_manager.touch(current)
+    memory_manager.enforce_budget(
+        [exp["id"] for exp in st.session_state.get("experiments", [])],
+        keep=current
+    )
+
+@st.cache_resource
+def get_admission_controller():
+    """Limits and fair queue for prediction submissions, shared by every session of the server process"""
+    return AdmissionController()
+
+def current_user():
+    """Who a submission belongs to: the signed-in email, or one id per browser session without sign-in"""
+    if st.user.get("is_logged_in"):
+        return st.user.get("email")
+    if "anonymous_user" not in st.session_state:
+        st.session_state.anonymous_user = uuid.uuid4().hex[:12]
+    return st.session_state.anonymous_user
+
+def get_memory_manager():
+    """Memory manager for the current session's experiment state"""
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx is not None else "local"
+    return ExperimentMemoryManager(
+        st.session_state,
+        session_id,
+        spill_dir=os.path.join(get_experiment_store().root, "session_spill")
+    )
+
+def render_export_links(experiment_id, datasets):
+    """Show signed CSV and Parquet download links for the given (dataset, label) pairs"""
+    export_server = get_export_server()
+    # Links point at the host this browser reached the dashboard at
+    browser_host = st.context.headers.get("Host")
+    for dataset, label in datasets:
+        link_cols = st.columns([2, 1, 1])
+        with link_cols[0]:
+            st.markdown(f"**{label}**")
+        with link_cols[1]:
+            st.link_button("CSV", export_server.url(experiment_id, dataset, "csv", browser_host), use_container_width=True)
+        with link_cols[2]:
+            st.link_button("Parquet", export_server.url(experiment_id, dataset, "parquet", browser_host), use_container_width=True)
+
+def selected_experiment():
+    """The experiment picked in the sidebar, looked up by id in the catalog, or None"""
+    return get_experiment_catalog().get(st.session_state.current_experiment)
+
+def open_experiment(experiment):
+    """Make an experiment current and keep it among the ones this session has opened"""
+    if not any(exp["id"] == experiment["id"] for exp in st.session_state.experiments):
+        st.session_state.experiments.append(experiment)
+    st.session_state.current_experiment = experiment["id"]
+
+def _turn_catalog_page(key, step):
+    st.session_state[key] = st.session_state.get(key, 0) + step
+
+@timed_fragment("Experiment Catalog")
+def render_experiment_catalog(app, on_open):
+    """
+    Searchable list of an app's experiments for the sidebar, one page at a time.
+
+    Only the buttons of the page in view are created, so a rerun costs the same
+    with ten experiments or ten thousand, and searching or paging reruns only
+    this fragment. ``on_open`` is called with the experiment picked, after it
+    was made current.
+    """
+    query = st.text_input(
+        "Search experiments", placeholder="Search by name, date or tag",
+        key=f"catalog_query_{app}", label_visibility="collapsed"
+    )
+    page_key = f"catalog_page_{app}"
+    # A new search starts again from the first page
+    if st.session_state.get(f"{page_key}_query") != query:
+        st.session_state[f"{page_key}_query"] = query
+        st.session_state[page_key] = 0
+    page = st.session_state.get(page_key, 0)
+
+    experiments, total = get_experiment_catalog().search(app, query, page * PAGE_SIZE, PAGE_SIZE)
+    if not total:
+        st.caption("No experiments match your search." if query.strip() else "No experiments yet.")
+        return
+    for experiment in experiments:
+        label = f"📊 {experiment['name']}"
+        help_text = " · ".join(part for part in (experiment["created_at"], experiment["tags"]) if part)
+        if st.button(label, use_container_width=True, key=f"experiment_{experiment['id']}", help=help_text):
+            open_experiment(experiment)
+            on_open(experiment)
+
+    n_pages = -(-total // PAGE_SIZE)
+    if n_pages > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("‹", key=f"{page_key}_previous", disabled=page == 0, on_click=_turn_catalog_page, args=(page_key, -1))
+        with col2:
+            st.caption(f"Page {page + 1} of {n_pages} · {total:,} experiments")
+        with col3:
+            st.button("›", key=f"{page_key}_next", disabled=page + 1 >= n_pages, on_click=_turn_catalog_page, args=(page_key, 1))
+
+def load_experiment_data(selected_exp):
+    """
+    Load the precomputed summary shown on the experiment pages.
+
+    Uploaded cells drive the charts through a per-timepoint pseudobulk; otherwise the
+    demo time series generated when the experiment was created is used. Either way
+    the pages only read the summary built when the data was stored.
+
+    Returns:
+    --------
+    ExperimentSummary
+        Metric tiles, trends, top genes, lineage composition and protocol changes of the experiment
+    """
+    # Load or generate data for this experiment (track_session restored it if it was spilled)
+    store = get_experiment_store()
+    if not store.has_timeseries(selected_exp['id']):
+        write_compact_timeseries(store, selected_exp['id'], generate_sample_data()[0])
+    
+    # Rebuilt here only if its inputs changed since ingestion
+    summary = load_summary(store, selected_exp['id'], selected_exp.get('created_at'))
+    return summary
+
+def render_experiment_tabs(experiment_id, current):
+    """Shadcn tabs that switch between the experiment pages"""
+    key = f"main_tabs_{experiment_id}_{current}"
+    selected_tab = ui.tabs(
+        options=list(EXPERIMENT_PAGES),
+        default_value=current,
+        key=key
+    )
+    if selected_tab and selected_tab != current:
+        # Forget the click so coming back to this page starts on its own tab
+        del st.session_state[key]
+        st.switch_page(EXPERIMENT_PAGES[selected_tab])
+
+def render_no_experiment():
+    """Default dashboard message when no experiment is selected"""
+    st.title("HSC Dashboard")
+    st.markdown("### Welcome to the HSC Dashboard")
+    st.markdown("Create a new experiment or select an existing one from the sidebar to get started.")
+    
+    # Show a call to action
+    st.info("👈 Click on '➕ New Experiment' in the sidebar to create your first experiment.")
@@ -0,0 +1,153 @@
+"""
+Persistent catalog of the experiments listed in the dashboards' sidebars.
+
+Experiments are registered in a SQLite database next to the experiment store,
+so they are listed across sessions and server restarts instead of living in
+one session's state. Lookups by id go through the primary key, searches
+through an FTS5 index over id, name, creation date and tags, and listings are
+read one page at a time, so the sidebar's cost does not grow with the catalog.
+"""
+import os
+import re
+import sqlite3
+import datetime
+import threading
+
+CATALOG_FILENAME = "catalog.sqlite"
+
+# Experiments listed per sidebar page
+PAGE_SIZE = 20
+
+COLUMNS = ["id", "app", "name", "created_at", "owner", "tags"]
+
+
+def _search_expression(query):
+    """FTS5 expression matching every word of a free-text query as a prefix"""
+    words = re.findall(r"\w+", query.lower())
+    return " AND ".join(f'"{word}"*' for word in words)
+
+
+def _format_tags(tags):
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return ", ".join(dict.fromkeys(tag.strip() for tag in tags or () if tag.strip()))
+
+
+class ExperimentCatalog:
+    """
+    Experiment index backed by SQLite, shared by every session and the ingestion service.
+
+    Each experiment belongs to an ``app`` (the dashboard that created it), so
+    both dashboards can keep one catalog without listing each other's
+    experiments.
+
+    Parameters:
+    -----------
+    path : str
+        Database file, normally CATALOG_FILENAME in the store's root
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS experiments (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                app TEXT NOT NULL,
+                name TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                owner TEXT,
+                tags TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS experiments_by_app ON experiments (app, created_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS experiments_search USING fts5(
+                id, name, created_at, tags, content='experiments', content_rowid='seq'
+            );
+            CREATE TRIGGER IF NOT EXISTS experiments_insert AFTER INSERT ON experiments BEGIN
+                INSERT INTO experiments_search (rowid, id, name, created_at, tags)
+                VALUES (new.seq, new.id, new.name, new.created_at, new.tags);
+            END;
+            CREATE TRIGGER IF NOT EXISTS experiments_delete AFTER DELETE ON experiments BEGIN
+                INSERT INTO experiments_search (experiments_search, rowid, id, name, created_at, tags)
+                VALUES ('delete', old.seq, old.id, old.name, old.created_at, old.tags);
+            END;
+            CREATE TRIGGER IF NOT EXISTS experiments_update AFTER UPDATE ON experiments BEGIN
+                INSERT INTO experiments_search (experiments_search, rowid, id, name, created_at, tags)
+                VALUES ('delete', old.seq, old.id, old.name, old.created_at, old.tags);
+                INSERT INTO experiments_search (rowid, id, name, created_at, tags)
+                VALUES (new.seq, new.id, new.name, new.created_at, new.tags);
+            END;
+        """)
+
+    @classmethod
+    def for_store(cls, store):
+        """The catalog kept in an experiment store's root directory"""
+        return cls(os.path.join(store.root, CATALOG_FILENAME))
+
+    def add(self, experiment_id, app, name, created_at=None, owner=None, tags=(), replace=True):
+        """
+        Register an experiment, or update its entry.
+
+        With ``replace=False`` an experiment that is already registered is
+        left as it is. Returns whether the entry was written.
+        """
+        created_at = created_at or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        values = (str(experiment_id), app, name, created_at, owner, _format_tags(tags))
+        with self._lock:
+            if replace:
+                cursor = self._conn.execute(
+                    "INSERT INTO experiments (id, app, name, created_at, owner, tags) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET app = excluded.app, name = excluded.name, "
+                    "created_at = excluded.created_at, owner = excluded.owner, tags = excluded.tags",
+                    values
+                )
+            else:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO experiments (id, app, name, created_at, owner, tags) VALUES (?, ?, ?, ?, ?, ?)",
+                    values
+                )
+            return cursor.rowcount == 1
+
+    def set_tags(self, experiment_id, tags):
+        with self._lock:
+            self._conn.execute("UPDATE experiments SET tags = ? WHERE id = ?", (_format_tags(tags), str(experiment_id)))
+
+    def get(self, experiment_id):
+        """The experiment with this id as a dict, or None"""
+        if experiment_id is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM experiments WHERE id = ?", (str(experiment_id),)
+            ).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def search(self, app, query="", offset=0, limit=PAGE_SIZE):
+        """
+        One page of an app's experiments, newest first.
+
+        ``query`` matches words (or their beginnings) of the id, name,
+        creation date or tags; every word has to match.
+
+        Returns:
+        --------
+        tuple
+            (list of experiment dicts, number of experiments matching in total)
+        """
+        expression = _search_expression(query)
+        where, params = "app = ?", (app,)
+        if expression:
+            # Matched once as a set of rows; a join would have SQLite run the match for every experiment
+            where += " AND seq IN (SELECT rowid FROM experiments_search WHERE experiments_search MATCH ?)"
+            params += (expression,)
+        with self._lock:
+            total = self._conn.execute(f"SELECT count(*) FROM experiments WHERE {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM experiments WHERE {where} "
+                "ORDER BY created_at DESC, seq DESC LIMIT ? OFFSET ?",
+                params + (limit, offset)
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows], total
@@ -0,0 +1,480 @@
+import os
+import json
+import fcntl
+import hashlib
+import tempfile
+import threading
+import contextlib
+import numpy as np
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import scipy.sparse as sp
+
+# Root directory of the on-disk experiment store (override with OSIRIS_STORE_DIR)
+DEFAULT_STORE_DIR = os.environ.get(
+    "OSIRIS_STORE_DIR",
+    os.path.join(os.path.expanduser("~"), ".osiris", "store")
+)
+
+# Experiments whose lock the current thread already holds, with their nesting depth
+_held_locks = threading.local()
+
+
+class ExperimentStore:
+    """
+    Persistent columnar store for experiment time series and per-cell matrices.
+
+    Every experiment gets its own directory of uncompressed Arrow IPC files. Files
+    are opened through memory maps, so opening an experiment costs the same no
+    matter how large it is, and every session reading the same experiment shares
+    the operating system's page cache instead of holding a private copy.
+
+    Layout::
+
+        <root>/<experiment_id>/timeseries.arrow
+        <root>/<experiment_id>/matrices/<name>.arrow          (CSR data + indices)
+        <root>/<experiment_id>/matrices/<name>.indptr.arrow   (CSR row pointers)
+        <root>/<experiment_id>/matrices/<name>.genes.arrow
+        <root>/<experiment_id>/matrices/<name>.cells.arrow   (cell names + kept obs columns)
+        <root>/<experiment_id>/frames/<name>.arrow            (derived tables)
+        <root>/<experiment_id>/predictions/<sample>.arrow     (one row per model, cell and class)
+        <root>/<experiment_id>/predictions/<sample>.json      (the sample's QC and calls)
+        <root>/<experiment_id>/meta.json
+    """
+
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Paths and metadata
+    # ------------------------------------------------------------------
+
+    def experiment_dir(self, experiment_id):
+        return os.path.join(self.root, str(experiment_id))
+
+    def _matrix_path(self, experiment_id, name, part=None):
+        filename = f"{name}.arrow" if part is None else f"{name}.{part}.arrow"
+        return os.path.join(self.experiment_dir(experiment_id), "matrices", filename)
+
+    def _timeseries_path(self, experiment_id):
+        return os.path.join(self.experiment_dir(experiment_id), "timeseries.arrow")
+
+    def list_experiments(self):
+        """Return the ids of all experiments that have data in the store"""
+        return sorted(
+            entry for entry in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, entry))
+        )
+
+    def has_timeseries(self, experiment_id):
+        return os.path.exists(self._timeseries_path(experiment_id))
+
+    def has_matrix(self, experiment_id, name="counts"):
+        return os.path.exists(self._matrix_path(experiment_id, name))
+
+    def list_matrices(self, experiment_id):
+        """Return the names of all complete matrices stored for an experiment"""
+        matrix_dir = os.path.join(self.experiment_dir(experiment_id), "matrices")
+        if not os.path.isdir(matrix_dir):
+            return []
+        # The cell names are written last, so their presence marks a finished matrix
+        return sorted(
+            filename[:-len(".cells.arrow")] for filename in os.listdir(matrix_dir)
+            if filename.endswith(".cells.arrow")
+        )
+
+    def read_meta(self, experiment_id):
+        path = os.path.join(self.experiment_dir(experiment_id), "meta.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    @contextlib.contextmanager
+    def experiment_lock(self, experiment_id):
+        """
+        Hold an experiment's write lock for read-modify-write updates.
+
+        The lock is a ``flock`` on the experiment's ``.lock`` file, so it is
+        shared by every session thread and by the ingestion service running in
+        its own process. A thread that already holds the lock can take it again.
+        """
+        depths = _held_locks.__dict__.setdefault("depths", {})
+        key = (os.path.abspath(self.root), str(experiment_id))
+        if depths.get(key):
+            depths[key] += 1
+            try:
+                yield
+            finally:
+                depths[key] -= 1
+            return
+        path = os.path.join(self.experiment_dir(experiment_id), ".lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            depths[key] = 1
+            try:
+                yield
+            finally:
+                depths[key] = 0
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def write_meta(self, experiment_id, **values):
+        """Merge values into the experiment's meta.json"""
+        path = os.path.join(self.experiment_dir(experiment_id), "meta.json")
+        with self.experiment_lock(experiment_id):
+            meta = self.read_meta(experiment_id)
+            meta.update(values)
+            with self._atomic_path(path) as tmp_path:
+                with open(tmp_path, "w") as f:
+                    json.dump(meta, f, default=str)
+
+    def _predictions_path(self, experiment_id, sample, extension):
+        return os.path.join(self.experiment_dir(experiment_id), "predictions", f"{sample}.{extension}")
+
+    def write_predictions(self, experiment_id, sample, payload, rows=None):
+        """
+        Publish the prediction results for one sample atomically.
+
+        ``payload`` is the sample's small summary (QC, calls) and is kept as
+        JSON; ``rows``, a DataFrame with one row per model, cell and class, goes
+        to an Arrow file next to it. The rows are written first, so a sample is
+        only listed once both exist.
+        """
+        if rows is not None:
+            self._write_table(self._predictions_path(experiment_id, sample, "arrow"), pa.Table.from_pandas(rows, preserve_index=False))
+        with self._atomic_path(self._predictions_path(experiment_id, sample, "json")) as tmp_path:
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f, default=str)
+
+    def iter_predictions(self, experiment_id):
+        """Yield the summaries of an experiment's finished prediction results one sample at a time"""
+        prediction_dir = os.path.join(self.experiment_dir(experiment_id), "predictions")
+        if not os.path.isdir(prediction_dir):
+            return
+        for filename in sorted(os.listdir(prediction_dir)):
+            if filename.endswith(".json"):
+                with open(os.path.join(prediction_dir, filename)) as f:
+                    yield json.load(f)
+
+    def read_predictions(self, experiment_id):
+        """Return the summaries of the finished prediction results of every sample in an experiment"""
+        return list(self.iter_predictions(experiment_id))
+
+    def open_predictions(self, experiment_id, sample, columns=None):
+        """Return the memory-mapped prediction rows of one sample, or None when it has none"""
+        path = self._predictions_path(experiment_id, sample, "arrow")
+        if not os.path.exists(path):
+            return None
+        return self._open_table(path, columns)
+
+    def append_chat_message(self, experiment_id, role, content, timestamp):
+        """Append one protocol assistant message to the experiment's conversation log"""
+        path = os.path.join(self.experiment_dir(experiment_id), "chat.jsonl")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a") as f:
+            f.write(json.dumps({"timestamp": timestamp, "role": role, "content": content}) + "\n")
+
+    def iter_chat_log(self, experiment_id):
+        """Yield the experiment's logged conversation one message at a time"""
+        path = os.path.join(self.experiment_dir(experiment_id), "chat.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def experiment_version(self, experiment_id):
+        """
+        Cheap version token for an experiment's stored data.
+
+        Changes whenever any file of the experiment is rewritten, so it can be used
+        as a cache key for results derived from the stored data.
+        """
+        parts = []
+        for dirpath, _, filenames in os.walk(self.experiment_dir(experiment_id)):
+            for filename in sorted(filenames):
+                if not filename.endswith(".arrow"):
+                    continue
+                stat = os.stat(os.path.join(dirpath, filename))
+                parts.append(f"{filename}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.sha1("|".join(sorted(parts)).encode()).hexdigest()[:16]
+
+    def timeseries_version(self, experiment_id):
+        """Version token of an experiment's stored time series, or None without one"""
+        path = self._timeseries_path(experiment_id)
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def matrix_version(self, experiment_id, name="counts"):
+        """Version token of one stored matrix, for results derived from it alone"""
+        parts = []
+        for part in (None, "cells"):
+            stat = os.stat(self._matrix_path(experiment_id, name, part))
+            parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+        return "|".join(parts)
+
+    def cell_data_version(self, experiment_id):
+        """
+        Version token of an experiment's per-cell inputs (matrices and predictions).
+
+        Unlike experiment_version it ignores derived files, so results computed
+        from the cells can be cached in the store under this token.
+        """
+        parts = []
+        for subdir in ("matrices", "predictions"):
+            path = os.path.join(self.experiment_dir(experiment_id), subdir)
+            if not os.path.isdir(path):
+                continue
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith((".arrow", ".json")):
+                    stat = os.stat(os.path.join(path, filename))
+                    parts.append(f"{subdir}/{filename}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+    # ------------------------------------------------------------------
+    # Arrow IPC helpers
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _atomic_path(path):
+        """
+        Yield a temporary file next to ``path`` that replaces it once written.
+
+        Every writer gets its own temporary file, so concurrent writers of the
+        same path never remove each other's files; the last one to finish wins.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        os.close(fd)
+        # mkstemp creates the file private to its owner; published files stay readable
+        os.chmod(tmp_path, 0o644)
+        try:
+            yield tmp_path
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def _write_table(cls, path, table):
+        """Write a table atomically so readers never see a half-written file"""
+        with cls._atomic_path(path) as tmp_path:
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+    @staticmethod
+    def _column_array(table, column):
+        """Expose a column as numpy, without copying when it is a single null-free chunk"""
+        chunked = table[column]
+        if chunked.num_chunks == 1:
+            return chunked.chunk(0).to_numpy(zero_copy_only=False)
+        return chunked.to_numpy()
+
+    @staticmethod
+    def _open_table(path, columns=None):
+        """Open an Arrow IPC file through a memory map without reading it into RAM"""
+        source = pa.memory_map(path, "r")
+        table = ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table
+
+    # ------------------------------------------------------------------
+    # Time series
+    # ------------------------------------------------------------------
+
+    def write_timeseries(self, experiment_id, df):
+        """Persist an experiment's per-timepoint DataFrame"""
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        self._write_table(self._timeseries_path(experiment_id), table)
+
+    def open_timeseries(self, experiment_id, columns=None):
+        """Return the memory-mapped Arrow table for an experiment's time series"""
+        return self._open_table(self._timeseries_path(experiment_id), columns)
+
+    def read_timeseries(self, experiment_id, columns=None):
+        """
+        Load an experiment's time series as a DataFrame.
+
+        Numeric columns without nulls are exposed directly from the memory map
+        rather than copied into the session.
+        """
+        table = self.open_timeseries(experiment_id, columns)
+        return table.to_pandas(split_blocks=True, zero_copy_only=False)
+
+    # ------------------------------------------------------------------
+    # Derived tables
+    # ------------------------------------------------------------------
+
+    def _frame_path(self, experiment_id, name):
+        return os.path.join(self.experiment_dir(experiment_id), "frames", f"{name}.arrow")
+
+    def has_frame(self, experiment_id, name):
+        return os.path.exists(self._frame_path(experiment_id, name))
+
+    def write_frame(self, experiment_id, name, df):
+        """Persist a DataFrame derived from the experiment's data (aggregates, caches)"""
+        self._write_table(self._frame_path(experiment_id, name), pa.Table.from_pandas(df, preserve_index=False))
+
+    def read_frame(self, experiment_id, name, columns=None):
+        """Load a derived DataFrame through a memory map"""
+        table = self._open_table(self._frame_path(experiment_id, name), columns)
+        return table.to_pandas(split_blocks=True, zero_copy_only=False)
+
+    # ------------------------------------------------------------------
+    # Per-cell matrices
+    # ------------------------------------------------------------------
+
+    def write_matrix(self, experiment_id, matrix, genes, cells, name="counts"):
+        """
+        Persist a cells x genes matrix in CSR layout.
+
+        Parameters:
+        -----------
+        experiment_id : str
+            Experiment the matrix belongs to
+        matrix : scipy.sparse matrix or ndarray
+            Counts with one row per cell and one column per gene
+        genes : list
+            Gene names, one per column
+        cells : list
+            Cell barcodes or sample ids, one per row
+        name : str
+            Matrix name within the experiment
+        """
+        matrix = sp.csr_matrix(matrix)
+        matrix.sort_indices()
+
+        self._write_table(
+            self._matrix_path(experiment_id, name),
+            pa.table({
+                "indices": pa.array(matrix.indices.astype(np.int32)),
+                "data": pa.array(matrix.data.astype(np.float32))
+            })
+        )
+        self._write_table(
+            self._matrix_path(experiment_id, name, "indptr"),
+            pa.table({"indptr": pa.array(matrix.indptr.astype(np.int64))})
+        )
+        self._write_table(
+            self._matrix_path(experiment_id, name, "genes"),
+            pa.table({"gene": pa.array([str(g) for g in genes])})
+        )
+        self._write_table(
+            self._matrix_path(experiment_id, name, "cells"),
+            pa.table({"cell": pa.array([str(c) for c in cells])})
+        )
+
+    def write_matrix_blocks(self, experiment_id, reader, name="counts", block_size=10000, obs_columns=()):
+        """
+        Persist a matrix from a CountMatrixReader one block of cells at a time.
+
+        Blocks are appended to scratch files on disk and then written out as a
+        single Arrow array per column, so memory use stays bounded by the block
+        size while the stored file can still be memory-mapped without copies.
+        Any of ``obs_columns`` found in the reader's cell metadata are stored
+        next to the cell names.
+        """
+        matrix_dir = os.path.dirname(self._matrix_path(experiment_id, name))
+        os.makedirs(matrix_dir, exist_ok=True)
+
+        indptr = [0]
+        with tempfile.TemporaryDirectory(dir=matrix_dir) as scratch:
+            indices_path = os.path.join(scratch, "indices.bin")
+            data_path = os.path.join(scratch, "data.bin")
+            with open(indices_path, "wb") as indices_out, open(data_path, "wb") as data_out:
+                for _, block in reader.iter_cell_blocks(block_size):
+                    block = sp.csr_matrix(block)
+                    block.sort_indices()
+                    indices_out.write(block.indices.astype(np.int32).tobytes())
+                    data_out.write(block.data.astype(np.float32).tobytes())
+                    indptr.extend((block.indptr[1:] + indptr[-1]).tolist())
+
+            nnz = indptr[-1]
+            if nnz:
+                indices = np.memmap(indices_path, dtype=np.int32, mode="r", shape=(nnz,))
+                data = np.memmap(data_path, dtype=np.float32, mode="r", shape=(nnz,))
+            else:
+                indices = np.zeros(0, dtype=np.int32)
+                data = np.zeros(0, dtype=np.float32)
+
+            self._write_table(
+                self._matrix_path(experiment_id, name),
+                pa.table({"indices": pa.array(indices), "data": pa.array(data)})
+            )
+            del indices, data
+
+        self._write_table(
+            self._matrix_path(experiment_id, name, "indptr"),
+            pa.table({"indptr": pa.array(np.asarray(indptr, dtype=np.int64))})
+        )
+        self._write_table(
+            self._matrix_path(experiment_id, name, "genes"),
+            pa.table({"gene": pa.array([str(g) for g in reader.genes])})
+        )
+        cells = {"cell": pa.array([str(c) for c in reader.cells])}
+        if obs_columns:
+            obs = reader.obs()
+            for column in obs_columns:
+                if column in obs.columns:
+                    cells[column] = pa.array(obs[column].astype(str).to_numpy())
+        self._write_table(self._matrix_path(experiment_id, name, "cells"), pa.table(cells))
+
+    def read_matrix_obs(self, experiment_id, name="counts"):
+        """Return the stored cell names and metadata columns of a matrix as a DataFrame"""
+        return self._open_table(self._matrix_path(experiment_id, name, "cells")).to_pandas()
+
+    def read_matrix_names(self, experiment_id, name="counts"):
+        """Return the (genes, cells) labels of a stored matrix"""
+        genes = self._open_table(self._matrix_path(experiment_id, name, "genes"))["gene"].to_pylist()
+        cells = self._open_table(self._matrix_path(experiment_id, name, "cells"))["cell"].to_pylist()
+        return genes, cells
+
+    def read_matrix(self, experiment_id, name="counts", cells=None):
+        """
+        Open a stored matrix as a scipy CSR matrix backed by the memory map.
+
+        Parameters:
+        -----------
+        experiment_id : str
+            Experiment the matrix belongs to
+        name : str
+            Matrix name within the experiment
+        cells : slice or array of int, optional
+            Rows to return. Contiguous slices are served without copying.
+
+        Returns:
+        --------
+        scipy.sparse.csr_matrix
+        """
+        values = self._open_table(self._matrix_path(experiment_id, name))
+        indptr = self._open_table(self._matrix_path(experiment_id, name, "indptr"))
+        genes = self._open_table(self._matrix_path(experiment_id, name, "genes"))
+
+        # Arrow buffers of fixed-width types without nulls convert to numpy without copying
+        indptr = self._column_array(indptr, "indptr")
+        indices = self._column_array(values, "indices")
+        data = self._column_array(values, "data")
+        shape = (len(indptr) - 1, genes.num_rows)
+
+        if isinstance(cells, slice):
+            start, stop, step = cells.indices(shape[0])
+            if step == 1:
+                lo, hi = indptr[start], indptr[stop]
+                return sp.csr_matrix(
+                    (data[lo:hi], indices[lo:hi], indptr[start:stop + 1] - lo),
+                    shape=(stop - start, shape[1]),
+                    copy=False
+                )
+
+        matrix = sp.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+        if cells is not None:
+            matrix = matrix[cells]
+        return matrix
@@ -0,0 +1,283 @@
+"""
+Precomputed per-experiment summary read by the dashboard pages.
+
+Everything the experiment pages draw from an experiment's time series (metric
+tiles, score trends with their confidence bands, the most expressed genes,
+lineage composition and the protocol changes) is derived once, when data is
+ingested, and stored next to the data as a few small Arrow frames. Page runs
+read those frames instead of rebuilding the pseudobulk, melting scores and
+ranking genes on every rerun.
+
+A summary is stamped with a version of its inputs: the time series, the
+per-cell data, the protocol changes and the summary format.
+`load_summary` rebuilds it whenever that version no longer matches, so a
+summary never has to be invalidated by hand.
+"""
+import json
+import hashlib
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from protocol_events import ProtocolEventIndex
+from cell_analysis import PSEUDOBULK_FORMAT, load_pseudobulk, mark_protocol_changes, score_pseudobulk, bootstrap_timepoints, confidence_bands
+from metrics import cache_result
+from frame_compaction import compact_frame, frame_bytes, record_frame_bytes
+
+# Bump when the summary frames change shape so stored summaries are rebuilt
+SUMMARY_FORMAT = 2
+
+# Frames of a stored summary, saved as frames/summary_<name>.arrow
+SUMMARY_FRAMES = ("tiles", "trend", "genes", "lineage", "changes")
+
+# Most expressed genes kept per timepoint
+TOP_GENES = 10
+
+# Timepoints kept in the trend and lineage views; longer cultures are thinned evenly
+MAX_TREND_POINTS = 1000
+
+# Columns that get bootstrap confidence bands, and the score chart series they belong to
+BAND_COLUMNS = [
+    "Self_Renewal_Score", "Multipotency_Score",
+    "Myeloid_Percentage", "Lymphoid_Percentage", "Erythroid_Percentage"
+]
+SCORE_SERIES = {"Self-Renewal": "Self_Renewal_Score", "Multipotency": "Multipotency_Score"}
+LINEAGE_COLUMNS = ["Myeloid_Percentage", "Lymphoid_Percentage", "Erythroid_Percentage"]
+
+# Per-timepoint marker columns that are kept as the protocol change list instead of tiles
+CHANGE_COLUMNS = ("Protocol_Change", "Change_Description", "Change_Target")
+
+
+def source_version(store, experiment_id):
+    """Version token of everything a summary is built from"""
+    meta = store.read_meta(experiment_id)
+    parts = [
+        SUMMARY_FORMAT,
+        PSEUDOBULK_FORMAT,
+        store.timeseries_version(experiment_id),
+        store.cell_data_version(experiment_id),
+        meta.get("protocol_changes", []),
+        meta.get("timeseries_changes", [])
+    ]
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+
+def build_experiment_frame(store, experiment_id, start_date=None):
+    """
+    Full per-timepoint frame of an experiment, the input of its summary.
+
+    Uploaded cells are aggregated into a scored pseudobulk with bootstrap
+    confidence bands; without cells the stored time series is used. Either
+    way the protocol changes kept in the experiment's meta are marked on it.
+
+    Returns:
+    --------
+    tuple
+        (DataFrame or None without any data, whether it comes from uploaded cells)
+    """
+    meta = store.read_meta(experiment_id)
+    frame = None
+    if store.list_matrices(experiment_id):
+        frame = load_pseudobulk(store, experiment_id, start_date)
+    if frame is None or frame.empty:
+        if not store.has_timeseries(experiment_id):
+            return None, False
+        frame = store.read_timeseries(experiment_id)
+        # Time series written before events were split off still carry their marker columns
+        if "Change_Description" not in frame.columns:
+            frame = mark_protocol_changes(frame, meta.get("timeseries_changes", []))
+        return frame, False
+
+    frame = mark_protocol_changes(score_pseudobulk(frame), meta.get("protocol_changes", []))
+    # Resampling cells within each timepoint gives the uncertainty of every score
+    resamples = bootstrap_timepoints(store, experiment_id)
+    if not resamples.empty:
+        frame = frame.merge(confidence_bands(score_pseudobulk(resamples), BAND_COLUMNS), on="Timepoint", how="left")
+    return frame, True
+
+
+def _thin(n, limit):
+    """Evenly spaced positions of at most ``limit`` out of ``n`` rows, keeping the first and last"""
+    if n <= limit:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, limit).round().astype(int))
+
+
+class ExperimentSummary:
+    """
+    Derived views of one experiment, small enough to read on every page run.
+
+    Parameters:
+    -----------
+    tiles : DataFrame
+        Last two timepoints of every scalar column (scores, percentages, bands), for metric tiles and deltas
+    trend : DataFrame
+        Date, Score Type, Score, Low, High and Protocol of every plotted score, one row per series and timepoint
+    genes : DataFrame
+        Date, Gene, Expression and Rank of the TOP_GENES most expressed genes of every timepoint
+    lineage : DataFrame
+        Date and lineage percentages of every timepoint, with their bands when available
+    changes : DataFrame
+        Date, Description and Target of every protocol change
+    info : dict
+        has_cells, n_cells, n_timepoints, first_date and last_date
+    """
+
+    def __init__(self, tiles, trend, genes, lineage, changes, info):
+        self.tiles = tiles
+        self.trend = trend
+        self.genes = genes
+        self.lineage = lineage
+        self.changes = changes
+        self.info = info
+
+    @classmethod
+    def build(cls, df, has_cells=False):
+        """Derive every view from a full per-timepoint frame"""
+        df = df.sort_values("Date", ignore_index=True)
+        gene_columns = [column for column in df.columns if column.startswith("Gene_")]
+        events = ProtocolEventIndex.from_frame(df)
+        changes = pd.DataFrame({
+            "Date": events.starts,
+            "Description": events.descriptions.astype(str),
+            "Target": events.targets.astype(str)
+        })
+
+        tile_columns = [column for column in df.columns if column not in gene_columns and column not in CHANGE_COLUMNS]
+        tiles = df[tile_columns].tail(2).reset_index(drop=True)
+
+        # Long cultures keep an even subset of timepoints for the charts
+        sampled = df.iloc[_thin(len(df), MAX_TREND_POINTS)]
+        protocol = events.active_labels(sampled["Date"])
+        no_band = np.full(len(sampled), np.nan)
+        trend = pd.concat([
+            pd.DataFrame({
+                "Date": sampled["Date"].to_numpy(),
+                "Score Type": series,
+                "Score": sampled[column].to_numpy(dtype=float),
+                "Low": sampled[f"{column}_Low"].to_numpy(dtype=float) if f"{column}_Low" in sampled else no_band,
+                "High": sampled[f"{column}_High"].to_numpy(dtype=float) if f"{column}_High" in sampled else no_band,
+                "Protocol": protocol
+            })
+            for series, column in SCORE_SERIES.items()
+        ], ignore_index=True)
+
+        lineage_columns = [column for column in df.columns if column.startswith(tuple(LINEAGE_COLUMNS))]
+        lineage = sampled[["Date"] + lineage_columns].reset_index(drop=True)
+
+        # Rank genes within every timepoint in one argsort over the expression matrix
+        n_top = min(TOP_GENES, len(gene_columns))
+        values = df[gene_columns].to_numpy()
+        order = np.argsort(-values, axis=1, kind="stable")[:, :n_top]
+        genes = pd.DataFrame({
+            "Date": np.repeat(df["Date"].to_numpy(), n_top),
+            "Gene": np.array([column[len("Gene_"):] for column in gene_columns], dtype=object)[order].ravel(),
+            "Expression": np.take_along_axis(values, order, axis=1).ravel(),
+            "Rank": np.tile(np.arange(1, n_top + 1), len(df))
+        })
+
+        info = {
+            "has_cells": bool(has_cells),
+            "n_cells": int(df["N_Cells"].sum()) if "N_Cells" in df.columns else None,
+            "n_timepoints": len(df),
+            "first_date": str(df["Date"].min()),
+            "last_date": str(df["Date"].max())
+        }
+        return cls(tiles, trend, genes, lineage, changes, info)
+
+    def write(self, store, experiment_id, version):
+        """Compact the summary's frames and persist them under ``version`` of its inputs"""
+        before = after = 0
+        for name in SUMMARY_FRAMES:
+            frame = getattr(self, name)
+            compacted = compact_frame(frame)
+            before, after = before + frame_bytes(frame), after + frame_bytes(compacted)
+            setattr(self, name, compacted)
+            store.write_frame(experiment_id, f"summary_{name}", compacted)
+        record_frame_bytes(store, experiment_id, "summary", before, after)
+        # The version goes last so a half-written summary is never taken as current
+        store.write_meta(experiment_id, summary_version=version, summary_info=self.info)
+
+    @classmethod
+    def read(cls, store, experiment_id):
+        """Open a stored summary through memory maps"""
+        frames = {name: store.read_frame(experiment_id, f"summary_{name}") for name in SUMMARY_FRAMES}
+        return cls(info=store.read_meta(experiment_id)["summary_info"], **frames)
+
+    @property
+    def has_cells(self):
+        """Whether the summary was built from uploaded cells rather than the demo time series"""
+        return self.info["has_cells"]
+
+    @property
+    def latest(self):
+        """Scalar columns of the last timepoint"""
+        return self.tiles.iloc[-1]
+
+    @property
+    def previous(self):
+        """Scalar columns of the timepoint before the last, or the last one when there is only one"""
+        return self.tiles.iloc[-2] if len(self.tiles) > 1 else self.latest
+
+    @property
+    def first_date(self):
+        return pd.Timestamp(self.info["first_date"])
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(self.info["last_date"])
+
+    @cached_property
+    def events(self):
+        """Protocol changes as a ProtocolEventIndex running to the last timepoint"""
+        return ProtocolEventIndex(
+            self.changes["Date"],
+            self.changes["Description"],
+            self.changes["Target"],
+            end=self.last_date
+        )
+
+    def top_genes(self, date=None):
+        """Most expressed genes at ``date`` (the last timepoint by default), highest first"""
+        date = self.last_date if date is None else pd.Timestamp(date)
+        return self.genes[self.genes["Date"] == date].sort_values("Rank", ignore_index=True)
+
+
+def load_summary(store, experiment_id, start_date=None):
+    """
+    Return an experiment's summary, rebuilding it only when its inputs changed.
+
+    Ingestion (experiment creation, uploads and the ingestion service) calls
+    this as soon as new data is stored, so page runs normally find a current
+    summary and only read it. Dates of uploaded timepoints count from
+    ``start_date``, by default the ``created_at`` kept in the experiment's meta.
+
+    Returns:
+    --------
+    ExperimentSummary or None
+        None for an experiment with neither a time series nor cells
+    """
+    def current(meta, version):
+        return meta.get("summary_version") == version and all(
+            store.has_frame(experiment_id, f"summary_{name}") for name in SUMMARY_FRAMES
+        )
+
+    hit = current(store.read_meta(experiment_id), source_version(store, experiment_id))
+    cache_result("experiment_summary", hit)
+    if hit:
+        return ExperimentSummary.read(store, experiment_id)
+
+    # Sessions and the ingestion service rebuild one at a time; whoever waited
+    # on the lock reads the summary the previous holder wrote
+    with store.experiment_lock(experiment_id):
+        meta = store.read_meta(experiment_id)
+        version = source_version(store, experiment_id)
+        if current(meta, version):
+            return ExperimentSummary.read(store, experiment_id)
+        df, has_cells = build_experiment_frame(store, experiment_id, start_date or meta.get("created_at"))
+        if df is None:
+            return None
+        summary = ExperimentSummary.build(df, has_cells)
+        summary.write(store, experiment_id, version)
+    return summary
@@ -0,0 +1,310 @@
+"""
+Streaming exports of experiment data.
+
+Every export is a generator of byte chunks built from record batches read out of
+the experiment store, so even million-row tables are never assembled in memory.
+`ExportServer` serves these generators over chunked HTTP on a side port, since
+Streamlit's download button needs the whole file up front. The side port has
+no session of its own, so every link is signed for one export and expires:
+only sessions that were shown a link can download, and only for a while.
+"""
+import os
+import io
+import re
+import hmac
+import time
+import secrets
+import hashlib
+import threading
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# Rows per record batch (and per Parquet row group) when streaming
+EXPORT_BATCH_ROWS = 65536
+
+# Side port for export downloads (override with OSIRIS_EXPORT_HOST / OSIRIS_EXPORT_PORT). Links
+# are signed, so it listens on every interface; a free port is used when this one is taken.
+EXPORT_HOST = os.environ.get("OSIRIS_EXPORT_HOST", "0.0.0.0")
+EXPORT_PORT = int(os.environ.get("OSIRIS_EXPORT_PORT", "8504"))
+
+# Address browsers reach the side port at, e.g. behind a proxy; by default the host the
+# browser used for the dashboard, on the export port
+EXPORT_URL = os.environ.get("OSIRIS_EXPORT_URL")
+
+# Key export links are signed with; set OSIRIS_EXPORT_SECRET for links that survive a restart
+EXPORT_SECRET = os.environ.get("OSIRIS_EXPORT_SECRET")
+
+# Seconds an export link stays valid (override with OSIRIS_EXPORT_LINK_SECONDS)
+EXPORT_LINK_SECONDS = int(os.environ.get("OSIRIS_EXPORT_LINK_SECONDS", "3600"))
+
+PREDICTION_SCHEMA = pa.schema([
+    ("sample", pa.string()),
+    ("cell", pa.string()),
+    ("model", pa.string()),
+    ("class", pa.string()),
+    ("probability", pa.float32())
+])
+
+CHAT_SCHEMA = pa.schema([
+    ("timestamp", pa.string()),
+    ("role", pa.string()),
+    ("content", pa.string())
+])
+
+
+# ----------------------------------------------------------------------
+# Record batch sources
+# ----------------------------------------------------------------------
+
+def timeseries_batches(store, experiment_id, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield the experiment time series straight from its memory-mapped file"""
+    table = store.open_timeseries(experiment_id)
+    yield from table.to_batches(max_chunksize=batch_rows)
+
+
+def _rows_to_batches(rows, schema, batch_rows):
+    """Group an iterator of dict rows into record batches of a fixed size"""
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) == batch_rows:
+            yield pa.RecordBatch.from_pylist(buffer, schema=schema)
+            buffer = []
+    if buffer:
+        yield pa.RecordBatch.from_pylist(buffer, schema=schema)
+
+
+def prediction_batches(store, experiment_id, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield one row per sample (or cell), model and class from the stored predictions"""
+    # One sample's rows are mapped at a time, as the export reaches them
+    for result in store.iter_predictions(experiment_id):
+        table = store.open_predictions(experiment_id, result["sample"])
+        if table is None:
+            continue
+        table = table.append_column("sample", pa.array([result["sample"]] * table.num_rows, pa.string()))
+        table = table.select(PREDICTION_SCHEMA.names).cast(PREDICTION_SCHEMA)
+        yield from table.to_batches(max_chunksize=batch_rows)
+
+
+def chat_batches(store, experiment_id, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield the experiment's protocol assistant conversation log"""
+    yield from _rows_to_batches(store.iter_chat_log(experiment_id), CHAT_SCHEMA, batch_rows)
+
+
+EXPORT_SOURCES = {
+    "timeseries": timeseries_batches,
+    "predictions": prediction_batches,
+    "chat": chat_batches
+}
+
+
+# ----------------------------------------------------------------------
+# Encoders
+# ----------------------------------------------------------------------
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_csv(batches):
+    """Encode record batches as CSV, yielding one chunk per batch"""
+    include_header = True
+    for batch in batches:
+        sink = io.BytesIO()
+        pa_csv.write_csv(batch, sink, write_options=pa_csv.WriteOptions(include_header=include_header))
+        include_header = False
+        yield sink.getvalue()
+
+
+def stream_parquet(batches, schema=None, compression="zstd"):
+    """
+    Encode record batches as a compressed Parquet file, one row group per batch.
+
+    Each row group is yielded as soon as it is written; the footer follows the
+    last one.
+    """
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(sink, schema or batch.schema, compression=compression)
+        writer.write_batch(batch)
+        chunk = sink.drain()
+        if chunk:
+            yield chunk
+
+    if writer is None:
+        if schema is None:
+            return
+        writer = pq.ParquetWriter(sink, schema, compression=compression)
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(store, experiment_id, dataset, file_format):
+    """
+    Stream one dataset of an experiment in the requested format.
+
+    Parameters:
+    -----------
+    store : ExperimentStore
+        Store holding the experiment
+    experiment_id : str
+        Experiment to export
+    dataset : str
+        "timeseries", "predictions" or "chat"
+    file_format : str
+        "csv" or "parquet"
+
+    Returns:
+    --------
+    generator of bytes
+    """
+    if dataset not in EXPORT_SOURCES:
+        raise ValueError(f"Unknown dataset: {dataset}")
+    batches = EXPORT_SOURCES[dataset](store, experiment_id)
+    if file_format == "csv":
+        return stream_csv(batches)
+    if file_format == "parquet":
+        schema = {"predictions": PREDICTION_SCHEMA, "chat": CHAT_SCHEMA}.get(dataset)
+        return stream_parquet(batches, schema)
+    raise ValueError(f"Unknown format: {file_format}")
+
+
+# ----------------------------------------------------------------------
+# HTTP side server
+# ----------------------------------------------------------------------
+
+class ExportServer:
+    """
+    Serves ``GET /export/<experiment_id>/<dataset>.<csv|parquet>`` with chunked transfer encoding.
+
+    Runs on a daemon thread next to the Streamlit server. Requests need the
+    ``expires`` and ``signature`` parameters of a link made by ``url``;
+    anything else is refused with 403.
+
+    Parameters:
+    -----------
+    store : ExperimentStore
+        Store the exports are read from
+    host, port : str, int
+        Address to listen on; when the port is taken a free one is used
+    public_url : str, optional
+        Base URL browsers reach the server at, instead of the dashboard's host on the bound port
+    secret : str or bytes, optional
+        Signing key; a random one per process when not given
+    link_seconds : int
+        How long a link stays valid
+    """
+
+    PATH_PATTERN = re.compile(r"^/export/([\w-]+)/(\w+)\.(csv|parquet)$")
+
+    def __init__(self, store, host=EXPORT_HOST, port=EXPORT_PORT, public_url=EXPORT_URL,
+                 secret=EXPORT_SECRET, link_seconds=EXPORT_LINK_SECONDS):
+        self.store = store
+        self.public_url = public_url
+        self.link_seconds = link_seconds
+        self._secret = secret.encode() if isinstance(secret, str) else (secret or secrets.token_bytes(32))
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                match = server.PATH_PATTERN.match(path)
+                if not match:
+                    self.send_error(404)
+                    return
+                params = parse_qs(query)
+                if not server.verify(path, params.get("expires", [""])[0], params.get("signature", [""])[0]):
+                    self.send_error(403, "Export link is invalid or has expired")
+                    return
+                experiment_id, dataset, file_format = match.groups()
+                if dataset not in EXPORT_SOURCES or experiment_id not in server.store.list_experiments():
+                    self.send_error(404)
+                    return
+
+                chunks = stream_export(server.store, experiment_id, dataset, file_format)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/csv" if file_format == "csv" else "application/vnd.apache.parquet")
+                self.send_header("Content-Disposition", f'attachment; filename="{experiment_id}_{dataset}.{file_format}"')
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    # An empty chunk would mark the end of the body
+                    if not chunk:
+                        continue
+                    self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.httpd = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            self.httpd = ThreadingHTTPServer((host, 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def _signature(self, path, expires):
+        return hmac.new(self._secret, f"{path}\n{expires}".encode(), hashlib.sha256).hexdigest()
+
+    def verify(self, path, expires, signature):
+        """Whether a request for ``path`` carries a valid signature that has not expired"""
+        if not expires.isdigit() or int(expires) < time.time():
+            return False
+        return hmac.compare_digest(self._signature(path, expires), signature)
+
+    def base_url(self, browser_host=None):
+        """
+        Base URL of the server as seen by a browser.
+
+        ``browser_host`` is the host the browser reached the dashboard at (its
+        ``Host`` header); the side port is on the same machine.
+        """
+        if self.public_url:
+            return self.public_url.rstrip("/")
+        host, port = self.httpd.server_address[:2]
+        if browser_host:
+            host = urlsplit(f"//{browser_host}").hostname or host
+        elif host in ("0.0.0.0", "::"):
+            host = "localhost"
+        if ":" in host:
+            host = f"[{host}]"
+        return f"http://{host}:{port}"
+
+    def url(self, experiment_id, dataset, file_format, browser_host=None):
+        """Signed link to one export, valid for ``link_seconds``"""
+        path = f"/export/{experiment_id}/{dataset}.{file_format}"
+        expires = int(time.time()) + self.link_seconds
+        return f"{self.base_url(browser_host)}{path}?expires={expires}&signature={self._signature(path, expires)}"
+
+    def shutdown(self):
+        self.httpd.shutdown()
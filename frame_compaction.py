@@ -0,0 +1,127 @@
+"""
+Compact dtypes for the experiment frames kept in the store.
+
+Frames come out of pandas as float64 and int64 throughout, with strings as
+Python objects. Before a frame is written it is compacted: floats go to
+float32 when that keeps every value to within FLOAT_RTOL, integers to the
+smallest signed type that holds both their values and the difference of any
+two of them, and string columns with few distinct values become categoricals
+(dictionary arrays in Arrow). Frames read back through the memory map keep
+those dtypes, so every session holding them pays the compact size.
+
+Protocol changes are not kept as marker columns that are empty on almost every
+row; they are split off into the experiment's meta as a list of events and put
+back on the frame only when a summary is built.
+
+Bytes before and after compaction are recorded per frame in the experiment's
+meta (``frame_bytes``) for the memory page.
+"""
+import numpy as np
+import pandas as pd
+
+# Largest relative error allowed when floats are narrowed to float32
+FLOAT_RTOL = 1e-6
+
+# Signed types integers may be narrowed to, smallest first
+INTEGER_DTYPES = (np.int8, np.int16, np.int32)
+
+# String columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+# Marker columns of protocol changes, stored as events instead
+EVENT_COLUMNS = ("Protocol_Change", "Change_Description", "Change_Target")
+
+
+def frame_bytes(df):
+    """Memory held by a DataFrame, including the Python objects of object columns"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def compact_column(series, category_ratio=CATEGORY_MAX_RATIO):
+    """A column in the smallest dtype that holds its values safely, or the column unchanged"""
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if pd.api.types.is_float_dtype(series):
+        if series.dtype.itemsize <= 4:
+            return series
+        narrowed = series.astype(np.float32)
+        if np.allclose(narrowed.to_numpy(dtype=np.float64), series.to_numpy(), rtol=FLOAT_RTOL, atol=0, equal_nan=True):
+            return narrowed
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        if series.isna().all():
+            return series
+        low, high = int(series.min()), int(series.max())
+        for dtype in INTEGER_DTYPES:
+            limits = np.iinfo(dtype)
+            # The narrow type must also hold the difference of any two values, or subtracting them would wrap
+            if limits.min <= low and high <= limits.max and high - low <= limits.max:
+                if isinstance(series.dtype, np.dtype):
+                    return series.astype(dtype)
+                return series.astype(f"Int{limits.bits}")
+        return series
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        values = series.dropna()
+        if len(values) and values.map(type).eq(str).all() and values.nunique() <= category_ratio * len(series):
+            return series.astype("category")
+    return series
+
+
+def compact_frame(df, category_ratio=CATEGORY_MAX_RATIO):
+    """Copy of a DataFrame with every column compacted by compact_column"""
+    return pd.DataFrame({column: compact_column(df[column], category_ratio) for column in df.columns}, index=df.index)
+
+
+def split_events(df):
+    """
+    Take the protocol change marker columns off a frame.
+
+    Returns:
+    --------
+    tuple
+        (frame without the marker columns, list of ``{"date", "change", "target"}``
+        dicts in the format of the experiment's recorded protocol changes)
+    """
+    if "Protocol_Change" not in df.columns:
+        return df.drop(columns=[c for c in EVENT_COLUMNS if c in df.columns]), []
+    marked = df[df["Protocol_Change"] == True]
+    events = [
+        {
+            "date": str(pd.Timestamp(row["Date"])),
+            "change": "" if pd.isna(row.get("Change_Description")) else str(row.get("Change_Description")),
+            "target": "" if pd.isna(row.get("Change_Target")) else str(row.get("Change_Target"))
+        }
+        for _, row in marked.iterrows()
+    ]
+    return df.drop(columns=[c for c in EVENT_COLUMNS if c in df.columns]), events
+
+
+def record_frame_bytes(store, experiment_id, name, before, after):
+    """Keep the size of one of an experiment's frames before and after compaction in its meta"""
+    with store.experiment_lock(experiment_id):
+        sizes = dict(store.read_meta(experiment_id).get("frame_bytes", {}))
+        sizes[name] = {"before": int(before), "after": int(after)}
+        store.write_meta(experiment_id, frame_bytes=sizes)
+
+
+def compact_and_record(store, experiment_id, name, df):
+    """Compact a frame that is about to be written and record what it saved"""
+    compacted = compact_frame(df)
+    record_frame_bytes(store, experiment_id, name, frame_bytes(df), frame_bytes(compacted))
+    return compacted
+
+
+def write_compact_timeseries(store, experiment_id, df):
+    """
+    Write an experiment's time series with its protocol changes split off and its columns compacted.
+
+    The changes go to ``timeseries_changes`` in the experiment's meta, before
+    the time series itself so its version only moves once both are written.
+    """
+    frame, events = split_events(df)
+    store.write_meta(experiment_id, timeseries_changes=events)
+    compacted = compact_frame(frame)
+    # Measured against the frame as generated, marker columns included
+    record_frame_bytes(store, experiment_id, "timeseries", frame_bytes(df), frame_bytes(compacted))
+    store.write_timeseries(experiment_id, compacted)
+    return compacted, events
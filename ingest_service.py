@@ -0,0 +1,354 @@
+"""
+Background ingestion service for count files dropped into a watched directory.
+
+New files are recorded in a persistent SQLite job queue and processed by a
+bounded pool of workers (parse -> QC -> prediction). Results are written to the
+experiment store, so the dashboards only ever read finished artifacts.
+
+Files are attached to an experiment by their first-level subdirectory::
+
+    <watch_dir>/<experiment_id>/<sample>.h5ad
+
+Samples are named after the whole file name, extension included, so
+``x.h5`` and ``x.h5ad`` are two samples. Files placed directly in the watch
+directory get an experiment named after the file without its extension.
+
+Only cells that pass QC are stored and sent for prediction.
+
+Run with::
+
+    python ingest_service.py --watch /data/incoming --workers 4
+"""
+import os
+import io
+import sqlite3
+import tempfile
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from count_readers import open_count_matrix, CellSubsetReader, SUPPORTED_EXTENSIONS, HDF5_EXTENSIONS
+from cell_analysis import TIMEPOINT_COLUMNS
+from experiment_store import ExperimentStore, DEFAULT_STORE_DIR
+from experiment_catalog import ExperimentCatalog
+from experiment_summary import load_summary
+from frame_compaction import compact_frame
+from prediction_client import (
+    predict_file, prepare_upload, get_feature_index, alignment_report, PREDICTION_MODELS, DEFAULT_BACKEND_URL
+)
+
+# Minimum detected genes for a cell to pass QC
+MIN_GENES_PER_CELL = 200
+
+
+class JobQueue:
+    """
+    Persistent job queue backed by SQLite.
+
+    Each job is one file version (path, size, mtime), so re-dropping an updated
+    file queues it again while restarting the service never queues it twice.
+    Jobs left running by a crashed service are put back in the queue on startup.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                experiment_id TEXT NOT NULL,
+                sample TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                UNIQUE (path, size, mtime_ns)
+            )
+        """)
+        self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def enqueue(self, path, size, mtime_ns, experiment_id, sample):
+        """Add a file version to the queue; returns False if it was already known"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (path, size, mtime_ns, experiment_id, sample, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, experiment_id, sample, self._now(), self._now())
+            )
+            return cursor.rowcount == 1
+
+    def claim(self):
+        """Atomically move the oldest queued job to running and return it"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT id, path, experiment_id, sample, attempts FROM jobs "
+                "WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                self._conn.execute("COMMIT")
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (self._now(), row[0])
+            )
+            self._conn.execute("COMMIT")
+        return {"id": row[0], "path": row[1], "experiment_id": row[2], "sample": row[3], "attempts": row[4] + 1}
+
+    def finish(self, job_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', error = NULL, updated_at = ? WHERE id = ?",
+                (self._now(), job_id)
+            )
+
+    def fail(self, job_id, error, retry):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                ("queued" if retry else "failed", str(error), self._now(), job_id)
+            )
+
+    def jobs(self, experiment_id=None):
+        """Return all jobs, newest first, optionally for one experiment"""
+        query = "SELECT id, path, experiment_id, sample, status, attempts, error, updated_at FROM jobs"
+        params = ()
+        if experiment_id is not None:
+            query += " WHERE experiment_id = ?"
+            params = (str(experiment_id),)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY id DESC", params).fetchall()
+        keys = ["id", "path", "experiment_id", "sample", "status", "attempts", "error", "updated_at"]
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def run_qc(reader, min_genes=MIN_GENES_PER_CELL, block_size=10000):
+    """
+    Compute basic per-cell QC metrics one block of cells at a time.
+
+    Returns:
+    --------
+    dict
+        Summary metrics and the mask of cells that pass QC
+    """
+    genes_per_cell = np.zeros(reader.shape[0], dtype=np.int64)
+    counts_per_cell = np.zeros(reader.shape[0], dtype=np.float64)
+    for rows, block in reader.iter_cell_blocks(block_size):
+        genes_per_cell[rows] = block.getnnz(axis=1)
+        counts_per_cell[rows] = np.asarray(block.sum(axis=1)).ravel()
+
+    passed = genes_per_cell >= min_genes
+    return {
+        "n_cells": int(reader.shape[0]),
+        "n_genes": int(reader.shape[1]),
+        "n_cells_passed": int(passed.sum()),
+        "median_genes_per_cell": float(np.median(genes_per_cell)) if len(genes_per_cell) else 0.0,
+        "median_counts_per_cell": float(np.median(counts_per_cell)) if len(counts_per_cell) else 0.0,
+        "passed": passed
+    }
+
+
+def write_cell_table(out, reader, feature_index=None, block_size=10000):
+    """
+    Write a reader's cells to a binary file as a TSV count table with one row per cell.
+
+    The table is written one block of cells at a time, so memory use stays
+    bounded whatever the size of the file. With the models' feature manifest
+    the table is aligned to it like prepare_upload aligns an upload: model
+    genes in model order, zero-filled when missing.
+
+    Raises:
+    -------
+    FeatureMismatchError
+        When fewer than MIN_FEATURE_COVERAGE of the model genes are present
+    """
+    if feature_index is None:
+        source = target = np.arange(len(reader.genes))
+        columns = reader.genes
+    else:
+        source, target = feature_index.match(reader.genes)
+        matched = np.zeros(len(feature_index), dtype=bool)
+        matched[target] = True
+        alignment_report(feature_index, matched, len(reader.genes))
+        columns = feature_index.features
+    out.write(("\t".join(["cell"] + list(columns)) + "\n").encode())
+    for rows, block in reader.iter_cell_blocks(block_size):
+        values = np.zeros((block.shape[0], len(columns)), dtype=np.float32 if feature_index is not None else block.dtype)
+        values[:, target] = block[:, source].toarray()
+        buffer = io.StringIO()
+        pd.DataFrame(values, index=reader.cells[rows], columns=columns).to_csv(buffer, sep="\t", header=False)
+        out.write(buffer.getvalue().encode())
+
+
+class IngestService:
+    """Watches a directory, queues new count files and processes them with bounded concurrency"""
+
+    def __init__(self, watch_dir, store=None, backend_url=DEFAULT_BACKEND_URL, workers=2,
+                 poll_interval=10.0, max_attempts=3, queue_path=None):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.store = store or ExperimentStore()
+        self.backend_url = backend_url
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.queue = JobQueue(queue_path or os.path.join(self.store.root, "ingest_jobs.sqlite"))
+        self.catalog = ExperimentCatalog.for_store(self.store)
+
+        # Size seen for each candidate on the previous scan; files are only queued once their size is stable
+        self._pending_sizes = {}
+        self._stop = threading.Event()
+
+    def _attribute(self, path):
+        """Work out (experiment_id, sample) for a file from where it sits in the watch directory"""
+        relative = os.path.relpath(path, self.watch_dir)
+        parts = relative.split(os.sep)
+        # The extension stays in the sample name, so x.h5 and x.h5ad do not overwrite each other
+        sample = parts[-1]
+        experiment_id = parts[0] if len(parts) > 1 else os.path.splitext(sample)[0]
+        return experiment_id, sample
+
+    def scan(self):
+        """Queue every count file whose size has not changed since the previous scan"""
+        queued = 0
+        for dirpath, _, filenames in os.walk(self.watch_dir):
+            for filename in filenames:
+                if filename.rsplit(".", 1)[-1].lower() not in SUPPORTED_EXTENSIONS:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+
+                # Skip files that are still being written
+                if self._pending_sizes.get(path) != stat.st_size:
+                    self._pending_sizes[path] = stat.st_size
+                    continue
+
+                experiment_id, sample = self._attribute(path)
+                if self.queue.enqueue(path, stat.st_size, stat.st_mtime_ns, experiment_id, sample):
+                    queued += 1
+        return queued
+
+    def process(self, job):
+        """Run parse -> QC -> prediction for one job and publish its artifacts"""
+        experiment_id, sample = job["experiment_id"], job["sample"]
+
+        name = os.path.basename(job["path"])
+        data = None
+        with open_count_matrix(job["path"]) as reader, tempfile.TemporaryFile() as table:
+            qc = run_qc(reader)
+            passed = qc.pop("passed")
+            if not passed.any():
+                raise ValueError(f"None of the {qc['n_cells']:,} cells passed QC")
+
+            if passed.all():
+                self.store.write_matrix_blocks(experiment_id, reader, name=sample, obs_columns=TIMEPOINT_COLUMNS)
+            else:
+                # Cells failing QC are neither stored nor predicted; the others are sent as a table
+                feature_index = get_feature_index(self.backend_url)
+                if feature_index is None and name.rsplit(".", 1)[-1].lower() in HDF5_EXTENSIONS:
+                    # Every gene of every passing cell would be written out densely
+                    raise ValueError("Cells of an HDF5 file can only be sent for prediction when the backend publishes a feature manifest")
+                cells = CellSubsetReader(reader, passed)
+                self.store.write_matrix_blocks(experiment_id, cells, name=sample, obs_columns=TIMEPOINT_COLUMNS)
+                write_cell_table(table, cells, feature_index)
+                table.seek(0)
+                data = predict_file(f"{os.path.splitext(name)[0]}.tsv", table, self.backend_url)
+
+        if data is None:
+            # Tables are reduced to the model's gene panel; other formats are sent as they are
+            if name.rsplit(".", 1)[-1].lower() in ("tsv", "csv"):
+                with open(job["path"], "rb") as f:
+                    content, _ = prepare_upload(name, f.read(), self.backend_url)
+                data = predict_file(name, content, self.backend_url)
+            else:
+                with open(job["path"], "rb") as f:
+                    data = predict_file(name, f, self.backend_url)
+
+        # Predictions are written last so a sample only appears once all of its artifacts exist
+        arrays = {model: data[f"{model}_arrays"] for model in PREDICTION_MODELS}
+        calls = {}
+        for model, model_arrays in arrays.items():
+            call, support = model_arrays.call()
+            calls[model] = {"class": call, "support": support, "per_cell": model_arrays.per_cell}
+        rows = pd.concat([model_arrays.to_frame().assign(model=model) for model, model_arrays in arrays.items()], ignore_index=True)
+        self.store.write_predictions(experiment_id, sample, {
+            "sample": sample,
+            "source_file": job["path"],
+            "qc": qc,
+            # Per-cell results go to the Arrow rows; the summary only keeps each model's call
+            "calls": calls,
+            "ingested_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }, rows=compact_frame(rows[["model", "cell", "class", "probability"]]))
+
+        # Refresh the experiment's summary so the dashboards read it instead of aggregating cells
+        load_summary(self.store, experiment_id)
+
+        # Experiments first seen as a drop folder are listed in the dashboard under their folder name
+        self.catalog.add(experiment_id, "dash", experiment_id, replace=False)
+
+    def _run_job(self, job):
+        try:
+            self.process(job)
+            self.queue.finish(job["id"])
+        except Exception as e:
+            self.queue.fail(job["id"], e, retry=job["attempts"] < self.max_attempts)
+
+    def run(self):
+        """Scan and process jobs until stopped, never running more than `workers` jobs at once"""
+        slots = threading.Semaphore(self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not self._stop.is_set():
+                self.scan()
+                while slots.acquire(blocking=False):
+                    job = self.queue.claim()
+                    if job is None:
+                        slots.release()
+                        break
+                    future = pool.submit(self._run_job, job)
+                    future.add_done_callback(lambda _: slots.release())
+                self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a directory and ingest new count files")
+    parser.add_argument("--watch", required=True, help="Directory to watch for new count files")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR, help="Experiment store directory")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND_URL, help="Prediction endpoint URL")
+    parser.add_argument("--workers", type=int, default=2, help="Maximum files processed at once")
+    parser.add_argument("--poll-interval", type=float, default=10.0, help="Seconds between directory scans")
+    args = parser.parse_args()
+
+    service = IngestService(
+        args.watch,
+        store=ExperimentStore(args.store),
+        backend_url=args.backend,
+        workers=args.workers,
+        poll_interval=args.poll_interval
+    )
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
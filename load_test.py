@@ -0,0 +1,373 @@
+"""
+Concurrent multi-session load test for the dashboards.
+
+Each simulated user is an AppTest session with its own session state, running
+the app script on its own thread against the shared caches, the way sessions
+run inside one Streamlit server process. Sessions replay a scripted journey
+against a local StubBackend, so the test runs entirely offline.
+
+Every concurrency level runs in a fresh worker process so that its RSS only
+reflects that level's sessions. The report gives per-action latency
+percentiles, RSS per session and the saturation point: the first level where
+throughput stops growing or p95 latency exceeds the SLO. Failed steps are
+reported with the app's error.
+
+AppTest is built for one session at a time: every run compiles the script
+into a fresh cache and installs a mock Runtime that it removes again when the
+run ends. With sessions on several threads, scripts compiled at the same time
+failed with CPython's "AST constructor recursion depth mismatch" (an empty
+page), and one session's teardown took the Runtime away from runs still in
+progress, so widgets lost their form. The workers share one script cache and
+keep the Runtime installed between runs, as a Streamlit server does
+(share_server_state).
+
+Run with::
+
+    python load_test.py --app simplified_dash.py --sessions 1,2,4,8,16 --latency 0.2 --error-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from stub_backend import StubBackend, STUB_FEATURES
+from metrics import process_rss_bytes
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Journey steps count as slow once p95 latency is this many times the single-session p95
+DEFAULT_SLO_FACTOR = 3.0
+
+# A level is saturated when throughput grows by less than this fraction over the previous level
+MIN_THROUGHPUT_GAIN = 0.1
+
+
+def make_tsv(n_cells, seed=0):
+    """Cells-by-genes count table over the stub backend's gene panel"""
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(2, size=(n_cells, len(STUB_FEATURES)))
+    lines = ["cell\t" + "\t".join(STUB_FEATURES)]
+    lines += [f"cell_{i}\t" + "\t".join(map(str, row)) for i, row in enumerate(counts)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+# Journey steps: each takes (AppTest, uploaded TSV bytes) and returns whether the step succeeded,
+# raising with the app's exception or st.error message when it failed visibly
+
+def _ok(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    if at.error:
+        raise RuntimeError(at.error[0].value)
+    return True
+
+
+def _open(at, tsv):
+    at.run()
+    return not at.exception
+
+
+def _create_experiment(name):
+    def step(at, tsv):
+        at.sidebar.button(key="create_experiment_btn").click().run()
+        at.sidebar.text_input(key="new_experiment_name").input(name)
+        next(b for b in at.sidebar.button if b.label == "Create Experiment").click().run()
+        return _ok(at) and any(name in t.value for t in at.title)
+    return step
+
+
+def _upload_tsv(at, tsv):
+    experiment_id = at.session_state.current_experiment
+    at.file_uploader(key=f"uploader_{experiment_id}").set_value(("sample.tsv", tsv, "text/tab-separated-values")).run()
+    return _ok(at)
+
+
+def _run_prediction(at, tsv):
+    at.button(key=f"predict_btn_{at.session_state.current_experiment}").click().run()
+    return _ok(at)
+
+
+def _switch_experiment(index):
+    def step(at, tsv):
+        experiment = at.session_state.experiments[index]
+        # The sidebar lists one page of the shared catalog; find the experiment by its id
+        search = next(t for t in at.sidebar.text_input if t.key.startswith("catalog_query_"))
+        search.input(experiment["id"]).run()
+        at.sidebar.button(key=f"experiment_{experiment['id']}").click().run()
+        return _ok(at) and any(experiment["name"] in t.value for t in at.title)
+    return step
+
+
+def _change_trend(at, tsv):
+    next(s for s in at.selectbox if s.label == "Select metric to display:").select("Both").run()
+    return _ok(at)
+
+
+def _open_recommendations(at, tsv):
+    at.switch_page("page_recommendations.py").run()
+    return _ok(at)
+
+
+def _send_chat(at, tsv):
+    at.text_input(key=f"chat_input_{at.session_state.current_experiment}").input("How can I improve self-renewal?")
+    next(b for b in at.button if b.label == "Send").click().run()
+    return _ok(at)
+
+
+# Scripted journeys per app. dash.py has no prediction call, so its journey exercises pages and fragments instead.
+JOURNEYS = {
+    "simplified_dash.py": [
+        ("open", _open),
+        ("create_experiment", _create_experiment("Load A")),
+        ("upload_tsv", _upload_tsv),
+        ("run_prediction", _run_prediction),
+        ("create_second_experiment", _create_experiment("Load B")),
+        ("switch_experiment", _switch_experiment(0)),
+    ],
+    "dash.py": [
+        ("open", _open),
+        ("create_experiment", _create_experiment("Load A")),
+        ("upload_tsv", _upload_tsv),
+        ("change_trend", _change_trend),
+        ("open_recommendations", _open_recommendations),
+        ("send_chat", _send_chat),
+        ("create_second_experiment", _create_experiment("Load B")),
+        ("switch_experiment", _switch_experiment(0)),
+    ],
+}
+
+
+def share_server_state():
+    """
+    Give concurrent AppTest sessions the process-wide state a Streamlit server has.
+
+    One script cache compiles each script once for every session, the last
+    mock Runtime AppTest installed stays available after its run removes it,
+    and the app-testing option AppTest patches in for each run stays set.
+    """
+    from streamlit import config
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    script_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+    last_runtime = [None]
+
+    def current(cls):
+        if cls._instance is not None:
+            last_runtime[0] = cls._instance
+        return cls._instance or last_runtime[0]
+
+    def instance(cls):
+        runtime = current(cls)
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+    Runtime.instance = classmethod(instance)
+    config.set_option("global.appTest", True)
+
+
+def run_level(app, n_sessions, n_cells=500, repeat=1, timeout=120):
+    """
+    Replay the app's journey in ``n_sessions`` concurrent sessions of this process.
+
+    Returns:
+    --------
+    dict
+        Wall time, RSS before and after the sessions, and per-action latencies and failures
+    """
+    from streamlit.testing.v1 import AppTest
+
+    share_server_state()
+    path = os.path.join(APP_DIR, app)
+    tsv = make_tsv(n_cells)
+
+    # Load the app's modules and shared caches first so the baseline only excludes per-session state
+    AppTest.from_file(path, default_timeout=timeout).run()
+    rss_baseline = process_rss_bytes()
+
+    sessions = [AppTest.from_file(path, default_timeout=timeout) for _ in range(n_sessions)]
+    timings = {name: [] for name, _ in JOURNEYS[app]}
+    failures = {name: 0 for name, _ in JOURNEYS[app]}
+    errors = {}
+    lock = threading.Lock()
+    start_together = threading.Barrier(n_sessions)
+
+    def replay(at):
+        start_together.wait()
+        for _ in range(repeat):
+            for name, step in JOURNEYS[app]:
+                start = time.perf_counter()
+                error = None
+                try:
+                    if not step(at, tsv):
+                        error = "unexpected page"
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                with lock:
+                    timings[name].append(time.perf_counter() - start)
+                    if error is not None:
+                        failures[name] += 1
+                        errors.setdefault(name, {}).setdefault(error, 0)
+                        errors[name][error] += 1
+            # Later repeats start from a fresh session, like a user reloading the page
+            at = AppTest.from_file(path, default_timeout=timeout)
+
+    threads = [threading.Thread(target=replay, args=(at,)) for at in sessions]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+
+    # Measured while the sessions and their state are still alive
+    rss = process_rss_bytes()
+    return {
+        "sessions": n_sessions,
+        "wall_seconds": wall_seconds,
+        "rss_baseline_bytes": rss_baseline,
+        "rss_bytes": rss,
+        "timings": timings,
+        "failures": failures,
+        "errors": errors,
+    }
+
+
+def summarize(levels, slo_factor=DEFAULT_SLO_FACTOR, min_gain=MIN_THROUGHPUT_GAIN):
+    """
+    Turn worker results into report tables and find the saturation point.
+
+    Returns:
+    --------
+    tuple
+        (per-level DataFrame, per-action latency DataFrame, saturation dict or None)
+    """
+    level_rows, action_rows = [], []
+    for level in levels:
+        seconds = np.concatenate([np.asarray(t, dtype=float) for t in level["timings"].values()])
+        n_actions = len(seconds)
+        level_rows.append({
+            "sessions": level["sessions"],
+            "actions": n_actions,
+            "failed": sum(level["failures"].values()),
+            "throughput_per_s": n_actions / level["wall_seconds"] if level["wall_seconds"] else 0.0,
+            "p50_ms": np.percentile(seconds, 50) * 1000 if n_actions else np.nan,
+            "p95_ms": np.percentile(seconds, 95) * 1000 if n_actions else np.nan,
+            "rss_mb": level["rss_bytes"] / 2**20,
+            "rss_per_session_mb": max(level["rss_bytes"] - level["rss_baseline_bytes"], 0) / level["sessions"] / 2**20,
+        })
+        for action, times in level["timings"].items():
+            times = np.asarray(times, dtype=float)
+            action_rows.append({
+                "sessions": level["sessions"],
+                "action": action,
+                "runs": len(times),
+                "failed": level["failures"][action],
+                "p50_ms": np.percentile(times, 50) * 1000 if len(times) else np.nan,
+                "p95_ms": np.percentile(times, 95) * 1000 if len(times) else np.nan,
+                "p99_ms": np.percentile(times, 99) * 1000 if len(times) else np.nan,
+            })
+
+    level_frame = pd.DataFrame(level_rows).sort_values("sessions", ignore_index=True)
+    action_frame = pd.DataFrame(action_rows)
+
+    # Saturated: latency past the SLO, or adding sessions no longer adds throughput
+    saturation = None
+    if len(level_frame):
+        slo_ms = level_frame["p95_ms"].iloc[0] * slo_factor
+        best_throughput = level_frame["throughput_per_s"].iloc[0]
+        for row in level_frame.iloc[1:].itertuples():
+            if row.p95_ms > slo_ms:
+                saturation = {"sessions": row.sessions, "reason": f"p95 {row.p95_ms:.0f} ms exceeds SLO of {slo_ms:.0f} ms"}
+                break
+            if row.throughput_per_s < best_throughput * (1 + min_gain):
+                saturation = {"sessions": row.sessions, "reason": f"throughput {row.throughput_per_s:.1f}/s stopped growing"}
+                break
+            best_throughput = row.throughput_per_s
+    return level_frame, action_frame, saturation
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test a dashboard with concurrent scripted sessions")
+    parser.add_argument("--app", default="simplified_dash.py", choices=sorted(JOURNEYS), help="App script to load")
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--repeat", type=int, default=1, help="Journeys replayed per session")
+    parser.add_argument("--cells", type=int, default=500, help="Cells in the uploaded TSV")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub backend seconds per prediction")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Stub backend extra random seconds per prediction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub predictions that fail")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds before a single script run is abandoned")
+    parser.add_argument("--slo-factor", type=float, default=DEFAULT_SLO_FACTOR,
+                        help="Saturated once p95 exceeds this multiple of the single-level p95")
+    parser.add_argument("--json", help="Also write the raw results to this file")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Worker: run one level in this process and hand the results back on stdout
+    if args.worker:
+        result = run_level(args.app, args.worker, n_cells=args.cells, repeat=args.repeat, timeout=args.timeout)
+        sys.stdout.write(json.dumps(result))
+        return
+
+    backend = StubBackend(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, per_cell=True)
+    store_dir = tempfile.mkdtemp(prefix="osiris_load_")
+    env = dict(
+        os.environ,
+        OSIRIS_BACKEND_URL=backend.start(),
+        OSIRIS_STORE_DIR=store_dir,
+        OSIRIS_TRACE_FILE=os.path.join(store_dir, "traces.jsonl")
+    )
+    levels = []
+    try:
+        for n_sessions in [int(n) for n in args.sessions.split(",")]:
+            print(f"Running {n_sessions} concurrent session(s)...", file=sys.stderr)
+            worker = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", str(n_sessions), "--app", args.app,
+                 "--repeat", str(args.repeat), "--cells", str(args.cells), "--timeout", str(args.timeout)],
+                env=env, cwd=APP_DIR, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+            )
+            levels.append(json.loads(worker.stdout))
+    finally:
+        backend.stop()
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    level_frame, action_frame, saturation = summarize(levels, args.slo_factor)
+    print(f"\n{args.app}: {backend.requests_served} backend requests, stub latency {args.latency}s, error rate {args.error_rate}")
+    print("\nPer level")
+    print(level_frame.round(1).to_string(index=False))
+    print("\nPer action")
+    print(action_frame.round(1).to_string(index=False))
+    errors = pd.DataFrame([
+        {"sessions": level["sessions"], "action": action, "error": message[:100], "count": count}
+        for level in levels
+        for action, messages in level["errors"].items()
+        for message, count in messages.items()
+    ])
+    if len(errors):
+        print("\nFailures")
+        print(errors.to_string(index=False))
+    if saturation:
+        print(f"\nSaturation point: {saturation['sessions']} sessions ({saturation['reason']})")
+    else:
+        print(f"\nSaturation point: not reached up to {level_frame['sessions'].max()} sessions")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"levels": levels, "saturation": saturation}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
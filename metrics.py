@@ -0,0 +1,378 @@
+"""
+Operational metrics for the frontends.
+
+Counters, gauges and histograms are kept in a process-wide registry and served
+in the Prometheus text format by `MetricsServer` on a side port, the same way
+the export server runs next to Streamlit. The frontends can then be scraped and
+alerted on like the backend: backend request latency and errors, upload sizes,
+rerun durations per page, cache hits and misses, active sessions and memory.
+
+Recording a value only takes a lock and a few additions, so it is cheap enough
+to do on every rerun. Cache hit ratios are derived at query time, e.g.
+``rate(osiris_cache_requests_total{result="hit"}[5m]) / rate(osiris_cache_requests_total[5m])``.
+"""
+import os
+import sys
+import math
+import time
+import resource
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from session_memory import all_sessions
+
+# Side port for the scrape endpoint (override with OSIRIS_METRICS_HOST / OSIRIS_METRICS_PORT)
+METRICS_HOST = os.environ.get("OSIRIS_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("OSIRIS_METRICS_PORT", "8503"))
+
+# Prometheus text exposition format served at /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Histogram buckets: backend requests take up to minutes, reruns should take well under a second
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RERUN_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UPLOAD_BUCKETS = tuple(2 ** power for power in range(16, 34, 2))  # 64 KB to 8 GB
+
+# Sessions that ran a script this recently count as active
+ACTIVE_SESSION_SECONDS = 300
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Named family of time series, one per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label names, label values, value) for every series"""
+        with self._lock:
+            return [("", self.labelnames, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing total"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    Value that goes up and down.
+
+    With ``collect`` the value is read when the registry is scraped instead of
+    being set; it returns a number, or a dict from label-value tuples to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [("", self.labelnames, key, value) for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(s["buckets"]), s["sum"], s["count"]) for key, s in self._values.items()]
+        rows = []
+        names = self.labelnames + ("le",)
+        for key, buckets, total, count in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets, buckets):
+                cumulative += n
+                rows.append(("_bucket", names, key + (_format_value(float(bound)),), cumulative))
+            rows.append(("_sum", self.labelnames, key, total))
+            rows.append(("_count", self.labelnames, key, count))
+        return rows
+
+
+class Registry:
+    """Metrics exposed together on one endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# ----------------------------------------------------------------------
+# Collected gauges
+# ----------------------------------------------------------------------
+
+_sessions_lock = threading.Lock()
+_session_last_seen = {}
+
+
+def touch_session(session_id):
+    """Mark a session as active; called on every script run"""
+    with _sessions_lock:
+        _session_last_seen[session_id] = time.time()
+
+
+def active_sessions():
+    """Number of sessions that ran a script within ACTIVE_SESSION_SECONDS"""
+    cutoff = time.time() - ACTIVE_SESSION_SECONDS
+    with _sessions_lock:
+        for session_id in [s for s, seen in _session_last_seen.items() if seen < cutoff]:
+            del _session_last_seen[session_id]
+        return len(_session_last_seen)
+
+
+def process_rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _session_state_bytes():
+    sessions = all_sessions()
+    return {
+        ("in_memory",): sum(row["in_memory_bytes"] for row in sessions),
+        ("spilled",): sum(row["spilled_bytes"] for row in sessions)
+    }
+
+
+# ----------------------------------------------------------------------
+# Frontend metrics
+# ----------------------------------------------------------------------
+
+BACKEND_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "osiris_backend_request_seconds",
+    "Latency of requests to the prediction backend by endpoint (predict, batch, features) and HTTP status",
+    ("endpoint", "status")
+))
+BACKEND_ERRORS = REGISTRY.register(Counter(
+    "osiris_backend_errors_total",
+    "Failed backend requests by endpoint and reason (HTTP status, timeout or connection)",
+    ("endpoint", "reason")
+))
+UPLOAD_BYTES = REGISTRY.register(Histogram(
+    "osiris_upload_bytes",
+    "Size of uploaded files; _sum is the total number of bytes uploaded",
+    ("app",),
+    buckets=UPLOAD_BUCKETS
+))
+RERUN_SECONDS = REGISTRY.register(Histogram(
+    "osiris_rerun_seconds",
+    "Duration of full page runs and fragment runs",
+    ("scope", "name"),
+    buckets=RERUN_BUCKETS
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "osiris_cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ("cache", "result")
+))
+PREDICTIONS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "osiris_predictions_in_flight",
+    "Predictions admitted and running against the backend"
+))
+PREDICTIONS_QUEUED = REGISTRY.register(Gauge(
+    "osiris_predictions_queued",
+    "Predictions waiting for an admission slot"
+))
+PREDICTION_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "osiris_prediction_queue_seconds",
+    "Time predictions waited for an admission slot"
+))
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "osiris_admission_rejections_total",
+    "Prediction submissions turned away by reason (duplicate or queue_full)",
+    ("reason",)
+))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "osiris_active_sessions",
+    f"Browser sessions that ran the app in the last {ACTIVE_SESSION_SECONDS} seconds",
+    collect=active_sessions
+))
+PROCESS_RSS = REGISTRY.register(Gauge(
+    "osiris_process_resident_memory_bytes",
+    "Resident memory of the frontend process",
+    collect=process_rss_bytes
+))
+SESSION_STATE_BYTES = REGISTRY.register(Gauge(
+    "osiris_session_state_bytes",
+    "Experiment state held by all sessions, in memory or spilled to disk",
+    ("location",),
+    collect=_session_state_bytes
+))
+
+
+def cache_result(cache, hit):
+    """Count one lookup of ``cache``"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def backend_request(endpoint, expected=()):
+    """
+    Time a backend request and count it as failed when it raises or answers with an error.
+
+    The block yields a dict; set ``status`` to the response's status code so
+    the latency is labelled with it and error statuses are counted. Statuses in
+    ``expected`` are answers the caller handles (e.g. 404 from a backend
+    without an optional endpoint) and do not count as errors.
+    """
+    outcome = {"status": None}
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except Exception as e:
+        if outcome["status"] is None:
+            outcome["status"] = (
+                "timeout" if isinstance(e, requests.Timeout)
+                else "connection" if isinstance(e, requests.ConnectionError)
+                else "error"
+            )
+        raise
+    finally:
+        status = outcome["status"] or "unknown"
+        BACKEND_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=status)
+        if not isinstance(status, int) or (status >= 400 and status not in expected):
+            BACKEND_ERRORS.inc(endpoint=endpoint, reason=status)
+
+
+# ----------------------------------------------------------------------
+# HTTP side server
+# ----------------------------------------------------------------------
+
+class MetricsServer:
+    """
+    Serves ``GET /metrics`` in the Prometheus text format.
+
+    Runs on a daemon thread next to the Streamlit server.
+    """
+
+    def __init__(self, registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = server.registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def shutdown(self):
+        self.httpd.shutdown()
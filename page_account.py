@@ -0,0 +1,55 @@
+"""Account settings page"""
+import streamlit as st
+
+st.title("Account Settings")
+
+# User profile section
+st.header("User Profile")
+
+col1, col2 = st.columns([1, 2])
+
+with col1:
+    st.image("https://img.icons8.com/color/96/000000/user-male-circle.png", width=150)
+    st.button("Change Profile Picture")
+
+with col2:
+    st.text_input("Name", value="Dr. Jane Smith")
+    st.text_input("Institution", value="University Research Hospital")
+    st.text_input("Email", value="jane.smith@research.edu")
+    st.text_input("Position", value="Principal Investigator")
+
+# Notification settings
+st.header("Notification Settings")
+
+st.checkbox("Email notifications for new recommendations", value=True)
+st.checkbox("Weekly summary reports", value=True)
+st.checkbox("Collaboration requests", value=True)
+st.checkbox("Platform updates and news", value=False)
+
+# API access
+st.header("API Access")
+
+st.text_input("API Key", value="••••••••••••••••••••••••••", type="password")
+col1, col2 = st.columns(2)
+with col1:
+    st.button("Generate New API Key")
+with col2:
+    st.button("Copy API Key")
+
+st.markdown("""
+Use your API key to access the Osiris HSC Platform programmatically. 
+See the [API documentation](https://docs.osiris-hsc.com/api) for more details.
+""")
+
+# Subscription information
+st.header("Subscription")
+
+st.info("**Current Plan:** Research Pro (Annual)")
+st.progress(0.7)
+st.caption("321 days remaining in your subscription")
+
+col1, col2 = st.columns(2)
+with col1:
+    st.button("Upgrade Plan")
+with col2:
+    st.button("Billing History")
@@ -0,0 +1,80 @@
+"""Memory usage and rerun timing admin page"""
+import datetime
+
+import pandas as pd
+import streamlit as st
+
+from dash_common import get_memory_manager, get_experiment_store
+from rerun_timings import timing_summary
+from session_memory import all_sessions, format_bytes
+
+st.title("Memory Usage")
+
+memory_manager = get_memory_manager()
+experiment_rows = memory_manager.report(st.session_state.experiments, get_experiment_store())
+
+# This session's experiments
+st.header("This Session")
+in_memory = sum(row["in_memory_bytes"] for row in experiment_rows)
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric("In memory", format_bytes(in_memory))
+with col2:
+    st.metric("Spilled to disk", format_bytes(sum(row["spilled_bytes"] for row in experiment_rows)))
+with col3:
+    st.metric("Budget", format_bytes(memory_manager.budget_bytes))
+
+if experiment_rows:
+    st.dataframe(
+        pd.DataFrame([
+            {
+                "Experiment": row["name"],
+                "In Memory": format_bytes(row["in_memory_bytes"]),
+                "Spilled": format_bytes(row["spilled_bytes"]) if memory_manager.is_spilled(row["experiment_id"]) else "",
+                "Store (shared)": format_bytes(row["store_bytes"]),
+                "Frames": format_bytes(row["frame_bytes_after"]),
+                "Frames Uncompacted": format_bytes(row["frame_bytes_before"]),
+                "Last Viewed": datetime.datetime.fromtimestamp(row["last_viewed"]).strftime("%Y-%m-%d %H:%M:%S") if row["last_viewed"] else ""
+            }
+            for row in experiment_rows
+        ]),
+        hide_index=True,
+        use_container_width=True
+    )
+    before = sum(row["frame_bytes_before"] for row in experiment_rows)
+    after = sum(row["frame_bytes_after"] for row in experiment_rows)
+    if before:
+        st.caption(
+            f"Compacted dtypes and out-of-line protocol events hold these experiments' frames in "
+            f"{format_bytes(after)} instead of {format_bytes(before)} ({1 - after / before:.0%} less)."
+        )
+else:
+    st.info("No experiments in this session yet.")
+
+# Every live session on this server
+st.header("All Sessions")
+sessions = all_sessions()
+st.dataframe(
+    pd.DataFrame([
+        {
+            "Session": row["session_id"][:8],
+            "Experiments": row["experiments"],
+            "In Memory": format_bytes(row["in_memory_bytes"]),
+            "Spilled": format_bytes(row["spilled_bytes"]),
+            "Last Seen": datetime.datetime.fromtimestamp(row["last_seen"]).strftime("%Y-%m-%d %H:%M:%S")
+        }
+        for row in sessions
+    ]),
+    hide_index=True,
+    use_container_width=True
+)
+st.caption(f"Total across sessions: {format_bytes(sum(row['in_memory_bytes'] for row in sessions))}")
+
+# Page and fragment rerun latency on this server
+st.header("Rerun Timings")
+timings = timing_summary()
+if timings.empty:
+    st.info("No reruns recorded yet.")
+else:
+    st.dataframe(timings, hide_index=True, use_container_width=True)
+    st.caption("Page runs rerun the whole dashboard; fragment runs only rerun one panel.")
@@ -0,0 +1,693 @@
+"""
+Overview page: uploads, key metrics, score trends and lineage output for the selected experiment.
+
+Self-contained panels are fragments, so interacting with them reruns only that
+panel instead of the whole page.
+"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+import streamlit_shadcn_ui as ui
+
+from count_readers import open_count_matrix, SUPPORTED_EXTENSIONS, HDF5_EXTENSIONS
+from cell_analysis import timepoint_calendar, load_differential_expression, score_gene_sets, GENE_SETS, TIMEPOINT_COLUMNS
+from dash_common import (
+    selected_experiment, load_experiment_data, render_experiment_tabs, render_no_experiment,
+    render_export_links, get_experiment_store, format_band, counted_cache_data
+)
+from experiment_summary import load_summary, SCORE_SERIES
+from rerun_timings import timed_fragment
+from metrics import UPLOAD_BYTES
+
+
+@timed_fragment("Upload")
+def render_upload(store, experiment_id, start_date=None):
+    """Uploader and its Process / Clear actions"""
+    st.markdown("### Upload scRNA Sequencing Data")
+    with st.container():
+        # Custom message before the uploader with improved styling
+        st.markdown("""
+        <div style="margin-bottom: 15px; font-size: 1rem; color: #444;">
+            <strong>Upload your single-cell RNA sequencing data</strong><br>
+            <span style="font-size: 0.9rem; color: #666;">Supported formats: CSV, TSV, MTX, H5AD, or 10x HDF5 files</span>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Create a more visually appealing file uploader
+        uploaded_file = st.file_uploader(
+            "", 
+            type=list(SUPPORTED_EXTENSIONS),
+            help="Supported formats: CSV (comma-separated), TSV (tab-separated), MTX (Matrix Market format), H5AD (AnnData), or H5 (10x filtered_feature_bc_matrix)",
+            key=f"uploader_{experiment_id}"
+        )
+        
+        if uploaded_file is not None:
+            # Display a more visually appealing success message with custom styling
+            st.markdown(f"""
+            <div class="upload-success">
+                <h4 style="margin-top: 0; color: #4257B2;">✅ File uploaded successfully</h4>
+                <p style="margin-bottom: 0;"><strong>File:</strong> {uploaded_file.name}</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # Add a container for actions using shadcn UI buttons
+            action_col1, action_col2 = st.columns([1, 1])
+            
+            with action_col1:
+                process_button = ui.button(
+                    "Process Data", 
+                    variant="default",
+                    key=f"process_data_button_{experiment_id}"
+                )
+                
+                if process_button:
+                    UPLOAD_BYTES.observe(uploaded_file.size, app="dash")
+                    try:
+                        # Show a loading spinner while processing
+                        with st.spinner("Processing your data..."):
+                            # Copy the counts into the shared store block by block instead of keeping the upload in session state.
+                            # Each file is kept under its own name, so uploads of other timepoints add to the experiment
+                            # and only a re-upload of the same file replaces its cells.
+                            with open_count_matrix(uploaded_file) as reader:
+                                store.write_matrix_blocks(experiment_id, reader, name=uploaded_file.name, obs_columns=TIMEPOINT_COLUMNS)
+                                store.write_meta(
+                                    experiment_id,
+                                    source_file=uploaded_file.name,
+                                    n_cells=reader.shape[0],
+                                    n_genes=reader.shape[1]
+                                )
+                            
+                            # Aggregate the new cells into the summary the pages read
+                            load_summary(store, experiment_id, start_date)
+                            
+                            st.session_state[f"file_processed_{experiment_id}"] = True
+                        
+                        # The charts outside this fragment are drawn from the new cells
+                        st.rerun()
+                    except Exception as e:
+                        ui.alert(
+                            "Error processing file",
+                            description=str(e),
+                            variant="destructive",
+                            key=f"process_error_alert_{experiment_id}"
+                        )
+            
+            with action_col2:
+                clear_button = ui.button(
+                    "Clear", 
+                    variant="outline",
+                    key=f"clear_button_{experiment_id}"
+                )
+                
+                if clear_button:
+                    # Clear the processed state for this experiment
+                    if f"file_processed_{experiment_id}" in st.session_state:
+                        del st.session_state[f"file_processed_{experiment_id}"]
+            
+            if st.session_state.get(f"file_processed_{experiment_id}", False):
+                # Use shadcn UI alert for success message
+                ui.alert(
+                    "File processed successfully!",
+                    description="Your data is ready for analysis.",
+                    variant="success",
+                    key=f"process_success_alert_{experiment_id}"
+                )
+            
+            # Show file details in an expandable section using shadcn UI
+            file_details_open = ui.collapsible(
+                title="File Details",
+                key=f"file_details_collapsible_{experiment_id}"
+            )
+            
+            if file_details_open:
+                # Calculate file size in appropriate units
+                file_size = uploaded_file.size
+                size_str = f"{file_size} bytes"
+                if file_size > 1024*1024:
+                    size_str = f"{file_size/(1024*1024):.2f} MB"
+                elif file_size > 1024:
+                    size_str = f"{file_size/1024:.2f} KB"
+                
+                # Display file details in a more structured way
+                details_cols = st.columns([1, 2])
+                with details_cols[0]:
+                    st.markdown("**File Properties**")
+                with details_cols[1]:
+                    st.markdown(f"**Filename:** {uploaded_file.name}")
+                    st.markdown(f"**File size:** {size_str}")
+                    st.markdown(f"**File type:** {uploaded_file.type if hasattr(uploaded_file, 'type') else 'Unknown'}")
+                    
+                    # Add file timestamp if available
+                    if hasattr(uploaded_file, 'timestamp'):
+                        st.markdown(f"**Uploaded:** {uploaded_file.timestamp}")
+                    
+                    # HDF5 formats expose their dimensions without reading any counts
+                    if uploaded_file.name.rsplit(".", 1)[-1].lower() in HDF5_EXTENSIONS:
+                        with open_count_matrix(uploaded_file) as reader:
+                            st.markdown(f"**Cells:** {reader.shape[0]:,}")
+                            st.markdown(f"**Genes:** {reader.shape[1]:,}")
+
+
+@timed_fragment("Score Trends")
+def render_score_trends(summary, experiment_id):
+    """Score trend chart with its metric and date range selectors"""
+    st.markdown("### Score Trends")
+    if summary.info["n_cells"] is not None:
+        st.caption(f"Pseudobulk of {summary.info['n_cells']:,} uploaded cells across {summary.info['n_timepoints']} timepoints")
+
+    # Add metric selection
+    metric_options = ["Self-Renewal Score", "Multipotency Score", "Both"]
+    selected_metric = st.selectbox("Select metric to display:", metric_options)
+
+    # Restrict the chart to a date window so long cultures only draw the changes in view
+    first_date = summary.first_date.to_pydatetime()
+    last_date = summary.last_date.to_pydatetime()
+    visible_range = (first_date, last_date)
+    if first_date < last_date:
+        visible_range = st.slider(
+            "Visible range:",
+            min_value=first_date,
+            max_value=last_date,
+            value=(first_date, last_date),
+            format="YYYY-MM-DD",
+            key=f"trend_range_{experiment_id}"
+        )
+
+    # The summary holds the scores already melted and labelled with the protocol active at each point
+    if selected_metric == "Self-Renewal Score":
+        series = ['Self-Renewal']
+    elif selected_metric == "Multipotency Score":
+        series = ['Multipotency']
+    else:  # Both
+        series = list(SCORE_SERIES)
+    trend = summary.trend
+    score_data_melted = trend[trend['Score Type'].isin(series) & trend['Date'].between(*visible_range)]
+
+    # Create the line chart
+    fig = px.line(
+        score_data_melted, 
+        x='Date', 
+        y='Score', 
+        color='Score Type',
+        color_discrete_map={
+            'Self-Renewal': '#4257B2',
+            'Multipotency': '#00CC96'
+        },
+        hover_data={'Protocol': True},
+        title="Score Trends Over Time"
+    )
+
+    # Shade the bootstrap confidence band behind each plotted score
+    if score_data_melted['Low'].notna().any():
+        band_colors = {'Self-Renewal': 'rgba(66, 87, 178, 0.15)', 'Multipotency': 'rgba(0, 204, 150, 0.15)'}
+        for name in series:
+            band_data = score_data_melted[score_data_melted['Score Type'] == name]
+            fig.add_trace(go.Scatter(
+                x=band_data['Date'], y=band_data['High'],
+                mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'
+            ))
+            fig.add_trace(go.Scatter(
+                x=band_data['Date'], y=band_data['Low'],
+                mode='lines', line=dict(width=0), fill='tonexty', fillcolor=band_colors[name],
+                name=f"{name} 95% CI", hoverinfo='skip'
+            ))
+
+    # Add all visible protocol change markers in a single layout update
+    change_shapes, change_annotations = summary.events.to_layout(x_range=visible_range)
+
+    fig.update_layout(
+        height=400,
+        xaxis_title="Day of Experiment",
+        yaxis_title="Score",
+        yaxis_range=[0, 100],
+        legend_title="Score Type",
+        hovermode="x unified",
+        shapes=change_shapes,
+        annotations=change_annotations
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+
+@timed_fragment("Differential Expression")
+def render_differential_expression(store, experiment_id, protocol_events, start_date):
+    """Volcano plot of the genes that changed across a protocol change or between two timepoints"""
+    calendar = timepoint_calendar(store, experiment_id, start_date)
+    labels = sorted(calendar, key=calendar.get)
+    if len(labels) < 2:
+        st.info("Differential expression needs cells from at least two timepoints.")
+        return
+    dates = pd.Series(calendar).sort_values()
+    
+    # Each protocol change compares the timepoints since the previous change with those up to the next one
+    comparisons = {}
+    for i in range(len(protocol_events)):
+        start = protocol_events.starts[i]
+        previous = protocol_events.starts[i - 1] if i > 0 else None
+        following = protocol_events.starts[i + 1] if i + 1 < len(protocol_events) else None
+        before = dates[(dates < start) & ((dates >= previous) if previous is not None else True)].index.tolist()
+        after = dates[(dates >= start) & ((dates < following) if following is not None else True)].index.tolist()
+        if before and after:
+            label = protocol_events.descriptions[i] or "Protocol change"
+            comparisons[f"{label} ({pd.Timestamp(start):%Y-%m-%d})"] = (before, after)
+    
+    options = list(comparisons) + ["Two timepoints"]
+    choice = st.selectbox("Compare:", options, key=f"de_comparison_{experiment_id}")
+    if choice == "Two timepoints":
+        pick_cols = st.columns(2)
+        with pick_cols[0]:
+            before = [st.selectbox("Reference timepoint", labels, index=0, key=f"de_before_{experiment_id}")]
+        with pick_cols[1]:
+            after = [st.selectbox("Test timepoint", labels, index=len(labels) - 1, key=f"de_after_{experiment_id}")]
+        if before == after:
+            st.info("Pick two different timepoints.")
+            return
+    else:
+        before, after = comparisons[choice]
+    
+    # Whole-transcriptome tests take a few seconds the first time; later views read the cached result
+    with st.spinner("Comparing expression across all genes..."):
+        de = load_differential_expression(store, experiment_id, before, after)
+    
+    de = de.assign(neg_log10_padj=-np.log10(de["padj"].clip(lower=1e-300)))
+    de["Call"] = np.where(de["significant"], np.where(de["log2fc"] > 0, "Up", "Down"), "Not significant")
+    fig = px.scatter(
+        de,
+        x="log2fc",
+        y="neg_log10_padj",
+        color="Call",
+        color_discrete_map={"Up": "#FF4B4B", "Down": "#4257B2", "Not significant": "#CCCCCC"},
+        hover_name="gene",
+        hover_data={"log2fc": ":.2f", "padj": ":.2e", "pct_a": ":.1f", "pct_b": ":.1f", "neg_log10_padj": False, "Call": False},
+        labels={"log2fc": "log2 fold change", "neg_log10_padj": "-log10 adjusted p"},
+        render_mode="webgl"
+    )
+    top = de[de["significant"]].nsmallest(10, "padj")
+    fig.update_layout(
+        height=400,
+        legend_title="",
+        annotations=[
+            dict(x=row.log2fc, y=row.neg_log10_padj, text=row.gene, showarrow=False, yshift=10, font=dict(size=10))
+            for row in top.itertuples()
+        ]
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(
+        f"{', '.join(before)} vs {', '.join(after)}: {int((de['Call'] == 'Up').sum()):,} genes up, "
+        f"{int((de['Call'] == 'Down').sum()):,} down (Welch t-test on log-normalized expression, BH-adjusted p < 0.05)"
+    )
+
+
+@counted_cache_data("signature_scores", show_spinner=False)
+def timepoint_signature_scores(experiment_id, data_version, gene_sets, method, start_date):
+    """Mean score of every signature at every timepoint, cached per data version, signatures and method"""
+    store = get_experiment_store()
+    names = [name for name, _ in gene_sets]
+    scores = score_gene_sets(store, experiment_id, dict(gene_sets), method)
+    means = scores.groupby("Timepoint")[names].mean().reset_index()
+    means["Date"] = means["Timepoint"].map(timepoint_calendar(store, experiment_id, start_date))
+    return means.melt(id_vars=["Date", "Timepoint"], var_name="Signature", value_name="Score").sort_values("Date")
+
+
+@timed_fragment("Signature Scores")
+def render_signature_scores(store, experiment_id, start_date):
+    """Per-timepoint gene-set scores of the built-in signatures and one user-defined signature"""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        selected = st.multiselect("Signatures", list(GENE_SETS), default=list(GENE_SETS), key=f"signatures_{experiment_id}")
+    with col2:
+        method = st.radio("Score", ["Rank", "Mean-centered"], key=f"signature_method_{experiment_id}")
+    with st.expander("Custom signature"):
+        custom_name = st.text_input("Name", value="Custom", key=f"custom_signature_name_{experiment_id}")
+        custom_genes = st.text_area("Genes", placeholder="e.g. HLF, MECOM, PROCR, CRHBP", key=f"custom_signature_genes_{experiment_id}")
+
+    gene_sets = [(name, GENE_SETS[name]) for name in selected]
+    symbols = tuple(dict.fromkeys(g.strip().upper() for g in custom_genes.replace("\n", ",").split(",") if g.strip()))
+    if symbols and custom_name and custom_name not in selected:
+        gene_sets.append((custom_name, symbols))
+    if not gene_sets:
+        st.info("Pick at least one signature.")
+        return
+
+    with st.spinner("Scoring cells..."):
+        scores = timepoint_signature_scores(
+            experiment_id, store.cell_data_version(experiment_id), tuple(gene_sets),
+            "rank" if method == "Rank" else "mean", start_date
+        )
+    missing = scores.groupby("Signature")["Score"].apply(lambda s: s.isna().all())
+    if missing.any():
+        st.warning(f"No genes of {', '.join(missing[missing].index)} were found in the uploaded cells.")
+
+    fig = px.line(scores.dropna(subset=["Score"]), x="Date", y="Score", color="Signature", markers=True, hover_data={"Timepoint": True})
+    fig.update_layout(height=350, legend_title="", margin=dict(l=10, r=10, t=10, b=10))
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(
+        "Mean per-cell score at each timepoint. Rank scores compare the within-cell ranks of a signature's genes "
+        "with random genes (0 = no enrichment); mean-centered scores are log-normalized expression relative to all cells."
+    )
+
+
+def format_call(call):
+    """An ingested sample's call for one model, with the share of cells or the probability behind it"""
+    if call["class"] is None:
+        return None
+    if call["per_cell"]:
+        return f"{call['class']} ({call['support']:.0%} of cells)"
+    return f"{call['class']} ({call['support']:.2f})"
+
+
+selected_exp = selected_experiment()
+if selected_exp is None:
+    render_no_experiment()
+else:
+    # Display experiment-specific dashboard
+    st.title(f"Experiment: {selected_exp['name']}")
+    store = get_experiment_store()
+    summary = load_experiment_data(selected_exp)
+    render_experiment_tabs(selected_exp['id'], "Overview")
+    
+    # File uploader section
+    render_upload(store, selected_exp['id'], selected_exp.get('created_at'))
+    
+    # Samples processed by the background ingestion service (ingest_service.py)
+    ingested = store.read_predictions(selected_exp['id'])
+    st.caption(f"Batch drops for this experiment go in a folder named `{selected_exp['id']}` in the watched directory.")
+    if ingested:
+        st.markdown("#### Ingested Samples")
+        st.dataframe(
+            pd.DataFrame([
+                {
+                    "Sample": result["sample"],
+                    "Cells": result["qc"]["n_cells"],
+                    "Cells Passing QC": result["qc"]["n_cells_passed"],
+                    "HSC Fate": format_call(result["calls"]["hsc"]),
+                    "Lineage Bias": format_call(result["calls"]["lineage"]),
+                    "Ingested": result["ingested_at"]
+                }
+                for result in ingested
+            ]),
+            hide_index=True,
+            use_container_width=True
+        )
+
+    st.markdown("---")
+
+    # Get latest data for metrics
+    latest_data = summary.latest
+    previous_data = summary.previous
+
+    # Top metrics row - Key metrics section
+    st.markdown("### Key Metrics")
+    col1, col2 = st.columns(2)
+
+    # Self-renewal score
+    with col1:
+        current_self_renewal = latest_data["Self_Renewal_Score"]
+        previous_self_renewal = previous_data["Self_Renewal_Score"]
+        delta = current_self_renewal - previous_self_renewal
+        
+        st.metric(
+            label="Self-Renewal Score",
+            value=f"{current_self_renewal:.1f}",
+            delta=f"{delta:.1f}",
+            delta_color="normal"
+        )
+        
+        st.markdown(f"""
+        <div style="font-size:0.8rem; color: #666;">
+        Based on proliferation rate and CD34 expression{format_band(latest_data, "Self_Renewal_Score")}
+        </div>
+        """, unsafe_allow_html=True)
+
+    # Multipotency score
+    with col2:
+        current_multipotency = latest_data["Multipotency_Score"]
+        previous_multipotency = previous_data["Multipotency_Score"]
+        delta = current_multipotency - previous_multipotency
+        
+        st.metric(
+            label="Multipotency Score",
+            value=f"{current_multipotency:.1f}",
+            delta=f"{delta:.1f}",
+            delta_color="normal"
+        )
+        
+        st.markdown(f"""
+        <div style="font-size:0.8rem; color: #666;">
+        Based on lineage marker diversity in differentiation assays{format_band(latest_data, "Multipotency_Score")}
+        </div>
+        """, unsafe_allow_html=True)
+
+    st.markdown("---")
+    
+    # Score Trends with selection
+    render_score_trends(summary, selected_exp['id'])
+    
+    # Uploaded cells: record protocol changes against real timepoints and test what they changed
+    if summary.has_cells:
+        with st.expander("Record Protocol Change"):
+            with st.form(f"protocol_change_form_{selected_exp['id']}"):
+                change_date = st.date_input("Date of change", value=summary.last_date.date())
+                change_description = st.text_input("Change", placeholder="e.g. Added 10 ng/mL FLT3L")
+                change_target = st.text_input("Target", placeholder="e.g. Increase lymphoid potential")
+                if st.form_submit_button("Record") and change_description:
+                    with store.experiment_lock(selected_exp['id']):
+                        recorded = store.read_meta(selected_exp['id']).get("protocol_changes", [])
+                        recorded.append({"date": str(change_date), "change": change_description, "target": change_target})
+                        store.write_meta(selected_exp['id'], protocol_changes=sorted(recorded, key=lambda c: c["date"]))
+                    st.rerun()
+        
+        st.markdown("### Differential Expression")
+        render_differential_expression(store, selected_exp['id'], summary.events, selected_exp.get('created_at'))
+
+        st.markdown("### Signature Scores")
+        render_signature_scores(store, selected_exp['id'], selected_exp.get('created_at'))
+
+    # Gene Expression Bar Graph
+    st.markdown("### Highest Expressed Genes")
+
+    # The summary ranks the genes of every timepoint at ingestion; take the latest top 10
+    gene_df = summary.top_genes()[['Gene', 'Expression']]
+
+    # Create a color map based on gene function
+    gene_categories = {
+        'CD34': 'Stem Cell', 'KIT': 'Stem Cell', 'BMI1': 'Stem Cell', 'HOXA9': 'Stem Cell',
+        'PU.1': 'Myeloid', 'CEBPA': 'Myeloid',
+        'FLT3': 'Lymphoid', 'IL7R': 'Lymphoid',
+        'GATA1': 'Erythroid', 'KLF1': 'Erythroid',
+        'GATA2': 'Multipotency', 'RUNX1': 'Multipotency', 'TAL1': 'Multipotency', 
+        'MYB': 'Multipotency', 'MECOM': 'Multipotency', 'MPL': 'Multipotency', 'MEIS1': 'Multipotency'
+    }
+
+    # Add category column to the DataFrame
+    gene_df['Category'] = gene_df['Gene'].map(lambda x: gene_categories.get(x, 'Other'))
+
+    # Create a color map for the categories
+    color_map = {
+        'Stem Cell': '#4257B2',  # Blue
+        'Myeloid': '#FF9500',   # Orange
+        'Lymphoid': '#00CC96',  # Green
+        'Erythroid': '#FF4B4B',  # Red
+        'Multipotency': '#9D50BB',  # Purple
+        'Other': '#999999'      # Gray
+    }
+
+    # Create the bar chart
+    fig = px.bar(
+        gene_df,
+        x='Gene',
+        y='Expression',
+        color='Category',
+        color_discrete_map=color_map,
+        text_auto=True,
+        title="Top 10 Expressed Genes"
+    )
+
+    # Update layout
+    fig.update_layout(
+        height=400,
+        xaxis_title="Gene",
+        yaxis_title="Expression Level",
+        legend_title="Gene Category",
+        hovermode="closest"
+    )
+
+    # Add tooltips with gene function
+    gene_functions = {
+        'CD34': 'Cell surface glycoprotein and stem cell marker',
+        'KIT': 'Receptor tyrosine kinase essential for HSC maintenance',
+        'BMI1': 'Polycomb complex protein involved in self-renewal',
+        'HOXA9': 'Homeobox protein crucial for HSC expansion',
+        'PU.1': 'Transcription factor essential for myeloid development',
+        'CEBPA': 'Transcription factor involved in myeloid differentiation',
+        'FLT3': 'Receptor tyrosine kinase important for lymphoid development',
+        'IL7R': 'Interleukin-7 receptor involved in lymphoid commitment',
+        'GATA1': 'Transcription factor essential for erythroid development',
+        'KLF1': 'Krüppel-like factor 1, regulates erythroid maturation',
+        'GATA2': 'Transcription factor required for HSC maintenance and multipotency',
+        'RUNX1': 'Transcription factor essential for definitive hematopoiesis',
+        'TAL1': 'Basic helix-loop-helix transcription factor for blood development',
+        'MYB': 'Transcription factor involved in progenitor proliferation',
+        'MECOM': 'Transcription regulator of HSC quiescence and self-renewal',
+        'MPL': 'Thrombopoietin receptor important for HSC maintenance',
+        'MEIS1': 'Homeobox protein that regulates HSC self-renewal'
+    }
+
+    # Update hover template to include gene function
+    fig.update_traces(
+        hovertemplate='<b>%{x}</b><br>Expression: %{y}<br>Function: ' + 
+        gene_df['Gene'].map(lambda x: gene_functions.get(x, 'Unknown')).to_list()[0]
+    )
+
+    # Display the chart
+    st.plotly_chart(fig, use_container_width=True)
+
+    # Add a note about gene expression
+    with st.expander("About Gene Expression Data"):
+        st.markdown("""
+        **Gene Expression Categories:**
+        - **Stem Cell**: Genes associated with HSC identity and self-renewal
+        - **Myeloid**: Genes involved in myeloid lineage commitment and differentiation
+        - **Lymphoid**: Genes involved in lymphoid lineage commitment and differentiation
+        - **Erythroid**: Genes involved in erythroid lineage commitment and differentiation
+        - **Multipotency**: Genes associated with maintaining multilineage potential
+        
+        Expression values represent normalized counts from single-cell RNA sequencing data.
+        Higher values indicate stronger expression of the gene in the HSC population.
+        """)
+
+    st.markdown("---")
+
+    # Lineage Distribution and Map
+    col1, col2 = st.columns(2)
+
+    # Lineage Distribution Bar Graph
+    with col1:
+        st.subheader("Lineage Marker Distribution")
+        
+        # Create a bar chart for lineage distribution
+        lineage_data = {
+            'Lineage': ['Myeloid', 'Lymphoid', 'Erythroid'],
+            'Percentage': [
+                latest_data['Myeloid_Percentage'],
+                latest_data['Lymphoid_Percentage'],
+                latest_data['Erythroid_Percentage']
+            ]
+        }
+        lineage_df = pd.DataFrame(lineage_data)
+        
+        # Bootstrap intervals as error bars when the data comes from uploaded cells
+        error_bars = {}
+        if "Myeloid_Percentage_Low" in summary.tiles.columns:
+            low = [latest_data[f"{lineage}_Percentage_Low"] for lineage in lineage_df['Lineage']]
+            high = [latest_data[f"{lineage}_Percentage_High"] for lineage in lineage_df['Lineage']]
+            lineage_df['Error_Plus'] = np.array(high) - lineage_df['Percentage']
+            lineage_df['Error_Minus'] = lineage_df['Percentage'] - np.array(low)
+            error_bars = {"error_y": "Error_Plus", "error_y_minus": "Error_Minus"}
+        
+        fig = px.bar(
+            lineage_df, 
+            x='Lineage',
+            y='Percentage',
+            color='Lineage',
+            color_discrete_map={
+                'Myeloid': '#4257B2',
+                'Lymphoid': '#00CC96',
+                'Erythroid': '#FF4B4B'
+            },
+            text_auto='.1f',
+            **error_bars
+        )
+        fig.update_layout(margin=dict(l=10, r=10, t=10, b=10), height=300)
+        fig.update_traces(texttemplate='%{y:.1f}%', textposition='outside')
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Lineage Bias Map (Ternary Plot)
+    with col2:
+        st.subheader("Lineage Bias Map")
+        
+        # Create a ternary plot for lineage bias
+        fig = go.Figure()
+        
+        # Add the trajectory as a scatter plot
+        lineage = summary.lineage
+        fig.add_trace(go.Scatterternary(
+            a=lineage['Myeloid_Percentage'],
+            b=lineage['Lymphoid_Percentage'],
+            c=lineage['Erythroid_Percentage'],
+            mode='lines+markers',
+            line=dict(color='#4257B2', width=2),
+            marker=dict(
+                symbol='circle',
+                size=8,
+                color=np.arange(len(lineage)),
+                colorscale='Viridis',
+                line=dict(width=1, color='#FFFFFF')
+            ),
+            text=lineage['Date'].dt.strftime('%Y-%m-%d'),
+            hovertemplate='Date: %{text}<br>Myeloid: %{a:.1f}%<br>Lymphoid: %{b:.1f}%<br>Erythroid: %{c:.1f}%<extra></extra>'
+        ))
+        
+        # Add the current position as a larger marker
+        fig.add_trace(go.Scatterternary(
+            a=[latest_data['Myeloid_Percentage']],
+            b=[latest_data['Lymphoid_Percentage']],
+            c=[latest_data['Erythroid_Percentage']],
+            mode='markers',
+            marker=dict(
+                symbol='circle',
+                size=15,
+                color='red',
+                line=dict(width=2, color='#FFFFFF')
+            ),
+            name='Current',
+            hovertemplate='Current Position<br>Myeloid: %{a:.1f}%<br>Lymphoid: %{b:.1f}%<br>Erythroid: %{c:.1f}%<extra></extra>'
+        ))
+        
+        # Add regions with labels
+        fig.add_trace(go.Scatterternary(
+            a=[80, 20, 30],
+            b=[10, 70, 20],
+            c=[10, 10, 50],
+            mode='text',
+            text=['Myeloid<br>Dominant', 'Lymphoid<br>Dominant', 'Erythroid<br>Dominant'],
+            textposition="middle center",
+            textfont=dict(size=10, color='black'),
+            showlegend=False
+        ))
+        
+        # Update the layout
+        fig.update_layout(
+            ternary=dict(
+                aaxis=dict(title='Myeloid %', min=0, linewidth=2, gridwidth=1),
+                baxis=dict(title='Lymphoid %', min=0, linewidth=2, gridwidth=1),
+                caxis=dict(title='Erythroid %', min=0, linewidth=2, gridwidth=1)
+            ),
+            height=300,
+            margin=dict(l=20, r=20, t=20, b=20)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Lineage bias assessment
+    st.subheader("Lineage Bias Assessment")
+    myeloid_pct = latest_data['Myeloid_Percentage']
+    if myeloid_pct > 70:
+        st.warning(f"**Current bias:** {myeloid_pct:.1f}% myeloid (high)")
+        st.info("**Suggestion:** Reduce SCF by 20% to balance lymphoid potential")
+    elif latest_data['Lymphoid_Percentage'] > 70:
+        st.warning(f"**Current bias:** {latest_data['Lymphoid_Percentage']:.1f}% lymphoid (high)")
+        st.info("**Suggestion:** Add IL-3 to enhance myeloid differentiation")
+    elif latest_data['Erythroid_Percentage'] > 50:
+        st.warning(f"**Current bias:** {latest_data['Erythroid_Percentage']:.1f}% erythroid (high)")
+        st.info("**Suggestion:** Reduce EPO to balance lineage output")
+    else:
+        st.success("**Current bias:** Relatively balanced lineage output")
+        st.info("**Suggestion:** Maintain current cytokine ratios")
+
+    # Exports are streamed from the store by the export server rather than built in memory
+    with st.expander("Export Data"):
+        render_export_links(selected_exp['id'], [
+            ("timeseries", "Experiment time series"),
+            ("predictions", "Predictions")
+        ])
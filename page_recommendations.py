@@ -0,0 +1,170 @@
+"""
+Protocol Recommendations page: constrained protocol search and the protocol assistant chat.
+
+Both panels are fragments, so searching or sending a message reruns only that panel.
+"""
+import datetime
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from protocol_search import search_protocols, describe_protocol, FACTORS
+from dash_common import (
+    selected_experiment, load_experiment_data, render_experiment_tabs, render_no_experiment,
+    render_export_links, get_experiment_store, generate_protocol_response, counted_cache_data
+)
+from rerun_timings import timed_fragment
+
+LINEAGE_TARGETS = {
+    "Balanced": {"myeloid": 100 / 3, "lymphoid": 100 / 3, "erythroid": 100 / 3},
+    "Myeloid-biased": {"myeloid": 60, "lymphoid": 25, "erythroid": 15},
+    "Lymphoid-biased": {"myeloid": 25, "lymphoid": 60, "erythroid": 15},
+    "Erythroid-biased": {"myeloid": 25, "lymphoid": 15, "erythroid": 60},
+}
+
+@counted_cache_data("protocol_search", show_spinner=False)
+def run_protocol_search(baseline, no_small_molecules, budget, max_factors, lineage_target):
+    """Pareto set of factor combinations for the culture's current state, cached per set of inputs"""
+    constraints = {"no_small_molecules": no_small_molecules, "budget": budget, "max_factors": max_factors}
+    return search_protocols(dict(baseline), constraints, lineage_target=LINEAGE_TARGETS[lineage_target])
+
+
+@timed_fragment("Protocol Search")
+def render_protocol_search(latest_data, experiment_id):
+    """Search form and the Pareto set it found"""
+    with st.form(key=f"search_form_{experiment_id}"):
+        col1, col2 = st.columns(2)
+        with col1:
+            budget = st.number_input("Budget per litre of medium ($)", min_value=0.0, value=300.0, step=25.0)
+            max_factors = st.slider("Maximum number of factors", 1, len(FACTORS), 5)
+        with col2:
+            lineage_target = st.selectbox("Lineage target", list(LINEAGE_TARGETS))
+            no_small_molecules = st.checkbox("No small molecules")
+        search_button = st.form_submit_button("Search Protocols")
+
+    if search_button:
+        baseline = (
+            ("self_renewal", float(latest_data["Self_Renewal_Score"])),
+            ("multipotency", float(latest_data["Multipotency_Score"])),
+            ("myeloid", float(latest_data["Myeloid_Percentage"])),
+            ("lymphoid", float(latest_data["Lymphoid_Percentage"])),
+            ("erythroid", float(latest_data["Erythroid_Percentage"]))
+        )
+        with st.spinner("Searching factor combinations..."):
+            st.session_state[f"protocol_search_{experiment_id}"] = run_protocol_search(
+                baseline, no_small_molecules, budget, max_factors, lineage_target
+            )
+
+    if f"protocol_search_{experiment_id}" in st.session_state:
+        front, n_total, n_scored = st.session_state[f"protocol_search_{experiment_id}"]
+        if front.empty:
+            st.warning("No factor combination fits these constraints.")
+        else:
+            st.caption(
+                f"{n_total:,} combinations, {n_scored:,} within constraints, "
+                f"{len(front):,} on the Pareto front. Predictions come from a heuristic surrogate model."
+            )
+            fig = px.scatter(
+                front, x="Self_Renewal", y="Multipotency", color="Cost",
+                hover_data=["Lineage_Deviation", "Factors"],
+                labels={"Self_Renewal": "Predicted Self-Renewal", "Multipotency": "Predicted Multipotency"},
+                color_continuous_scale="Viridis_r"
+            )
+            fig.update_layout(height=350, margin=dict(l=20, r=20, t=20, b=20))
+            st.plotly_chart(fig, use_container_width=True)
+            
+            top = front.head(10)
+            st.dataframe(
+                pd.DataFrame({
+                    "Protocol": top.apply(describe_protocol, axis=1),
+                    "Self-Renewal": top["Self_Renewal"].round(1),
+                    "Multipotency": top["Multipotency"].round(1),
+                    "Myeloid %": top["Myeloid_Percentage"].round(1),
+                    "Lymphoid %": top["Lymphoid_Percentage"].round(1),
+                    "Erythroid %": top["Erythroid_Percentage"].round(1),
+                    "Cost ($/L)": top["Cost"].round(0)
+                }),
+                hide_index=True,
+                use_container_width=True
+            )
+
+
+@timed_fragment("Chat")
+def render_chat(store, df, experiment_id):
+    """Protocol assistant chat history and input form"""
+    # Initialize chat history in session state if it doesn't exist
+    if f"chat_history_{experiment_id}" not in st.session_state:
+        st.session_state[f"chat_history_{experiment_id}"] = [
+            {"role": "assistant", "content": "Hello! I'm your protocol assistant. I can help you optimize your HSC expansion protocol based on your current data. What would you like to know?"}
+        ]
+    
+    # Chat history is drawn above the form once any new message has been added
+    history = st.container()
+    
+    # Chat input with form to prevent rerun issues
+    with st.form(key=f"chat_form_{experiment_id}", clear_on_submit=True):
+        user_input = st.text_input("Ask about protocol recommendations...", key=f"chat_input_{experiment_id}")
+        submit_button = st.form_submit_button("Send")
+    
+    if submit_button and user_input:
+        # Add user message to chat history and the experiment's persistent log
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        st.session_state[f"chat_history_{experiment_id}"].append({"role": "user", "content": user_input})
+        store.append_chat_message(experiment_id, "user", user_input, timestamp)
+        
+        # Generate assistant response based on experiment data
+        response = generate_protocol_response(user_input, df)
+        
+        # Add assistant response to chat history
+        st.session_state[f"chat_history_{experiment_id}"].append({"role": "assistant", "content": response})
+        store.append_chat_message(experiment_id, "assistant", response, timestamp)
+    
+    # Display chat history
+    with history:
+        for message in st.session_state[f"chat_history_{experiment_id}"]:
+            if message["role"] == "assistant":
+                st.markdown(f"<div class='assistant-msg'><strong>Protocol Assistant:</strong> {message['content']}</div>", unsafe_allow_html=True)
+            else:
+                st.markdown(f"<div class='user-msg'><strong>You:</strong> {message['content']}</div>", unsafe_allow_html=True)
+
+
+selected_exp = selected_experiment()
+if selected_exp is None:
+    render_no_experiment()
+else:
+    st.title(f"Experiment: {selected_exp['name']}")
+    store = get_experiment_store()
+    summary = load_experiment_data(selected_exp)
+    render_experiment_tabs(selected_exp['id'], "Protocol Recommendations")
+    
+    st.markdown("## Protocol Recommendations")
+    
+    # Search factor combinations for the culture's latest state
+    with st.expander("Protocol Search", expanded=False):
+        render_protocol_search(summary.latest, selected_exp['id'])
+    
+    # Display chat messages with custom styling
+    st.markdown("""<style>
+    .assistant-msg {
+        background-color: #f0f7ff;
+        border-radius: 10px;
+        padding: 10px 15px;
+        margin-bottom: 10px;
+        border-left: 4px solid #4257B2;
+    }
+    .user-msg {
+        background-color: #f5f5f5;
+        border-radius: 10px;
+        padding: 10px 15px;
+        margin-bottom: 10px;
+        margin-left: 50px;
+        border-left: 4px solid #00CC96;
+    }
+    </style>""", unsafe_allow_html=True)
+    
+    # The assistant only looks at the latest timepoint, which the summary's tiles hold
+    render_chat(store, summary.tiles, selected_exp['id'])
+    
+    with st.expander("Export Conversation"):
+        render_export_links(selected_exp['id'], [("chat", "Conversation log")])
@@ -0,0 +1,61 @@
+"""Welcome page shown before an experiment is opened"""
+import streamlit as st
+
+# Add custom CSS for centering content
+st.markdown("""
+<style>
+.welcome-container {
+    display: flex;
+    flex-direction: column;
+    justify-content: center;
+    align-items: center;
+    text-align: center;
+    padding: 2rem;
+    max-width: 800px;
+    margin: 0 auto;
+    margin-top: 3rem;
+}
+.welcome-header {
+    margin-bottom: 2rem;
+}
+.welcome-heading {
+    font-family: 'Space Grotesk', sans-serif !important;
+    font-weight: 600;
+    font-size: 2.5rem;
+    color: #4257B2;
+    text-align: center;
+}
+.welcome-content {
+    margin-bottom: 3rem;
+}
+.welcome-button {
+    margin-top: 1rem;
+}
+</style>
+""", unsafe_allow_html=True)
+
+# Welcome page with centered content
+st.markdown("""
+<div class="welcome-container" style="padding-bottom: 0.1rem;">
+    <div class="welcome-header">
+        <h1 class='welcome-heading'>Good morning, Christian.</h1>
+        <h2>Welcome to Osiris!</h2>
+        <h3>Click "New Experiment" to get started.</h3>
+    </div>
+</div>
+<script>
+    const targetElement = document.getElementById('welcome-heading');
+    const text = "Good morning, Christian";
+    let i = 0;
+
+    function typeText() {
+        if (i < text.length) {
+            targetElement.textContent += text.charAt(i);
+            i++;
+            setTimeout(typeText, 80);
+        }
+    }
+
+    typeText();
+</script>
+""", unsafe_allow_html=True)
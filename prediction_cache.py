@@ -0,0 +1,307 @@
+"""
+Incremental predictions backed by a content-addressed cache of results.
+
+Every cell of an aligned upload is fingerprinted from its expression over the
+model's genes and the manifest version, and per-cell predictions are kept in
+the experiment store under those fingerprints. A later upload to the same
+experiment, typically the same time course with one more timepoint, only
+sends the cells that have not been seen before; the others are read back
+from the cache and merged with the new results.
+
+Predictions of backends without per-cell output are cached under the
+fingerprint of the whole aligned file, so re-running an unchanged file does
+not reach the backend at all.
+
+An experiment's per-cell results are kept per sample (uploaded file name): a
+new file adds its cells, and uploading a file with the same name again
+replaces that sample's cells. Whole-file results are recorded per sample too,
+so every session can show an experiment's latest results, not only the one
+that uploaded them.
+"""
+import io
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from prediction_client import (
+    DEFAULT_BACKEND_URL, GENE_COLUMN_NAMES, PREDICTION_MODELS, PredictionArrays,
+    post_prediction, decode_prediction_response
+)
+
+# Frames in the experiment store: predictions by fingerprint, the cells of every
+# sample, and the whole-file result of every sample in upload order
+CACHE_FRAME = "prediction_cache"
+CELLS_FRAME = "prediction_cells"
+SAMPLES_FRAME = "prediction_samples"
+CACHE_COLUMNS = ["fingerprint", "model", "class", "probability"]
+CELLS_COLUMNS = ["sample", "cell", "fingerprint"]
+SAMPLES_COLUMNS = ["sample", "fingerprint"]
+
+FINGERPRINT_BYTES = 16
+
+
+def _digest(*parts):
+    digest = hashlib.blake2b(digest_size=FINGERPRINT_BYTES)
+    for part in parts:
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def read_aligned_table(content, sep="\t"):
+    """
+    Parse a table produced by align_table.
+
+    Returns:
+    --------
+    tuple
+        (table as parsed, cells x genes float32 matrix, cell names, whether genes are rows)
+    """
+    table = pd.read_csv(io.BytesIO(content), sep=sep, index_col=0)
+    genes_as_rows = str(table.index.name).strip().lower() in GENE_COLUMN_NAMES
+    if genes_as_rows:
+        matrix = np.ascontiguousarray(table.to_numpy(dtype=np.float32).T)
+        cells = table.columns.astype(str).to_numpy(dtype=object)
+    else:
+        matrix = np.ascontiguousarray(table.to_numpy(dtype=np.float32))
+        cells = table.index.astype(str).to_numpy(dtype=object)
+    return table, matrix, cells, genes_as_rows
+
+
+def cell_fingerprints(matrix, version=None):
+    """Fingerprint of every row of a cells x genes matrix aligned to manifest ``version``"""
+    salt = str(version).encode()
+    return np.array([_digest(salt, row.tobytes()) for row in matrix], dtype=object)
+
+
+def subset_table(table, positions, genes_as_rows, sep="\t"):
+    """Serialize only the cells at ``positions`` of a parsed aligned table, keeping its layout"""
+    subset = table.iloc[:, positions] if genes_as_rows else table.iloc[positions]
+    buffer = io.StringIO()
+    subset.to_csv(buffer, sep=sep)
+    return buffer.getvalue().encode()
+
+
+def _arrays_from_rows(rows, cells=None):
+    """PredictionArrays of one model from cache rows, with per-row cell labels for per-cell output"""
+    codes, names = pd.factorize(rows["class"])
+    return PredictionArrays(
+        codes.astype(np.int32),
+        names,
+        rows["probability"].to_numpy(dtype=np.float32),
+        cells
+    )
+
+
+def _prediction_rows(arrays, fingerprints):
+    """Cache rows of one model's predictions; ``fingerprints`` holds the fingerprint of each row"""
+    return pd.DataFrame({
+        "fingerprint": fingerprints,
+        "class": arrays.classes,
+        "probability": np.asarray(arrays.probabilities, dtype=np.float32)
+    })
+
+
+def _match_cells(arrays, sent_cells):
+    """Position in ``sent_cells`` of every row of per-cell output"""
+    codes, names = pd.factorize(arrays.cells)
+    index = pd.Index(sent_cells)
+    positions = index.get_indexer(names) if index.is_unique else np.full(len(names), -1)
+    if (positions < 0).any():
+        # Backends that number cells instead of echoing their names answer in upload order
+        if len(names) != len(sent_cells):
+            raise ValueError(f"The backend returned predictions for {len(names):,} cells but {len(sent_cells):,} were sent")
+        positions = np.arange(len(names))
+    return positions[codes]
+
+
+class PredictionCache:
+    """
+    Predictions of one experiment keyed by content fingerprint, kept as frames in the experiment store.
+
+    Parameters:
+    -----------
+    store : ExperimentStore
+        Store holding the experiment
+    experiment_id : str
+        Experiment the predictions belong to
+    """
+
+    def __init__(self, store, experiment_id):
+        self.store = store
+        self.experiment_id = experiment_id
+
+    def _read(self, name, columns):
+        if not self.store.has_frame(self.experiment_id, name):
+            return pd.DataFrame({column: pd.Series(dtype=object) for column in columns})
+        return self.store.read_frame(self.experiment_id, name)
+
+    def get(self, fingerprints):
+        """Cached rows of the given fingerprints"""
+        cached = self._read(CACHE_FRAME, CACHE_COLUMNS)
+        return cached[cached["fingerprint"].isin(fingerprints)]
+
+    def known(self, fingerprints):
+        """Boolean mask of the fingerprints that have cached predictions"""
+        return pd.Index(fingerprints).isin(self._read(CACHE_FRAME, ["fingerprint"])["fingerprint"])
+
+    def put(self, rows):
+        """Add cache rows, replacing what was cached for the same fingerprints"""
+        # Identical cells share a fingerprint; one row per class is kept, or merges would multiply them
+        rows = rows.drop_duplicates(["fingerprint", "model", "class"])
+        with self.store.experiment_lock(self.experiment_id):
+            cached = self._read(CACHE_FRAME, CACHE_COLUMNS)
+            cached = cached[~cached["fingerprint"].isin(rows["fingerprint"].unique())]
+            self.store.write_frame(self.experiment_id, CACHE_FRAME, pd.concat([cached, rows[CACHE_COLUMNS]], ignore_index=True))
+
+    def set_sample_cells(self, sample, cells, fingerprints):
+        """Record the cells of one sample, replacing those of an earlier upload with the same name"""
+        with self.store.experiment_lock(self.experiment_id):
+            recorded = self._read(CELLS_FRAME, CELLS_COLUMNS)
+            recorded = recorded[recorded["sample"] != sample]
+            added = pd.DataFrame({"sample": sample, "cell": cells, "fingerprint": fingerprints})
+            self.store.write_frame(self.experiment_id, CELLS_FRAME, pd.concat([recorded, added], ignore_index=True))
+
+    def set_sample_result(self, sample, fingerprint):
+        """Record the whole-file result of one sample as its latest upload"""
+        with self.store.experiment_lock(self.experiment_id):
+            recorded = self._read(SAMPLES_FRAME, SAMPLES_COLUMNS)
+            recorded = recorded[recorded["sample"] != sample]
+            added = pd.DataFrame({"sample": [sample], "fingerprint": [fingerprint]})
+            self.store.write_frame(self.experiment_id, SAMPLES_FRAME, pd.concat([recorded, added], ignore_index=True))
+
+    def latest_sample_arrays(self):
+        """Whole-file predictions of the sample uploaded last, by model, or None"""
+        recorded = self._read(SAMPLES_FRAME, SAMPLES_COLUMNS)
+        if not len(recorded):
+            return None
+        rows = self.get([recorded["fingerprint"].iloc[-1]])
+        return {model: _arrays_from_rows(rows[rows["model"] == model]) for model in PREDICTION_MODELS}
+
+    def experiment_arrays(self):
+        """
+        Per-cell predictions of every sample of the experiment, by model.
+
+        Cells are labelled ``<sample>/<cell>`` once the experiment has more
+        than one sample, so equal barcodes of different samples stay apart.
+        """
+        cells = self._read(CELLS_FRAME, CELLS_COLUMNS)
+        rows = cells.merge(self._read(CACHE_FRAME, CACHE_COLUMNS), on="fingerprint", how="inner")
+        labels = rows["cell"] if cells["sample"].nunique() <= 1 else rows["sample"] + "/" + rows["cell"]
+        arrays = {}
+        for model in PREDICTION_MODELS:
+            in_model = (rows["model"] == model).to_numpy()
+            arrays[model] = _arrays_from_rows(rows[in_model], labels[in_model].to_numpy(dtype=object))
+        return arrays
+
+
+def predict_incremental(name, content, alignment, trace, cache, backend_url=DEFAULT_BACKEND_URL, session=None, timeout=300):
+    """
+    Predict an upload, sending the backend only what the experiment's cache has not seen.
+
+    Cells can only be compared once they are aligned to the model's genes, so
+    per-cell reuse needs the ``alignment`` report of prepare_upload; without a
+    feature manifest only identical files are reused.
+
+    Parameters:
+    -----------
+    name : str
+        File name, also the sample the cells are recorded under
+    content : bytes
+        The upload as prepared by prepare_upload
+    alignment : dict or None
+        Alignment report of prepare_upload
+    trace : Trace
+        Trace the fingerprint, network and decode spans are added to
+    cache : PredictionCache
+        Cache of the experiment the upload belongs to
+
+    Returns:
+    --------
+    dict
+        The decode_prediction_response structure, where the ``*_arrays`` of
+        per-cell output hold the merged predictions of every sample of the
+        experiment, plus ``n_cells``, ``n_cached`` and ``n_predicted``
+
+    Raises:
+    -------
+    requests.HTTPError
+        When the backend answers with an error status
+    """
+    version = (alignment or {}).get("manifest_version")
+    sep = "," if name.rsplit(".", 1)[-1].lower() == "csv" else "\t"
+    sample_fingerprint = _digest(b"sample", str(version).encode(), content)
+
+    # The same file was predicted before as a whole sample
+    cached = cache.get([sample_fingerprint])
+    if len(cached):
+        cache.set_sample_result(name, sample_fingerprint)
+        data = {"message": "Results reused from an identical earlier upload; nothing was sent.", "n_cells": 1, "n_cached": 1, "n_predicted": 0}
+        for model in PREDICTION_MODELS:
+            data[f"{model}_arrays"] = _arrays_from_rows(cached[cached["model"] == model])
+            data[f"{model}_predictions"] = data[f"{model}_arrays"].to_records()
+        return data
+
+    fingerprints = None
+    send_positions = None
+    if alignment is not None:
+        with trace.span("fingerprint"):
+            table, matrix, cells, genes_as_rows = read_aligned_table(content, sep)
+            fingerprints = cell_fingerprints(matrix, version)
+            known = cache.known(fingerprints)
+        # Cells with identical counts share a fingerprint, so each new fingerprint is sent once
+        _, first = np.unique(fingerprints[~known], return_index=True)
+        send_positions = np.flatnonzero(~known)[np.sort(first)]
+        trace.root["attributes"].update(cells=len(cells), cells_cached=int(known.sum()))
+
+    if send_positions is not None and len(send_positions) < len(fingerprints):
+        # Some cells were predicted before: send only the others, if any
+        payload = subset_table(table, send_positions, genes_as_rows, sep) if len(send_positions) else None
+    else:
+        payload = content
+
+    if payload is not None:
+        response = post_prediction(name, payload, trace, backend_url, session, timeout)
+        response.raise_for_status()
+        with trace.span("decode"):
+            data = decode_prediction_response(response)
+    else:
+        data = {"message": f"All {len(fingerprints):,} cells were predicted before; nothing was sent."}
+        data.update({f"{model}_arrays": None for model in PREDICTION_MODELS})
+
+    per_cell = payload is None or data["hsc_arrays"].per_cell
+    if not per_cell:
+        rows = [
+            _prediction_rows(data[f"{model}_arrays"], sample_fingerprint).assign(model=model)
+            for model in PREDICTION_MODELS
+        ]
+        cache.put(pd.concat(rows, ignore_index=True))
+        cache.set_sample_result(name, sample_fingerprint)
+        data.update(n_cells=1, n_cached=0, n_predicted=1)
+        return data
+    if fingerprints is None:
+        # Without a manifest cells cannot be fingerprinted; the results are shown but not kept
+        n_cells = len(pd.unique(data["hsc_arrays"].cells))
+        data.update(n_cells=n_cells, n_cached=0, n_predicted=n_cells)
+        return data
+
+    with trace.span("merge"):
+        if payload is not None:
+            rows = []
+            for model in PREDICTION_MODELS:
+                arrays = data[f"{model}_arrays"]
+                if len(arrays):
+                    positions = send_positions[_match_cells(arrays, cells[send_positions])]
+                    rows.append(_prediction_rows(arrays, fingerprints[positions]).assign(model=model))
+            if rows:
+                cache.put(pd.concat(rows, ignore_index=True))
+        cache.set_sample_cells(name, cells, fingerprints)
+        for model, arrays in cache.experiment_arrays().items():
+            data[f"{model}_arrays"] = arrays
+            data[f"{model}_predictions"] = []
+
+    n_cached = int(known.sum())
+    if n_cached and payload is not None:
+        data["message"] = f"{data['message']} ({n_cached:,} of {len(fingerprints):,} cells reused from earlier predictions)"
+    data.update(n_cells=len(fingerprints), n_cached=n_cached, n_predicted=len(fingerprints) - n_cached)
+    return data
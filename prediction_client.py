@@ -0,0 +1,872 @@
+import io
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import requests
+
+from metrics import backend_request, cache_result
+from tracing import Trace, SPAN_KIND_CLIENT
+
+# Prediction endpoint (override with OSIRIS_BACKEND_URL)
+DEFAULT_BACKEND_URL = os.environ.get("OSIRIS_BACKEND_URL", "http://localhost:8080/predict")
+
+# Upper bound on simultaneous requests when the backend has no batch endpoint
+MAX_PARALLEL_REQUESTS = 8
+
+# Minimum fraction of model genes an upload must contain to be worth sending
+MIN_FEATURE_COVERAGE = 0.5
+
+# Header names that mark a table with one row per gene instead of one row per cell
+GENE_COLUMN_NAMES = {"gene", "genes", "gene_id", "gene_ids", "gene_symbol", "symbol", "feature", "features", "gene_name"}
+
+# Rows parsed at a time while aligning a table
+ALIGN_CHUNK_ROWS = 5000
+
+# Bytes read from the start of an upload to validate its structure
+SNIFF_BYTES = 64 * 1024
+
+# Binary prediction responses are Arrow IPC streams; JSON remains the fallback for older backends
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+PREDICTION_ACCEPT = f"{ARROW_STREAM_TYPE}, application/json;q=0.9"
+
+# Models returned by /predict, in display order
+PREDICTION_MODELS = ("hsc", "lineage")
+
+# Probability histogram bins in the per-cell summary view
+PROBABILITY_BINS = 20
+
+# Decimals kept when probabilities are turned into records; float32 holds about this many
+PROBABILITY_DECIMALS = 6
+
+_manifest_lock = threading.Lock()
+_manifest_cache = {}
+
+
+class FeatureMismatchError(ValueError):
+    """Raised when an upload does not contain enough of the genes the models need"""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+def _normalize_symbol(symbol):
+    """Canonical form of a gene symbol or Ensembl id used for matching"""
+    symbol = str(symbol).strip().upper()
+    # Drop Ensembl version suffixes (ENSG00000141510.16 -> ENSG00000141510)
+    return re.sub(r"^(ENS[A-Z]*G\d+)\.\d+$", r"\1", symbol)
+
+
+class FeatureIndex:
+    """
+    Hashed lookup from gene symbols, ids and aliases to model feature positions.
+
+    Built once from the backend's feature manifest and reused for every upload.
+    """
+
+    def __init__(self, features, aliases=None, version=None):
+        self.features = list(features)
+        self.version = version
+        self._positions = {_normalize_symbol(f): i for i, f in enumerate(self.features)}
+        for alias, target in (aliases or {}).items():
+            position = self._positions.get(_normalize_symbol(target))
+            if position is not None:
+                self._positions.setdefault(_normalize_symbol(alias), position)
+
+    def __len__(self):
+        return len(self.features)
+
+    def lookup(self, symbol):
+        """Feature position for a symbol, or None if the models do not use it"""
+        return self._positions.get(_normalize_symbol(symbol))
+
+    def match(self, symbols):
+        """
+        Map input symbols to feature positions.
+
+        Returns:
+        --------
+        tuple
+            (input positions, feature positions) for every matched symbol. When
+            several inputs map to the same feature only the first one is kept.
+        """
+        source, target, seen = [], [], set()
+        for i, symbol in enumerate(symbols):
+            position = self.lookup(symbol)
+            if position is not None and position not in seen:
+                seen.add(position)
+                source.append(i)
+                target.append(position)
+        return np.array(source, dtype=np.int64), np.array(target, dtype=np.int64)
+
+
+def features_url(backend_url):
+    """URL of the feature manifest that sits next to the prediction endpoint"""
+    base = backend_url.rstrip("/")
+    if base.endswith("/predict"):
+        base = base[:-len("/predict")]
+    return f"{base}/features"
+
+
+def get_feature_index(backend_url=DEFAULT_BACKEND_URL, timeout=30, fetch=True):
+    """
+    Fetch and cache the models' feature manifest.
+
+    The manifest is requested once per backend and process. Backends that do not
+    publish one return None, in which case uploads are sent unchanged. With
+    ``fetch=False`` only an already cached manifest is returned.
+    """
+    with _manifest_lock:
+        cached = backend_url in _manifest_cache
+        cache_result("feature_manifest", cached)
+        if cached or not fetch:
+            return _manifest_cache.get(backend_url)
+
+    index = None
+    with backend_request("features", expected=(404, 405, 501)) as outcome:
+        response = requests.get(features_url(backend_url), timeout=timeout)
+        outcome["status"] = response.status_code
+    if response.status_code == 200:
+        manifest = response.json()
+        index = FeatureIndex(manifest["features"], manifest.get("aliases"), manifest.get("version"))
+    elif response.status_code not in (404, 405, 501):
+        response.raise_for_status()
+
+    with _manifest_lock:
+        _manifest_cache[backend_url] = index
+    return index
+
+
+def alignment_report(feature_index, matched, n_input, min_coverage=MIN_FEATURE_COVERAGE):
+    """
+    Report of how an input's genes cover the model's features.
+
+    Parameters:
+    -----------
+    feature_index : FeatureIndex
+        Model features the input was aligned to
+    matched : numpy.ndarray
+        Boolean mask over the model features found in the input
+    n_input : int
+        Number of genes in the input
+
+    Raises:
+    -------
+    FeatureMismatchError
+        When fewer than min_coverage of the model genes are present
+    """
+    n_features = len(feature_index)
+    report = {
+        "input_genes": n_input,
+        "model_genes": n_features,
+        "matched_genes": int(matched.sum()),
+        "missing_genes": [feature_index.features[i] for i in np.flatnonzero(~matched)],
+        "manifest_version": feature_index.version
+    }
+    coverage = report["matched_genes"] / n_features if n_features else 1.0
+    if coverage < min_coverage:
+        raise FeatureMismatchError(
+            f"Only {report['matched_genes']} of {n_features} model genes were found in the file "
+            f"({coverage:.0%}); at least {min_coverage:.0%} are required.",
+            report
+        )
+    return report
+
+
+def align_table(content, feature_index, sep="\t", min_coverage=MIN_FEATURE_COVERAGE):
+    """
+    Reduce a count table to the model's genes, in model order.
+
+    Only the header is inspected up front; the body is then parsed in chunks,
+    keeping just the matched genes. Model genes missing from the upload are
+    zero-filled.
+
+    Parameters:
+    -----------
+    content : bytes
+        The uploaded table
+    feature_index : FeatureIndex
+        Model features to align to
+    sep : str
+        Column delimiter
+    min_coverage : float
+        Minimum fraction of model genes that must be present
+
+    Returns:
+    --------
+    tuple
+        (aligned table as bytes, report dict)
+
+    Raises:
+    -------
+    FeatureMismatchError
+        When fewer than min_coverage of the model genes are present
+    """
+    header = pd.read_csv(io.BytesIO(content), sep=sep, nrows=0)
+    index_name = str(header.columns[0])
+    genes_as_rows = index_name.strip().lower() in GENE_COLUMN_NAMES
+    n_features = len(feature_index)
+
+    if genes_as_rows:
+        # One row per gene: stream rows and keep the ones the models use
+        cells = list(header.columns[1:])
+        aligned = np.zeros((n_features, len(cells)), dtype=np.float32)
+        matched = np.zeros(n_features, dtype=bool)
+        n_input = 0
+        for chunk in pd.read_csv(io.BytesIO(content), sep=sep, index_col=0, chunksize=ALIGN_CHUNK_ROWS):
+            n_input += len(chunk)
+            source, target = feature_index.match(chunk.index)
+            keep = ~matched[target]
+            source, target = source[keep], target[keep]
+            aligned[target] = chunk.to_numpy(dtype=np.float32)[source]
+            matched[target] = True
+        frame = pd.DataFrame(aligned, index=pd.Index(feature_index.features, name=index_name), columns=cells)
+    else:
+        # One row per cell: only parse the matched gene columns
+        genes = list(header.columns[1:])
+        n_input = len(genes)
+        source, target = feature_index.match(genes)
+        matched = np.zeros(n_features, dtype=bool)
+        matched[target] = True
+        usecols = [0] + (source + 1).tolist()
+        blocks = []
+        for chunk in pd.read_csv(io.BytesIO(content), sep=sep, index_col=0, usecols=usecols, chunksize=ALIGN_CHUNK_ROWS):
+            block = np.zeros((len(chunk), n_features), dtype=np.float32)
+            # usecols returns columns in file order, which matches the order of source
+            block[:, target] = chunk.to_numpy(dtype=np.float32)
+            blocks.append(pd.DataFrame(block, index=chunk.index, columns=feature_index.features))
+        frame = pd.concat(blocks) if blocks else pd.DataFrame(columns=feature_index.features)
+
+    report = alignment_report(feature_index, matched, n_input, min_coverage)
+
+    buffer = io.StringIO()
+    frame.to_csv(buffer, sep=sep)
+    return buffer.getvalue().encode(), report
+
+
+def _read_head(source, n_bytes):
+    """Return (first n_bytes, total size) of bytes or a seekable file without reading the rest"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:n_bytes]), len(source)
+    position = source.tell()
+    head = source.read(n_bytes)
+    size = getattr(source, "size", None)
+    if size is None:
+        size = source.seek(0, io.SEEK_END)
+    source.seek(position)
+    return head, size
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def sniff_table(name, source, feature_index=None, sample_bytes=SNIFF_BYTES, min_coverage=MIN_FEATURE_COVERAGE):
+    """
+    Check the structure of a count table from its first few KB.
+
+    Delimiter, header, gene column, numeric values and field counts are checked
+    on the sampled lines, and the number of rows is extrapolated from their
+    average length, so even multi-GB uploads are judged in milliseconds. With
+    a feature index, a header of gene names is also matched against the models.
+
+    Parameters:
+    -----------
+    name : str
+        File name; its extension gives the expected delimiter
+    source : bytes or file-like
+        The upload; file objects are returned to their current position
+    feature_index : FeatureIndex
+        Optional model features to check gene coverage against
+
+    Returns:
+    --------
+    dict
+        ``sep``, ``genes_as_rows``, ``n_rows`` (estimated unless
+        ``rows_exact``), ``n_cols``, ``size``, and lists of ``errors`` (the
+        file should not be sent) and ``warnings``; a header rejected for its
+        gene coverage adds an ``alignment`` report of the missing genes
+    """
+    extension = name.rsplit(".", 1)[-1].lower()
+    sep = "," if extension == "csv" else "\t"
+    report = {
+        "sep": sep, "genes_as_rows": False, "n_rows": 0, "n_cols": 0, "rows_exact": False,
+        "size": 0, "errors": [], "warnings": []
+    }
+    errors, warnings = report["errors"], report["warnings"]
+
+    head, report["size"] = _read_head(source, sample_bytes)
+    if not head.strip():
+        errors.append("File is empty")
+        return report
+    if head[:2] == b"\x1f\x8b" or head[:4] == b"PK\x03\x04":
+        errors.append("File is compressed; upload the uncompressed table")
+        return report
+    if b"\x00" in head:
+        errors.append("File is binary, not a text table")
+        return report
+    try:
+        text = head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # A multi-byte character may be cut at the end of the sample
+        if e.start < len(head) - 4:
+            errors.append("File is not UTF-8 text")
+            return report
+        text = head[:e.start].decode("utf-8")
+
+    complete = report["size"] <= len(head)
+    lines = text.splitlines()
+    if not complete and not text.endswith(("\n", "\r")):
+        # Drop the line cut off by the sample boundary
+        lines = lines[:-1]
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        errors.append("First line is longer than the sampled bytes; is this a count table?")
+        return report
+
+    header = lines[0].split(sep)
+    if len(header) < 2:
+        expected, other, other_name = ("tabs", ",", "commas") if sep == "\t" else ("commas", "\t", "tabs")
+        if other in lines[0]:
+            errors.append(f"Header is separated by {other_name}, not {expected}; check the file extension")
+        else:
+            errors.append("Header has only one column")
+        return report
+
+    genes = [field.strip() for field in header[1:]]
+    report["n_cols"] = len(genes)
+    report["genes_as_rows"] = header[0].strip().lower() in GENE_COLUMN_NAMES
+    if all(_is_number(field) for field in genes if field):
+        errors.append("First line contains only numbers; the table needs a header row")
+        return report
+    if any(not field for field in genes):
+        errors.append("Header has empty column names")
+    duplicates = len(genes) - len(set(genes))
+    if duplicates:
+        warnings.append(f"Header repeats {duplicates} column names")
+
+    # Every sampled data row must have the header's width and numeric values after the first field
+    rows = lines[1:]
+    if not rows:
+        errors.append("File has a header but no data rows" if complete else "No complete data row in the sampled bytes")
+        return report
+    for line_number, line in enumerate(rows, start=2):
+        fields = line.split(sep)
+        if len(fields) != len(header):
+            errors.append(f"Line {line_number} has {len(fields)} fields, the header has {len(header)}")
+            break
+        bad = next((i for i, value in enumerate(fields[1:], start=1) if not _is_number(value)), None)
+        if bad is not None:
+            errors.append(f"Line {line_number}, column '{header[bad].strip()}': non-numeric value '{fields[bad][:20]}'")
+            break
+        if not fields[0].strip():
+            errors.append(f"Line {line_number} has an empty {'gene' if report['genes_as_rows'] else 'cell'} name")
+            break
+
+    if complete:
+        report["n_rows"], report["rows_exact"] = len(rows), True
+    else:
+        average = sum(len(line.encode()) + 1 for line in rows) / len(rows)
+        report["n_rows"] = int((report["size"] - len(lines[0].encode()) - 1) / average)
+
+    if feature_index is not None and len(feature_index):
+        if report["genes_as_rows"]:
+            # Only the sampled gene rows are known; a low match rate is worth a warning
+            names = [line.split(sep, 1)[0] for line in rows]
+            matched = len(feature_index.match(names)[0])
+            if matched < min_coverage * len(names):
+                warnings.append(f"Only {matched} of the first {len(names)} genes are used by the models")
+        else:
+            target = feature_index.match(genes)[1]
+            matched = len(target)
+            coverage = matched / len(feature_index)
+            if coverage < min_coverage:
+                errors.append(
+                    f"Only {matched} of {len(feature_index)} model genes are in the header "
+                    f"({coverage:.0%}); at least {min_coverage:.0%} are required."
+                )
+                # Same shape as align_table's report, so rejected files list what they lack
+                found = np.zeros(len(feature_index), dtype=bool)
+                found[target] = True
+                report["alignment"] = {
+                    "input_genes": len(genes),
+                    "model_genes": len(feature_index),
+                    "matched_genes": matched,
+                    "missing_genes": [feature_index.features[i] for i in np.flatnonzero(~found)],
+                    "manifest_version": feature_index.version
+                }
+    return report
+
+
+def prepare_upload(name, content, backend_url=DEFAULT_BACKEND_URL):
+    """
+    Align a table upload to the model's feature manifest when the backend publishes one.
+
+    Returns:
+    --------
+    tuple
+        (content to send, alignment report or None)
+    """
+    extension = name.rsplit(".", 1)[-1].lower()
+    if extension not in ("tsv", "csv"):
+        return content, None
+    feature_index = get_feature_index(backend_url)
+    if feature_index is None:
+        return content, None
+    return align_table(content, feature_index, sep="\t" if extension == "tsv" else ",")
+
+
+def validate_sample(name, content, feature_index=None):
+    """
+    Check an uploaded count table can be sent for prediction, from its first few KB.
+
+    Returns:
+    --------
+    dict
+        name, raw content, (estimated) dimensions, warnings and an error message (None when valid)
+    """
+    sniffed = sniff_table(name, content, feature_index)
+    return {
+        "name": name,
+        "content": content,
+        "n_rows": sniffed["n_rows"],
+        "n_cols": sniffed["n_cols"],
+        "alignment": sniffed.get("alignment"),
+        "warnings": sniffed["warnings"],
+        "error": "; ".join(sniffed["errors"]) or None
+    }
+
+
+def validate_samples(files, backend_url=DEFAULT_BACKEND_URL, max_workers=MAX_PARALLEL_REQUESTS):
+    """
+    Validate several (name, content) pairs in parallel, preserving their order.
+
+    Valid samples are also aligned to the model's feature manifest, so their
+    content is replaced by the reduced table that will actually be uploaded.
+    """
+    # Fetch the manifest once before fanning out
+    feature_index = get_feature_index(backend_url)
+
+    def run(f):
+        sample = validate_sample(*f, feature_index=feature_index)
+        if sample["error"] is None:
+            try:
+                sample["content"], sample["alignment"] = prepare_upload(sample["name"], sample["content"], backend_url)
+            except FeatureMismatchError as e:
+                sample["error"] = str(e)
+                sample["alignment"] = e.report
+        return sample
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, files))
+
+
+class PredictionArrays:
+    """
+    Columnar predictions of one model.
+
+    Classes are kept as integer codes into ``class_names`` and probabilities as a
+    float array, so per-cell output for 100k cells is a few flat arrays rather
+    than 100k dicts. ``cells`` is None for per-sample predictions.
+    """
+
+    def __init__(self, class_codes, class_names, probabilities, cells=None):
+        self.class_codes = class_codes
+        self.class_names = np.asarray(class_names, dtype=object)
+        self.probabilities = probabilities
+        self.cells = cells
+
+    def __len__(self):
+        return len(self.probabilities)
+
+    @property
+    def per_cell(self):
+        return self.cells is not None
+
+    @property
+    def classes(self):
+        return self.class_names[self.class_codes]
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from the JSON list-of-dicts format"""
+        names, codes = np.unique(np.array([str(r["class"]) for r in records], dtype=object), return_inverse=True)
+        probabilities = np.array([float(r["probability"]) for r in records], dtype=np.float32)
+        cells = None
+        if records and "cell" in records[0]:
+            cells = np.array([str(r["cell"]) for r in records], dtype=object)
+        return cls(codes.astype(np.int32), names, probabilities, cells)
+
+    def to_records(self):
+        """Convert back to the JSON list-of-dicts format"""
+        classes = self.classes
+        # float32 probabilities are rounded to the digits they hold, so 0.3955 is not shown as 0.3955000042915344
+        probabilities = np.round(np.asarray(self.probabilities, dtype=np.float64), PROBABILITY_DECIMALS).tolist()
+        if self.cells is None:
+            return [{"class": c, "probability": p} for c, p in zip(classes, probabilities)]
+        return [
+            {"cell": cell, "class": c, "probability": p}
+            for cell, c, p in zip(self.cells, classes, probabilities)
+        ]
+
+    def to_frame(self):
+        """One row per cell (or per sample) and class, with the classes as a categorical"""
+        return pd.DataFrame({
+            "cell": self.cells if self.per_cell else pd.Series([None] * len(self), dtype=object),
+            "class": pd.Categorical.from_codes(self.class_codes, self.class_names),
+            "probability": self.probabilities
+        })
+
+    def call(self):
+        """
+        The class a sample is called as, with its support.
+
+        Returns:
+        --------
+        tuple
+            (class, share of cells whose most likely class it is) for per-cell
+            predictions, (class, probability) for per-sample ones, or
+            (None, None) without predictions
+        """
+        if not len(self):
+            return None, None
+        if not self.per_cell:
+            best = int(np.argmax(self.probabilities))
+            return self.class_names[self.class_codes[best]], round(float(self.probabilities[best]), PROBABILITY_DECIMALS)
+        fractions = summarize_predictions(self, bins=1)["fractions"]
+        best = fractions["cells"].idxmax()
+        return fractions["class"][best], round(float(fractions["fraction"][best]), PROBABILITY_DECIMALS)
+
+
+def _dictionary_array(array):
+    """Return (codes, names) for a string array, using its dictionary encoding when present"""
+    if pa.types.is_dictionary(array.type):
+        return array.indices.to_numpy(zero_copy_only=False), np.asarray(array.dictionary.to_pylist(), dtype=object)
+    names, codes = np.unique(array.to_numpy(zero_copy_only=False).astype(object), return_inverse=True)
+    return codes, names
+
+
+def _concat_predictions(parts):
+    """Join the PredictionArrays of several record batches, merging their class dictionaries"""
+    if len(parts) == 1:
+        return parts[0]
+    names = list(dict.fromkeys(name for part in parts for name in part.class_names))
+    position = {name: i for i, name in enumerate(names)}
+    codes = np.concatenate([
+        np.array([position[name] for name in part.class_names], dtype=np.int32)[part.class_codes] for part in parts
+    ])
+    cells = None
+    if parts[0].cells is not None:
+        cells = np.concatenate([part.cells for part in parts])
+    return PredictionArrays(codes, names, np.concatenate([part.probabilities for part in parts]), cells)
+
+
+def decode_arrow_predictions(buffer):
+    """
+    Decode an Arrow IPC stream of predictions.
+
+    The stream holds one row per model and class (and per cell for per-cell
+    output) with columns ``model``, ``class``, ``probability`` and optionally
+    ``cell``; string columns may be dictionary encoded. When each record batch
+    holds a single model, as the backend sends them, the numeric arrays of
+    every model are views into the received buffer.
+    """
+    reader = pa.ipc.open_stream(pa.py_buffer(buffer))
+    metadata = {k.decode(): v.decode() for k, v in (reader.schema.metadata or {}).items()}
+
+    parts = {model: [] for model in PREDICTION_MODELS}
+    for batch in reader:
+        model_codes, model_names = _dictionary_array(batch.column("model"))
+        class_codes, class_names = _dictionary_array(batch.column("class"))
+        probabilities = batch.column("probability").to_numpy(zero_copy_only=False)
+        cells = None
+        if "cell" in batch.schema.names:
+            cells = batch.column("cell").to_numpy(zero_copy_only=False)
+
+        for code, model in enumerate(model_names):
+            if model not in parts:
+                continue
+            rows = np.flatnonzero(model_codes == code)
+            if len(rows) == 0:
+                continue
+            if rows[-1] - rows[0] + 1 == len(rows):
+                # Contiguous block: slice without copying
+                rows = slice(int(rows[0]), int(rows[-1]) + 1)
+            parts[model].append(PredictionArrays(
+                class_codes[rows],
+                class_names,
+                probabilities[rows],
+                cells[rows] if cells is not None else None
+            ))
+
+    arrays = {}
+    for model, model_parts in parts.items():
+        if model_parts:
+            arrays[model] = _concat_predictions(model_parts)
+        else:
+            arrays[model] = PredictionArrays(np.zeros(0, dtype=np.int32), [], np.zeros(0, dtype=np.float32))
+    return metadata.get("message", ""), arrays
+
+
+def summarize_predictions(arrays, bins=PROBABILITY_BINS):
+    """
+    Aggregate per-cell predictions into a few small tables for display.
+
+    Parameters:
+    -----------
+    arrays : PredictionArrays
+        Per-cell predictions, one row per cell and class
+    bins : int
+        Number of equal-width probability bins between 0 and 1
+
+    Returns:
+    --------
+    dict
+        ``n_cells``; ``fractions`` (class, cells, fraction), the share of cells
+        whose most likely class is each class; ``histogram`` (class, bin_start,
+        bin_end, cells), the probability distribution of every class; and
+        ``cells`` (cell, class, probability), the top class of every cell
+    """
+    cell_codes, cell_names = pd.factorize(arrays.cells)
+    n_cells = len(cell_names)
+
+    # Highest probability first within each cell; the first row of each cell is its call
+    order = np.lexsort((-arrays.probabilities, cell_codes))
+    _, first = np.unique(cell_codes[order], return_index=True)
+    top = order[first]
+    top_codes = arrays.class_codes[top]
+
+    counts = np.bincount(top_codes, minlength=len(arrays.class_names))
+    fractions = pd.DataFrame({
+        "class": arrays.class_names,
+        "cells": counts,
+        "fraction": counts / max(n_cells, 1)
+    })
+
+    edges = np.linspace(0, 1, bins + 1)
+    histogram = []
+    for code, name in enumerate(arrays.class_names):
+        hist, _ = np.histogram(arrays.probabilities[arrays.class_codes == code], bins=edges)
+        histogram.append(pd.DataFrame({"class": name, "bin_start": edges[:-1], "bin_end": edges[1:], "cells": hist}))
+
+    return {
+        "n_cells": n_cells,
+        "fractions": fractions,
+        "histogram": pd.concat(histogram, ignore_index=True),
+        "cells": pd.DataFrame({
+            "cell": cell_names,
+            "class": pd.Categorical.from_codes(top_codes, categories=list(arrays.class_names)),
+            "probability": arrays.probabilities[top]
+        })
+    }
+
+
+def decode_prediction_response(response):
+    """
+    Decode a /predict response into a common structure, whatever format it arrived in.
+
+    Returns:
+    --------
+    dict
+        ``message``, ``hsc_predictions`` / ``lineage_predictions`` as lists of
+        dicts (left empty for per-cell output, which would be too large), and
+        ``hsc_arrays`` / ``lineage_arrays`` as PredictionArrays
+    """
+    content_type = response.headers.get("Content-Type", "").split(";", 1)[0].strip()
+    if content_type == ARROW_STREAM_TYPE:
+        message, arrays = decode_arrow_predictions(response.content)
+        data = {"message": message}
+    else:
+        data = response.json()
+        arrays = {model: PredictionArrays.from_records(data.get(f"{model}_predictions", [])) for model in PREDICTION_MODELS}
+
+    for model in PREDICTION_MODELS:
+        data[f"{model}_arrays"] = arrays[model]
+        data[f"{model}_predictions"] = [] if arrays[model].per_cell else arrays[model].to_records()
+    return data
+
+
+def post_prediction(name, content, trace, backend_url=DEFAULT_BACKEND_URL, session=None, timeout=300):
+    """
+    POST one file to the prediction endpoint as the "network" span of ``trace``.
+
+    The request carries the trace's propagation headers, and backend phases
+    reported in ``Server-Timing`` are added under the network span. The
+    binary Arrow format is requested and JSON accepted as a fallback.
+
+    Returns:
+    --------
+    requests.Response
+        The response, whatever its status
+    """
+    http = session or requests
+    size = len(content) if isinstance(content, (bytes, bytearray)) else None
+    with trace.span("network", kind=SPAN_KIND_CLIENT, **{"http.method": "POST", "http.url": backend_url}) as span:
+        if size is not None:
+            span["attributes"]["http.request_content_length"] = size
+        with backend_request("predict") as outcome:
+            response = http.post(
+                backend_url,
+                files={"file": (name, content)},
+                headers={"Accept": PREDICTION_ACCEPT, **trace.headers(span)},
+                timeout=timeout
+            )
+            outcome["status"] = response.status_code
+        span["attributes"]["http.status_code"] = response.status_code
+        span["attributes"]["http.response_content_length"] = len(response.content)
+    trace.add_server_timing(span, response.headers.get("Server-Timing"))
+    return response
+
+
+def predict_file(name, content, backend_url=DEFAULT_BACKEND_URL, session=None, timeout=300, trace=None):
+    """
+    Send one file to the prediction endpoint.
+
+    The result is decoded by decode_prediction_response, whatever format it
+    arrived in. Without a ``trace`` the request is traced on its own and the
+    trace exported once the response is decoded.
+
+    Returns:
+    --------
+    dict
+        The decoded response
+
+    Raises:
+    -------
+    requests.HTTPError
+        When the backend answers with an error status
+    """
+    own_trace = trace is None
+    if own_trace:
+        trace = Trace("predict", sample=name)
+    error = None
+    try:
+        response = post_prediction(name, content, trace, backend_url, session, timeout)
+        response.raise_for_status()
+        with trace.span("decode"):
+            return decode_prediction_response(response)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        if own_trace:
+            trace.finish(error)
+
+
+def sample_prediction(arrays):
+    """
+    (class, probability) summarizing one model's predictions of a sample, or (None, None).
+
+    Per-sample output gives its most likely class. Per-cell output gives the
+    class most cells are called as, with the mean probability of those calls.
+    """
+    if arrays is None or not len(arrays):
+        return None, None
+    call, support = arrays.call()
+    if not arrays.per_cell:
+        return call, support
+    cells = summarize_predictions(arrays, bins=1)["cells"]
+    return call, round(float(cells["probability"][cells["class"] == call].mean()), PROBABILITY_DECIMALS)
+
+
+def _result_row(sample, data=None, error=None):
+    # The alignment report travels with the result: gene coverage for scored
+    # samples, the missing genes for samples rejected as a feature mismatch
+    row = {"sample": sample["name"], "alignment": sample.get("alignment"), "error": error}
+    for model in PREDICTION_MODELS:
+        # Decoded responses carry arrays (and no records for per-cell output); batch responses only records
+        arrays = (data or {}).get(f"{model}_arrays")
+        if arrays is None:
+            arrays = PredictionArrays.from_records((data or {}).get(f"{model}_predictions", []))
+        row[f"{model}_prediction"] = sample_prediction(arrays)
+    return row
+
+
+def predict_samples(samples, backend_url=DEFAULT_BACKEND_URL, max_workers=MAX_PARALLEL_REQUESTS, timeout=300):
+    """
+    Score many validated samples in one action.
+
+    All files are first offered to the backend's batch endpoint
+    (``<backend_url>/batch``) as a single multipart request. Older backends
+    without that endpoint are handled with a bounded fan-out of individual
+    ``/predict`` calls, so total wall time stays close to the slowest sample.
+
+    Parameters:
+    -----------
+    samples : list of dict
+        Output of validate_samples; samples with errors are skipped
+    backend_url : str
+        The single-file prediction endpoint
+    max_workers : int
+        Maximum simultaneous requests in fan-out mode
+
+    Returns:
+    --------
+    list of dict
+        One result per sample, in input order, with each model's
+        ``(class, probability)`` from sample_prediction, its alignment report
+        and an error message on failure
+    """
+    results = [_result_row(s, error=s["error"]) for s in samples]
+    valid = [i for i, s in enumerate(samples) if s["error"] is None]
+    if not valid:
+        return results
+
+    # Try the batch endpoint first; any non-200 answer means fan out instead
+    batch_results = None
+    trace = Trace("predict_batch", samples=len(valid))
+    try:
+        with trace.span("network", kind=SPAN_KIND_CLIENT) as span, backend_request("batch", expected=(404, 405, 501)) as outcome:
+            response = requests.post(
+                f"{backend_url.rstrip('/')}/batch",
+                files=[("files", (samples[i]["name"], samples[i]["content"])) for i in valid],
+                headers=trace.headers(span),
+                timeout=timeout
+            )
+            outcome["status"] = response.status_code
+        trace.add_server_timing(span, response.headers.get("Server-Timing"))
+        if response.status_code == 200:
+            batch_results = {r["sample"]: r for r in response.json().get("results", [])}
+    except requests.ConnectionError as e:
+        trace.finish(str(e))
+        raise
+    except requests.RequestException:
+        pass
+    trace.finish()
+
+    if batch_results is not None:
+        for i in valid:
+            data = batch_results.get(samples[i]["name"])
+            results[i] = _result_row(samples[i], data, None if data else "Missing from batch response")
+        return results
+
+    # Older backends: one request per sample with bounded concurrency
+    with requests.Session() as session:
+        def run(i):
+            try:
+                return _result_row(samples[i], predict_file(samples[i]["name"], samples[i]["content"], backend_url, session, timeout))
+            except Exception as e:
+                return _result_row(samples[i], error=str(e))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for i, row in zip(valid, pool.map(run, valid)):
+                results[i] = row
+
+    return results
+
+
+def top_prediction(predictions):
+    """Return (class, probability) of the most likely class, or (None, None)"""
+    if not predictions:
+        return None, None
+    best = max(predictions, key=lambda p: float(p["probability"]))
+    return best["class"], float(best["probability"])
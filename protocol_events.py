@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+
+class ProtocolEventIndex:
+    """
+    Time-sorted interval index of the protocol changes made during one experiment.
+
+    Each protocol change opens an interval that lasts until the next change (or the
+    end of the experiment), so every measurement can be mapped to the protocol that
+    was active when it was taken. Lookups use binary search on the sorted start
+    times, which keeps visible-range queries cheap even with hundreds of changes.
+    """
+
+    def __init__(self, starts, descriptions, targets=None, end=None):
+        starts = pd.to_datetime(pd.Series(starts, dtype="object")).to_numpy(dtype="datetime64[ns]")
+        descriptions = np.asarray(descriptions, dtype=object)
+        if targets is None:
+            targets = np.full(len(starts), "", dtype=object)
+        targets = np.asarray(targets, dtype=object)
+
+        # Keep all arrays in start-time order so searchsorted can be used for lookups
+        order = np.argsort(starts, kind="stable")
+        self.starts = starts[order]
+        self.descriptions = descriptions[order]
+        self.targets = targets[order]
+
+        # Each event ends where the next one begins; the last one runs to the end of the experiment
+        if end is None:
+            end = self.starts[-1] if len(self.starts) else np.datetime64("NaT", "ns")
+        self.ends = np.append(self.starts[1:], np.datetime64(pd.Timestamp(end), "ns"))
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build the index from the Protocol_Change marker columns of an experiment DataFrame"""
+        if "Protocol_Change" not in df.columns:
+            return cls([], [], end=df["Date"].max() if len(df) else None)
+
+        changes = df[df["Protocol_Change"] == True]
+        descriptions = changes["Change_Description"].fillna("") if "Change_Description" in changes else [""] * len(changes)
+        targets = changes["Change_Target"].fillna("") if "Change_Target" in changes else None
+        return cls(changes["Date"], descriptions, targets, end=df["Date"].max())
+
+    def __len__(self):
+        return len(self.starts)
+
+    def visible(self, x0=None, x1=None):
+        """Return the positions of the events whose change date falls inside [x0, x1]"""
+        lo = 0 if x0 is None else np.searchsorted(self.starts, np.datetime64(pd.Timestamp(x0), "ns"), side="left")
+        hi = len(self.starts) if x1 is None else np.searchsorted(self.starts, np.datetime64(pd.Timestamp(x1), "ns"), side="right")
+        return np.arange(lo, hi)
+
+    def active_event(self, dates):
+        """
+        Map each date to the position of the protocol change active at that time.
+
+        Returns -1 for dates that precede the first protocol change.
+        """
+        dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype="datetime64[ns]")
+        return np.searchsorted(self.starts, dates, side="right") - 1
+
+    def active_labels(self, dates, baseline="Initial protocol"):
+        """Describe the protocol active at each date, for use in hover text"""
+        positions = self.active_event(dates)
+        labels = np.full(len(positions), baseline, dtype=object)
+        has_event = positions >= 0
+        labels[has_event] = self.descriptions[positions[has_event]]
+        return labels
+
+    def to_layout(self, x_range=None, y_range=(0, 100), max_labels=25):
+        """
+        Render the visible events as Plotly shapes and annotations.
+
+        The result is meant to be passed to a single ``fig.update_layout`` call
+        instead of adding shapes and annotations one at a time.
+
+        Parameters:
+        -----------
+        x_range : tuple, optional
+            (start, end) of the visible date range. Defaults to all events.
+        y_range : tuple
+            Vertical extent of the change markers
+        max_labels : int
+            Above this many visible events the text labels are dropped and the
+            descriptions are only shown on hover, so the chart stays readable
+
+        Returns:
+        --------
+        tuple
+            (shapes, annotations) lists of Plotly layout dicts
+        """
+        x0, x1 = x_range if x_range is not None else (None, None)
+        positions = self.visible(x0, x1)
+        show_text = len(positions) <= max_labels
+
+        shapes = []
+        annotations = []
+        for i in positions:
+            date = pd.Timestamp(self.starts[i])
+            shapes.append(dict(
+                type="line",
+                xref="x",
+                yref="y",
+                x0=date,
+                y0=y_range[0],
+                x1=date,
+                y1=y_range[1],
+                line=dict(color="gray", width=1, dash="dash"),
+                layer="below"
+            ))
+
+            hover = f"<b>{self.descriptions[i]}</b><br>{date:%Y-%m-%d}"
+            if self.targets[i]:
+                hover += f"<br>Target: {self.targets[i]}"
+            hover += f"<br>Active until {pd.Timestamp(self.ends[i]):%Y-%m-%d}"
+
+            annotations.append(dict(
+                x=date,
+                y=y_range[1] - 5,
+                text=f"Protocol Change: {self.descriptions[i]}" if show_text else "▼",
+                hovertext=hover,
+                showarrow=False,
+                yshift=10
+            ))
+
+        return shapes, annotations
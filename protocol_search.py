@@ -0,0 +1,235 @@
+"""
+Constrained search over cytokine concentration combinations.
+
+Every combination of concentration levels is scored by a surrogate model of
+self-renewal, multipotency and lineage output. Combinations that break the
+constraints are pruned before scoring: small molecules, excluded factors, the
+number of factors and the budget are all checked on the level indices alone.
+The survivors are scored in parallel batches and reduced to their Pareto set.
+
+Surrogates are pluggable: anything with ``effect(factor, level)`` and
+``combine(baseline, effects, levels)`` works. Per-factor effects are memoized,
+so a search over tens of thousands of combinations evaluates each
+(factor, level) pair once.
+"""
+import os
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Outputs of a surrogate model, in column order
+OUTPUTS = ("self_renewal", "multipotency", "myeloid", "lymphoid", "erythroid")
+
+# Candidate factors: concentration levels (0 = left out), cost per unit per litre of medium, and
+# whether the factor is a small molecule (excluded by the no_small_molecules constraint)
+FACTORS = {
+    "SCF": {"unit": "ng/mL", "levels": (0, 50, 100, 150), "cost": 0.9, "small_molecule": False},
+    "TPO": {"unit": "ng/mL", "levels": (0, 25, 50, 100), "cost": 1.2, "small_molecule": False},
+    "FLT3L": {"unit": "ng/mL", "levels": (0, 50, 100), "cost": 1.0, "small_molecule": False},
+    "IL-6": {"unit": "ng/mL", "levels": (0, 10, 20), "cost": 2.5, "small_molecule": False},
+    "IL-3": {"unit": "ng/mL", "levels": (0, 5, 10), "cost": 3.0, "small_molecule": False},
+    "IL-7": {"unit": "ng/mL", "levels": (0, 10), "cost": 3.5, "small_molecule": False},
+    "GM-CSF": {"unit": "ng/mL", "levels": (0, 5, 10), "cost": 3.2, "small_molecule": False},
+    "EPO": {"unit": "U/mL", "levels": (0, 1, 3), "cost": 4.0, "small_molecule": False},
+    "SR1": {"unit": "µM", "levels": (0, 0.75), "cost": 60.0, "small_molecule": True},
+    "UM171": {"unit": "nM", "levels": (0, 35), "cost": 1.5, "small_molecule": True},
+}
+
+# Candidates scored per parallel batch
+SEARCH_BATCH_SIZE = 4096
+SEARCH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class HeuristicSurrogate:
+    """
+    Placeholder surrogate built from published direction-of-effect heuristics.
+
+    Each factor shifts the outputs with a saturating dose response; the shifts
+    are added to the culture's current state and lineage output is
+    renormalized to 100%. This is a placeholder for future AI model
+    integration, like the score functions in dash.py.
+    """
+
+    # Maximum shift of (self_renewal, multipotency, myeloid, lymphoid, erythroid) and half-saturation dose
+    RESPONSES = {
+        "SCF": ((14, 4, 4, -2, 2), 50),
+        "TPO": ((12, 5, 0, 0, 2), 25),
+        "FLT3L": ((4, 8, -4, 10, -3), 50),
+        "IL-6": ((5, 4, 3, -1, 0), 10),
+        "IL-3": ((-6, -5, 12, -4, 2), 5),
+        "IL-7": ((-2, -2, -5, 12, -3), 10),
+        "GM-CSF": ((-10, -8, 15, -6, -2), 5),
+        "EPO": ((-3, -4, -4, -3, 18), 1),
+        "SR1": ((18, 6, -2, 0, -1), 0.75),
+        "UM171": ((20, 8, -2, 1, -1), 35),
+    }
+
+    def effect(self, factor, level):
+        """Shift of every output caused by one factor at one concentration"""
+        if level == 0 or factor not in self.RESPONSES:
+            return np.zeros(len(OUTPUTS))
+        shifts, half_saturation = self.RESPONSES[factor]
+        return np.asarray(shifts, dtype=np.float64) * level / (level + half_saturation)
+
+    def combine(self, baseline, effects, levels):
+        """
+        Turn summed per-factor effects into predicted outputs.
+
+        Parameters:
+        -----------
+        baseline : numpy.ndarray
+            Current value of every output
+        effects : numpy.ndarray
+            Summed effects, one row per candidate
+        levels : numpy.ndarray
+            Concentrations, one row per candidate and one column per factor (unused here)
+        """
+        outputs = baseline + effects
+        outputs[:, :2] = np.clip(outputs[:, :2], 0, 100)
+        lineage = np.clip(outputs[:, 2:], 0.1, None)
+        outputs[:, 2:] = lineage / lineage.sum(axis=1, keepdims=True) * 100
+        return outputs
+
+
+def _dominated(by, rows):
+    """Mask of ``rows`` dominated by at least one row of ``by`` (every column maximized)"""
+    at_least = np.ones((len(by), len(rows)), dtype=bool)
+    better = np.zeros((len(by), len(rows)), dtype=bool)
+    for column in range(by.shape[1]):
+        at_least &= by[:, column, None] >= rows[None, :, column]
+        better |= by[:, column, None] > rows[None, :, column]
+    return np.any(at_least & better, axis=0)
+
+
+def _pareto_mask(objectives, chunk_size=512):
+    """
+    Boolean mask of the non-dominated rows when every column is maximized.
+
+    Candidates are visited in chunks, best-first on their summed objectives, so
+    a row can only be dominated by rows already on the front or in its own chunk.
+    """
+    order = np.argsort(-objectives.sum(axis=1), kind="stable")
+
+    # Most candidates are dominated by one of the leaders, which is cheap to check for all rows at once
+    leaders = objectives[order[:chunk_size]]
+    order = np.concatenate([
+        order[:chunk_size],
+        order[chunk_size:][~_dominated(leaders, objectives[order[chunk_size:]])]
+    ])
+
+    front = np.empty(0, dtype=np.int64)
+    for start in range(0, len(order), chunk_size):
+        chunk = order[start:start + chunk_size]
+        chunk = chunk[~_dominated(objectives[chunk], objectives[chunk])]
+        if len(front):
+            chunk = chunk[~_dominated(objectives[front], objectives[chunk])]
+        front = np.concatenate([front, chunk])
+    mask = np.zeros(len(objectives), dtype=bool)
+    mask[front] = True
+    return mask
+
+
+def search_protocols(baseline, constraints=None, surrogate=None, lineage_target=None, factors=FACTORS,
+                     batch_size=SEARCH_BATCH_SIZE, max_workers=SEARCH_WORKERS):
+    """
+    Enumerate factor combinations and return the ranked Pareto set.
+
+    Parameters:
+    -----------
+    baseline : dict
+        Current ``self_renewal``, ``multipotency``, ``myeloid``, ``lymphoid``
+        and ``erythroid`` values of the culture
+    constraints : dict, optional
+        ``no_small_molecules`` (bool), ``budget`` (cost per litre),
+        ``max_factors`` (int) and ``excluded`` (list of factor names)
+    surrogate : object, optional
+        Model with ``effect`` and ``combine``; defaults to HeuristicSurrogate
+    lineage_target : dict, optional
+        Desired ``myeloid`` / ``lymphoid`` / ``erythroid`` percentages;
+        defaults to balanced output
+
+    Returns:
+    --------
+    tuple
+        (Pareto-optimal protocols as a DataFrame ranked best first, number of
+        combinations enumerated, number scored after pruning)
+    """
+    constraints = constraints or {}
+    surrogate = surrogate or HeuristicSurrogate()
+    lineage_target = lineage_target or {"myeloid": 100 / 3, "lymphoid": 100 / 3, "erythroid": 100 / 3}
+
+    # Prune levels that no candidate may use before enumerating anything
+    names = list(factors)
+    excluded = set(constraints.get("excluded", []))
+    level_sets = []
+    for name in names:
+        levels = factors[name]["levels"]
+        if name in excluded or (constraints.get("no_small_molecules") and factors[name]["small_molecule"]):
+            levels = (0,)
+        level_sets.append(np.asarray(levels, dtype=np.float64))
+    n_total = int(np.prod([len(factors[name]["levels"]) for name in names]))
+
+    # Every combination as level indices; costs and factor counts are checked on these alone
+    index_grid = np.array(list(itertools.product(*[range(len(levels)) for levels in level_sets])), dtype=np.int64)
+    costs = sum(level_sets[j][index_grid[:, j]] * factors[name]["cost"] for j, name in enumerate(names))
+    n_factors = (index_grid > 0).sum(axis=1)
+    keep = np.ones(len(index_grid), dtype=bool)
+    if "budget" in constraints:
+        keep &= costs <= constraints["budget"]
+    if "max_factors" in constraints:
+        keep &= n_factors <= constraints["max_factors"]
+    index_grid, costs, n_factors = index_grid[keep], costs[keep], n_factors[keep]
+    if len(index_grid) == 0:
+        return pd.DataFrame(), n_total, 0
+
+    # Memoized sub-results: each (factor, level) effect is evaluated once, then gathered per candidate
+    effect = functools.lru_cache(maxsize=None)(surrogate.effect)
+    effect_tables = [
+        np.stack([effect(name, float(level)) for level in level_sets[j]])
+        for j, name in enumerate(names)
+    ]
+    baseline_vector = np.array([baseline[output] for output in OUTPUTS], dtype=np.float64)
+    target = np.array([lineage_target[lineage] for lineage in OUTPUTS[2:]], dtype=np.float64)
+
+    def score(start):
+        indices = index_grid[start:start + batch_size]
+        effects = sum(effect_tables[j][indices[:, j]] for j in range(len(names)))
+        levels = np.column_stack([level_sets[j][indices[:, j]] for j in range(len(names))])
+        return surrogate.combine(baseline_vector, effects, levels)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        outputs = np.vstack(list(pool.map(score, range(0, len(index_grid), batch_size))))
+
+    # Maximize both scores, minimize distance from the lineage target and cost
+    lineage_error = np.abs(outputs[:, 2:] - target).sum(axis=1) / 2
+    objectives = np.column_stack([outputs[:, 0], outputs[:, 1], -lineage_error, -costs])
+    pareto = _pareto_mask(np.round(objectives, 6))
+
+    frame = pd.DataFrame({
+        name: level_sets[j][index_grid[pareto, j]] for j, name in enumerate(names)
+    })
+    frame["Self_Renewal"] = outputs[pareto, 0]
+    frame["Multipotency"] = outputs[pareto, 1]
+    frame["Myeloid_Percentage"] = outputs[pareto, 2]
+    frame["Lymphoid_Percentage"] = outputs[pareto, 3]
+    frame["Erythroid_Percentage"] = outputs[pareto, 4]
+    frame["Lineage_Deviation"] = lineage_error[pareto]
+    frame["Cost"] = costs[pareto]
+    frame["Factors"] = n_factors[pareto]
+
+    # Rank the front by equal-weight utility: scores up, lineage deviation and relative cost down
+    relative_cost = frame["Cost"] / max(frame["Cost"].max(), 1e-9) * 100
+    frame["Utility"] = (frame["Self_Renewal"] + frame["Multipotency"] - frame["Lineage_Deviation"] - 0.25 * relative_cost) / 2
+    return frame.sort_values("Utility", ascending=False, ignore_index=True), n_total, int(len(index_grid))
+
+
+def describe_protocol(row, factors=FACTORS):
+    """Readable recipe for one search result, e.g. "SCF 100 ng/mL, TPO 50 ng/mL" """
+    parts = [
+        f"{name} {row[name]:g} {spec['unit']}"
+        for name, spec in factors.items() if row.get(name, 0) > 0
+    ]
+    return ", ".join(parts) or "No added factors"
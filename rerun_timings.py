@@ -0,0 +1,71 @@
+"""
+Rerun timings for the dashboard.
+
+Full page runs and partial fragment runs record how long they took, so the
+cost of an interaction can be compared before and after moving it into a
+fragment. Timings are kept per server process in a bounded buffer and shown on
+the Memory Usage page. Every run is also observed by the rerun duration
+histogram of the metrics endpoint.
+"""
+import time
+import functools
+import threading
+import collections
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from metrics import RERUN_SECONDS
+
+# Most recent runs kept per server process
+MAX_TIMINGS = 2000
+
+_lock = threading.Lock()
+_timings = collections.deque(maxlen=MAX_TIMINGS)
+
+
+def record(scope, name, seconds):
+    """Add one run; scope is "page" for full reruns and "fragment" for partial ones"""
+    with _lock:
+        _timings.append((scope, name, seconds, time.time()))
+    RERUN_SECONDS.observe(seconds, scope=scope, name=name)
+
+
+@contextmanager
+def timed(scope, name):
+    """Record how long the enclosed block took, including runs cut short by st.rerun or st.switch_page"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(scope, name, time.perf_counter() - start)
+
+
+def timed_fragment(name):
+    """Make a function a Streamlit fragment whose every run is timed under ``name``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed("fragment", name):
+                return func(*args, **kwargs)
+        return st.fragment(wrapper)
+    return decorator
+
+
+def timing_summary():
+    """Run count and latency percentiles in milliseconds per (scope, name)"""
+    with _lock:
+        rows = list(_timings)
+    if not rows:
+        return pd.DataFrame(columns=["Scope", "Name", "Runs", "Median (ms)", "p95 (ms)", "Max (ms)"])
+
+    frame = pd.DataFrame(rows, columns=["Scope", "Name", "Seconds", "At"])
+    summary = frame.groupby(["Scope", "Name"])["Seconds"].agg(
+        Runs="size",
+        Median=lambda s: np.percentile(s, 50) * 1000,
+        P95=lambda s: np.percentile(s, 95) * 1000,
+        Max=lambda s: s.max() * 1000
+    ).reset_index()
+    return summary.rename(columns={"Median": "Median (ms)", "P95": "p95 (ms)", "Max": "Max (ms)"}).round(1)
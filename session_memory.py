@@ -0,0 +1,255 @@
+"""
+Per-session memory accounting for experiment state.
+
+Every experiment opened in a session leaves a few entries in session state
+(protocol changes, chat history, ...). `ExperimentMemoryManager` measures them,
+spills the least recently viewed experiments to disk once a session goes over
+its budget, and loads them back the next time the experiment is opened. A
+process-wide registry collects the per-session totals for the admin view.
+"""
+import os
+import sys
+import time
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Memory budget per session before idle experiments are spilled (override with OSIRIS_SESSION_MEMORY_BUDGET_MB)
+DEFAULT_BUDGET_BYTES = int(float(os.environ.get("OSIRIS_SESSION_MEMORY_BUDGET_MB", "256")) * 1024 * 1024)
+
+# Session state entries that belong to an experiment and can safely be written to disk.
+# Widget-backed keys (uploaders, inputs) are owned by Streamlit and are never spilled.
+SPILLABLE_PREFIXES = (
+    "chat_history_",
+    "file_processed_",
+    "hsc_predictions_",
+    "lineage_predictions_",
+    "batch_predictions_",
+    "protocol_search_",
+)
+
+# Sessions not seen for this long are dropped from the admin view
+SESSION_TIMEOUT_SECONDS = 3600
+
+_registry_lock = threading.Lock()
+_session_registry = {}
+
+
+def estimate_size(obj, _seen=None):
+    """Approximate the number of bytes held by a Python object and everything it references"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, np.ndarray):
+        size = obj.nbytes
+        if obj.dtype == object:
+            size += sum(estimate_size(item, _seen) for item in obj.ravel())
+        return size
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+        return sys.getsizeof(obj)
+    if hasattr(obj, "size") and hasattr(obj, "getvalue"):
+        # Uploaded files keep their full contents in memory
+        return int(obj.size)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), _seen)
+    return size
+
+
+def format_bytes(num_bytes):
+    """Human readable byte count"""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024 or unit == "GB":
+            return f"{num_bytes:.1f} {unit}" if unit != "B" else f"{int(num_bytes)} B"
+        num_bytes /= 1024
+
+
+class ExperimentMemoryManager:
+    """
+    Tracks and bounds the memory one session spends on experiment state.
+
+    Parameters:
+    -----------
+    session_state : MutableMapping
+        The session's st.session_state
+    session_id : str
+        Identifier used for spill files and the admin registry
+    spill_dir : str
+        Directory where evicted experiment state is written
+    budget_bytes : int
+        Total size of experiment state allowed before eviction starts
+    """
+
+    def __init__(self, session_state, session_id, spill_dir, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.session_state = session_state
+        self.session_id = session_id
+        self.spill_dir = os.path.join(spill_dir, session_id)
+        self.budget_bytes = budget_bytes
+
+        if "_experiment_last_viewed" not in self.session_state:
+            self.session_state["_experiment_last_viewed"] = {}
+        if "_experiment_spilled" not in self.session_state:
+            self.session_state["_experiment_spilled"] = {}
+
+    def _keys_for(self, experiment_id):
+        suffix = f"_{experiment_id}"
+        return [
+            key for key in list(self.session_state.keys())
+            if isinstance(key, str) and key.startswith(SPILLABLE_PREFIXES) and key.endswith(suffix)
+        ]
+
+    def _spill_path(self, experiment_id):
+        return os.path.join(self.spill_dir, f"{experiment_id}.pkl")
+
+    def footprint(self, experiment_ids):
+        """Return {experiment_id: bytes in session state} for the given experiments"""
+        return {
+            experiment_id: sum(estimate_size(self.session_state[key]) for key in self._keys_for(experiment_id))
+            for experiment_id in experiment_ids
+        }
+
+    def is_spilled(self, experiment_id):
+        return experiment_id in self.session_state["_experiment_spilled"]
+
+    def touch(self, experiment_id):
+        """Mark an experiment as just viewed, restoring it first if it had been spilled"""
+        self.restore(experiment_id)
+        self.session_state["_experiment_last_viewed"][experiment_id] = time.time()
+
+    def spill(self, experiment_id):
+        """Write an experiment's session state to disk and drop it from memory"""
+        keys = self._keys_for(experiment_id)
+        if not keys:
+            return 0
+        payload = {key: self.session_state[key] for key in keys}
+        size = sum(estimate_size(value) for value in payload.values())
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        tmp_path = f"{self._spill_path(experiment_id)}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._spill_path(experiment_id))
+
+        for key in keys:
+            del self.session_state[key]
+        self.session_state["_experiment_spilled"][experiment_id] = size
+        return size
+
+    def restore(self, experiment_id):
+        """Load a spilled experiment back into session state"""
+        if not self.is_spilled(experiment_id):
+            return False
+        path = self._spill_path(experiment_id)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                payload = pickle.load(f)
+            for key, value in payload.items():
+                self.session_state[key] = value
+            os.remove(path)
+        del self.session_state["_experiment_spilled"][experiment_id]
+        return True
+
+    def enforce_budget(self, experiment_ids, keep=None):
+        """
+        Spill least recently viewed experiments until the session fits its budget.
+
+        The session's totals are published to the admin registry afterwards,
+        so every session that enforces its budget is listed.
+
+        Returns:
+        --------
+        list
+            Ids of the experiments that were spilled
+        """
+        sizes = self.footprint([e for e in experiment_ids if not self.is_spilled(e)])
+        total = sum(sizes.values())
+        last_viewed = self.session_state["_experiment_last_viewed"]
+
+        spilled = []
+        for experiment_id in sorted(sizes, key=lambda e: last_viewed.get(e, 0)):
+            if total <= self.budget_bytes:
+                break
+            if experiment_id == keep or sizes[experiment_id] == 0:
+                continue
+            self.spill(experiment_id)
+            total -= sizes[experiment_id]
+            spilled.append(experiment_id)
+        self._publish(len(experiment_ids), total, sum(self.session_state["_experiment_spilled"].values()))
+        return spilled
+
+    def _publish(self, experiments, in_memory_bytes, spilled_bytes):
+        """Publish this session's totals to the admin registry"""
+        with _registry_lock:
+            _session_registry[self.session_id] = {
+                "session_id": self.session_id,
+                "experiments": experiments,
+                "in_memory_bytes": in_memory_bytes,
+                "spilled_bytes": spilled_bytes,
+                "budget_bytes": self.budget_bytes,
+                "last_seen": time.time()
+            }
+
+    def report(self, experiments, store=None):
+        """
+        Measure every experiment of the session and publish the totals to the admin registry.
+
+        Returns:
+        --------
+        list of dict
+            One row per experiment with in-memory, spilled and shared on-disk
+            sizes, and the size of its stored frames before and after compaction
+        """
+        ids = [experiment["id"] for experiment in experiments]
+        sizes = self.footprint(ids)
+        spilled = self.session_state["_experiment_spilled"]
+        last_viewed = self.session_state["_experiment_last_viewed"]
+
+        rows = []
+        for experiment in experiments:
+            experiment_id = experiment["id"]
+            compaction = store.read_meta(experiment_id).get("frame_bytes", {}) if store is not None else {}
+            rows.append({
+                "experiment_id": experiment_id,
+                "name": experiment["name"],
+                "in_memory_bytes": sizes.get(experiment_id, 0),
+                "spilled_bytes": spilled.get(experiment_id, 0),
+                "store_bytes": store_size(store, experiment_id) if store is not None else 0,
+                "frame_bytes_before": sum(sizes["before"] for sizes in compaction.values()),
+                "frame_bytes_after": sum(sizes["after"] for sizes in compaction.values()),
+                "last_viewed": last_viewed.get(experiment_id)
+            })
+
+        self._publish(len(rows), sum(r["in_memory_bytes"] for r in rows), sum(r["spilled_bytes"] for r in rows))
+        return rows
+
+
+def store_size(store, experiment_id):
+    """Bytes an experiment occupies in the store; these pages are shared by all sessions"""
+    total = 0
+    for dirpath, _, filenames in os.walk(store.experiment_dir(experiment_id)):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(dirpath, filename))
+    return total
+
+
+def all_sessions():
+    """Return the latest memory report of every live session, dropping sessions that went quiet"""
+    cutoff = time.time() - SESSION_TIMEOUT_SECONDS
+    with _registry_lock:
+        for session_id in [s for s, row in _session_registry.items() if row["last_seen"] < cutoff]:
+            del _session_registry[session_id]
+        return [dict(row) for row in _session_registry.values()]
@@ -2,9 +2,30 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
+import time
 import datetime
 import random
+import uuid
 import requests
+from prediction_client import (
+    DEFAULT_BACKEND_URL, FeatureMismatchError, get_feature_index, prepare_upload,
+    sniff_table, summarize_predictions, validate_samples, predict_samples
+)
+from prediction_cache import PredictionCache, predict_incremental
+from dash_common import (
+    track_session, get_admission_controller, current_user, get_experiment_store, get_experiment_catalog,
+    selected_experiment, open_experiment, render_experiment_catalog
+)
+from admission import AdmissionError, file_fingerprint
+from metrics import UPLOAD_BYTES
+from rerun_timings import record
+from tracing import Trace
+
+# How often a queued prediction refreshes its place in the queue
+QUEUE_POLL_SECONDS = 0.5
+
+# Runs cut short by st.rerun are not timed; the page they rerun into is
+run_started = time.perf_counter()
 
 # Set page configuration
 st.set_page_config(
@@ -55,6 +76,104 @@ def initialize_experiment_data():
     
     return hsc_predictions, lineage_predictions
 
+def render_cell_summary(summary, key, color_map=None):
+    """Show aggregated per-cell predictions; cost depends on classes and bins, not on cells"""
+    st.caption(f"{summary['n_cells']:,} cells")
+    
+    fractions = summary["fractions"]
+    fig = px.bar(
+        fractions,
+        x="fraction",
+        y="class",
+        orientation="h",
+        color="class",
+        color_discrete_map=color_map,
+        text=fractions["fraction"].map("{:.1%}".format),
+        labels={"fraction": "Fraction of cells", "class": ""}
+    )
+    fig.update_layout(height=80 + 40 * len(fractions), showlegend=False, xaxis_range=[0, 1], margin=dict(t=10, b=10))
+    st.plotly_chart(fig, use_container_width=True, key=f"fractions_{key}")
+    
+    # Pre-binned counts, so the browser receives bins rather than every probability
+    histogram = summary["histogram"]
+    fig = px.bar(
+        histogram,
+        x=(histogram["bin_start"] + histogram["bin_end"]) / 2,
+        y="cells",
+        color="class",
+        color_discrete_map=color_map,
+        barmode="overlay",
+        opacity=0.6,
+        labels={"x": "Probability", "cells": "Cells"}
+    )
+    fig.update_traces(width=float((histogram["bin_end"] - histogram["bin_start"]).iloc[0]))
+    fig.update_layout(height=300, margin=dict(t=10, b=10))
+    st.plotly_chart(fig, use_container_width=True, key=f"histogram_{key}")
+    
+    with st.expander("Per-cell calls"):
+        # st.dataframe only draws the visible rows and sorts on column click
+        st.dataframe(
+            summary["cells"],
+            hide_index=True,
+            use_container_width=True,
+            height=350,
+            column_config={
+                "cell": "Cell",
+                "class": "Most likely class",
+                "probability": st.column_config.ProgressColumn("Probability", format="%.2f", min_value=0, max_value=1)
+            }
+        )
+
+def render_trace_breakdown(trace, key):
+    """Waterfall of the spans of one traced prediction"""
+    breakdown = trace.breakdown()
+    st.caption(f"Request ID `{trace.request_id}`, {breakdown['Duration (ms)'].iloc[0]:,.0f} ms in total")
+    fig = px.bar(
+        breakdown,
+        x="Duration (ms)",
+        y="Span",
+        base="Start (ms)",
+        orientation="h",
+        hover_data={"Error": True}
+    )
+    fig.update_yaxes(autorange="reversed", title=None)
+    fig.update_xaxes(title="Milliseconds since the click")
+    fig.update_layout(height=60 + 30 * len(breakdown), margin=dict(l=10, r=10, t=10, b=10))
+    st.plotly_chart(fig, use_container_width=True, key=f"trace_chart_{key}")
+
+def load_stored_results(experiment_id):
+    """
+    Show an experiment's predictions as they are kept in the store.
+
+    Results are stored by the session that uploaded them, so this is how
+    other sessions, and every session after a restart, see them.
+    """
+    cache = PredictionCache(get_experiment_store(), experiment_id)
+    cell_arrays = cache.experiment_arrays()
+    if len(cell_arrays["hsc"]):
+        st.session_state[f"cell_summary_{experiment_id}"] = {
+            model: summarize_predictions(arrays) for model, arrays in cell_arrays.items() if len(arrays)
+        }
+        st.session_state[f"hsc_predictions_{experiment_id}"] = []
+        st.session_state[f"lineage_predictions_{experiment_id}"] = []
+    else:
+        sample_arrays = cache.latest_sample_arrays()
+        if sample_arrays is None:
+            return
+        st.session_state[f"cell_summary_{experiment_id}"] = {}
+        st.session_state[f"hsc_predictions_{experiment_id}"] = sample_arrays["hsc"].to_records()
+        st.session_state[f"lineage_predictions_{experiment_id}"] = sample_arrays["lineage"].to_records()
+    st.session_state.data_uploaded[experiment_id] = True
+
+def wait_for_slot(ticket):
+    """Block until the ticket is admitted, showing its place in the queue meanwhile"""
+    if ticket.wait(0):
+        return
+    message = st.empty()
+    while not ticket.wait(QUEUE_POLL_SECONDS):
+        message.info(f"⏳ Waiting for a free prediction slot: position {ticket.position()} in the queue")
+    message.empty()
+
 # Initialize session state variables
 if 'experiments' not in st.session_state:
     st.session_state.experiments = []
@@ -73,6 +192,9 @@ if 'page_just_loaded' not in st.session_state:
     st.session_state.current_page = "Welcome"  # Reset to Welcome page on each fresh load
     st.session_state.page_just_loaded = True
 
+# Serve operational metrics on a side port and count this session as active
+track_session()
+
 # Sidebar navigation
 with st.sidebar:
     st.header("Osiris v.1")
@@ -86,19 +208,23 @@ with st.sidebar:
     if st.session_state.get('show_create_dialog', False):
         with st.form("new_experiment_form"):
             experiment_name = st.text_input("Experiment Name", key="new_experiment_name")
+            experiment_tags = st.text_input("Tags", placeholder="e.g. cord blood, UM171", key="new_experiment_tags")
             submitted = st.form_submit_button("Create Experiment")
             
             if submitted and experiment_name:
-                # Create a new experiment
-                experiment_id = len(st.session_state.experiments) + 1
+                # Create a new experiment; ids must be unique across sessions since cached predictions live in the shared store
+                experiment_id = uuid.uuid4().hex[:12]
                 new_experiment = {
                     "id": experiment_id,
                     "name": experiment_name,
                     "created_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
                 
-                # Add the new experiment to the list
-                st.session_state.experiments.append(new_experiment)
+                # Register it in the shared catalog so it is listed in every session
+                get_experiment_catalog().add(
+                    experiment_id, "simplified", experiment_name, new_experiment["created_at"],
+                    owner=current_user(), tags=experiment_tags
+                )
                 
                 # Initialize empty prediction data for the new experiment
                 st.session_state[f"hsc_predictions_{experiment_id}"] = []
@@ -108,23 +234,22 @@ with st.sidebar:
                 st.session_state.data_uploaded[experiment_id] = False
                 
                 # Set this as the current experiment
-                st.session_state.current_experiment = experiment_id
+                open_experiment(new_experiment)
                 st.session_state.current_page = "Dashboard"
                 
                 # Hide the dialog
                 st.session_state.show_create_dialog = False
                 st.rerun()
     
-    # Display experiment tabs if any exist
-    if st.session_state.experiments:
-        st.markdown("### My Experiments")
-        
-        for experiment in st.session_state.experiments:
-            # Create a button for each experiment
-            if st.button(f"📊 {experiment['name']}", use_container_width=True, key=f"experiment_{experiment['id']}"):
-                st.session_state.current_experiment = experiment["id"]
-                st.session_state.current_page = "Dashboard"
-                st.rerun()
+    # Experiments of the whole lab, searched and paged from the catalog
+    st.markdown("### Experiments")
+    
+    def show_experiment(experiment):
+        load_stored_results(experiment["id"])
+        st.session_state.current_page = "Dashboard"
+        st.rerun()
+    
+    render_experiment_catalog("simplified", show_experiment)
 
 # Display the appropriate page based on the current_page value
 if st.session_state.current_page == "Welcome":
@@ -161,7 +286,7 @@ elif st.session_state.current_page == "Dashboard":
     # Check if an experiment is selected
     if st.session_state.current_experiment is not None:
         # Find the selected experiment
-        selected_exp = next((exp for exp in st.session_state.experiments if exp["id"] == st.session_state.current_experiment), None)
+        selected_exp = selected_experiment()
         
         if selected_exp:
             # Display experiment-specific dashboard
@@ -178,14 +303,44 @@ elif st.session_state.current_page == "Dashboard":
             
             # File uploader section
             st.markdown("### Upload Data")
-            uploaded_file = st.file_uploader(
-                "Upload your `.tsv` file here", 
+            uploaded_files = st.file_uploader(
+                "Upload your `.tsv` file here (select several files to score a whole plate)", 
                 type=["tsv"],
+                accept_multiple_files=True,
                 key=f"uploader_{selected_exp['id']}"
             )
+            uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
             
             # Backend URL
-            backend_url = "http://localhost:8080/predict"
+            backend_url = DEFAULT_BACKEND_URL
+            
+            # Several files: validate in parallel and score them all in one action
+            if len(uploaded_files) > 1:
+                st.markdown(f"""
+                <div class="upload-success">
+                    <h4 style="margin-top: 0; color: #4257B2;">✅ {len(uploaded_files)} files uploaded successfully</h4>
+                    <p style="margin-bottom: 0;"><strong>Files:</strong> {", ".join(f.name for f in uploaded_files)}</p>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                if st.button("Run Batch Prediction", key=f"batch_predict_btn_{selected_exp['id']}"):
+                    for f in uploaded_files:
+                        UPLOAD_BYTES.observe(f.size, app="simplified_dash")
+                    try:
+                        # A whole plate takes one place in the queue
+                        fingerprint = file_fingerprint(
+                            ",".join(f.name for f in uploaded_files),
+                            b"".join(file_fingerprint(f.name, f.getvalue()).encode() for f in uploaded_files)
+                        )
+                        with get_admission_controller().submit(current_user(), fingerprint) as ticket:
+                            wait_for_slot(ticket)
+                            with st.spinner(f"Processing {len(uploaded_files)} samples..."):
+                                samples = validate_samples([(f.name, f.getvalue()) for f in uploaded_files], backend_url)
+                                st.session_state[f"batch_predictions_{selected_exp['id']}"] = predict_samples(samples, backend_url)
+                    except AdmissionError as e:
+                        st.warning(str(e))
+                    except Exception as e:
+                        st.error(f"Could not connect to backend: {e}")
             
             if uploaded_file is not None:
                 # Display success message
@@ -196,43 +351,167 @@ elif st.session_state.current_page == "Dashboard":
                 </div>
                 """, unsafe_allow_html=True)
                 
+                # Check the file's structure from its first few KB before anything is sent
+                sniffed = sniff_table(uploaded_file.name, uploaded_file, get_feature_index(backend_url, fetch=False))
+                st.caption(
+                    f"{'' if sniffed['rows_exact'] else '~'}{sniffed['n_rows']:,} "
+                    f"{'genes' if sniffed['genes_as_rows'] else 'cells'} × {sniffed['n_cols']:,} "
+                    f"{'cells' if sniffed['genes_as_rows'] else 'genes'}"
+                )
+                for warning in sniffed["warnings"]:
+                    st.warning(warning)
+                for error in sniffed["errors"]:
+                    st.error(error)
+                
                 # Run prediction button
-                if st.button("Run Prediction", key=f"predict_btn_{selected_exp['id']}"):
+                if st.button("Run Prediction", key=f"predict_btn_{selected_exp['id']}", disabled=bool(sniffed["errors"])):
+                    UPLOAD_BYTES.observe(uploaded_file.size, app="simplified_dash")
+                    
+                    # Trace the prediction from the click to the rendered result; the id goes to the backend too
+                    trace = Trace("prediction", experiment=selected_exp['id'], file=uploaded_file.name, bytes=uploaded_file.size)
+                    st.session_state[f"last_trace_{selected_exp['id']}"] = trace
                     try:
-                        with st.spinner("Processing your data..."):
-                            # Send the file as multipart/form-data
-                            files = {"file": uploaded_file}
-                            response = requests.post(backend_url, files=files)
+                        with trace.span("read_upload"):
+                            raw = uploaded_file.getvalue()
+                        
+                        # Wait for a fair share of the backend; the slot is given back however this block ends
+                        with get_admission_controller().submit(current_user(), file_fingerprint(uploaded_file.name, raw)) as ticket:
+                            with trace.span("queue"):
+                                wait_for_slot(ticket)
                             
-                            if response.status_code == 200:
-                                data = response.json()
+                            with st.spinner("Processing your data..."):
+                                # Keep only the genes the models use, in model order, before uploading
+                                with trace.span("serialize"):
+                                    content, alignment = prepare_upload(uploaded_file.name, raw, backend_url)
+                                
+                                # Only cells this experiment has not been scored on go to the backend; the
+                                # rest come from its prediction cache and are merged with the new results
+                                data = predict_incremental(
+                                    uploaded_file.name, content, alignment, trace,
+                                    PredictionCache(get_experiment_store(), selected_exp['id']), backend_url
+                                )
+                                
+                                # Per-cell results are aggregated once here instead of on every rerun
+                                with trace.span("summarize"):
+                                    cell_summary = {
+                                        model: summarize_predictions(data[f"{model}_arrays"])
+                                        for model in ("hsc", "lineage") if data[f"{model}_arrays"].per_cell
+                                    }
                                 st.success(data["message"])
                                 
                                 # Store predictions in session state
                                 st.session_state[hsc_predictions_key] = data.get("hsc_predictions", [])
                                 st.session_state[lineage_predictions_key] = data.get("lineage_predictions", [])
+                                st.session_state[f"cell_summary_{selected_exp['id']}"] = cell_summary
+                                st.session_state[f"alignment_{selected_exp['id']}"] = alignment
                                 
-                                # Mark data as uploaded
+                                # Mark data as uploaded; the results are rendered, and the trace finished, on the rerun
                                 st.session_state.data_uploaded[selected_exp['id']] = True
+                                st.session_state[f"pending_trace_{selected_exp['id']}"] = trace
                                 st.rerun()
-                            else:
-                                st.error(f"Server returned an error: {response.status_code}")
-                                st.json(response.json())
+                    except requests.HTTPError as e:
+                        trace.finish(f"HTTP {e.response.status_code}")
+                        st.error(f"Server returned an error: {e.response.status_code} (request ID {trace.request_id})")
+                        # Proxies and gateways answer with HTML or an empty body rather than JSON
+                        try:
+                            st.json(e.response.json())
+                        except ValueError:
+                            st.code(e.response.text or "(empty response)")
+                    except AdmissionError as e:
+                        trace.finish(str(e))
+                        st.warning(str(e))
+                    except FeatureMismatchError as e:
+                        trace.finish(str(e))
+                        st.error(f"This file does not match the prediction models: {e}")
+                        with st.expander(f"Missing genes ({len(e.report['missing_genes'])})"):
+                            st.write(", ".join(e.report["missing_genes"]))
                     except Exception as e:
-                        st.error(f"Could not connect to backend: {e}")
+                        trace.finish(str(e))
+                        st.error(f"Could not connect to backend: {e} (request ID {trace.request_id})")
+            
+            # Display batch predictions as one table with a row per sample
+            batch_predictions = st.session_state.get(f"batch_predictions_{selected_exp['id']}")
+            if batch_predictions:
+                st.markdown("---")
+                st.markdown("### Batch Predictions")
+                
+                rows = []
+                for result in batch_predictions:
+                    hsc_class, hsc_prob = result["hsc_prediction"]
+                    lineage_class, lineage_prob = result["lineage_prediction"]
+                    rows.append({
+                        "Sample": result["sample"],
+                        "Genes Matched": f"{result['alignment']['matched_genes']}/{result['alignment']['model_genes']}" if result.get("alignment") else "",
+                        "HSC Fate": hsc_class,
+                        "HSC Probability": hsc_prob,
+                        "Lineage Bias": lineage_class,
+                        "Lineage Probability": lineage_prob,
+                        "Error": result["error"] or ""
+                    })
+                
+                st.dataframe(
+                    pd.DataFrame(rows),
+                    hide_index=True,
+                    use_container_width=True,
+                    column_config={
+                        "HSC Probability": st.column_config.ProgressColumn(format="%.2f", min_value=0, max_value=1),
+                        "Lineage Probability": st.column_config.ProgressColumn(format="%.2f", min_value=0, max_value=1)
+                    }
+                )
+                
+                st.download_button(
+                    "Download CSV",
+                    data=lambda: pd.DataFrame(rows).to_csv(index=False),
+                    file_name=f"{selected_exp['name']}_batch_predictions.csv",
+                    mime="text/csv",
+                    key=f"batch_download_{selected_exp['id']}"
+                )
+                
+                failed = sum(1 for result in batch_predictions if result["error"])
+                if failed:
+                    st.warning(f"{failed} of {len(batch_predictions)} samples could not be scored.")
+                for result in batch_predictions:
+                    missing_genes = (result.get("alignment") or {}).get("missing_genes")
+                    if result["error"] and missing_genes:
+                        with st.expander(f"{result['sample']}: missing genes ({len(missing_genes)})"):
+                            st.write(", ".join(missing_genes))
             
             # Display predictions if data has been uploaded and processed
             if st.session_state.data_uploaded.get(selected_exp['id'], False):
+                # A prediction that just finished is traced until its results are drawn
+                pending_trace = st.session_state.pop(f"pending_trace_{selected_exp['id']}", None)
+                render_span = pending_trace.start_span("render") if pending_trace else None
+                
                 st.markdown("---")
                 
                 # Get predictions from session state
                 hsc_predictions = st.session_state[hsc_predictions_key]
                 lineage_predictions = st.session_state[lineage_predictions_key]
                 
+                # Show how the upload was matched to the model's gene panel
+                alignment = st.session_state.get(f"alignment_{selected_exp['id']}")
+                if alignment:
+                    st.caption(
+                        f"Sent {alignment['matched_genes']:,} of {alignment['model_genes']:,} model genes "
+                        f"(from {alignment['input_genes']:,} in the file); "
+                        f"{len(alignment['missing_genes']):,} missing genes were zero-filled."
+                    )
+                
+                cell_summary = st.session_state.get(f"cell_summary_{selected_exp['id']}", {})
+                
+                # Color map for different lineages
+                color_map = {
+                    "Myeloid": "#4257B2",  # Blue
+                    "Lymphoid": "#00CC96", # Green
+                    "Erythroid": "#FF4B4B" # Red
+                }
+                
                 # Display HSC predictions
                 st.markdown("### HSC Fate Prediction")
                 
-                if hsc_predictions:
+                if "hsc" in cell_summary:
+                    render_cell_summary(cell_summary["hsc"], f"hsc_{selected_exp['id']}")
+                elif hsc_predictions:
                     # Create columns for displaying predictions
                     cols = st.columns(len(hsc_predictions))
                     
@@ -254,17 +533,12 @@ elif st.session_state.current_page == "Dashboard":
                 # Display Lineage predictions
                 st.markdown("### Lineage Bias Prediction")
                 
-                if lineage_predictions:
+                if "lineage" in cell_summary:
+                    render_cell_summary(cell_summary["lineage"], f"lineage_{selected_exp['id']}", color_map)
+                elif lineage_predictions:
                     # Create columns for displaying predictions
                     cols = st.columns(len(lineage_predictions))
                     
-                    # Color map for different lineages
-                    color_map = {
-                        "Myeloid": "#4257B2",  # Blue
-                        "Lymphoid": "#00CC96", # Green
-                        "Erythroid": "#FF4B4B" # Red
-                    }
-                    
                     for i, result in enumerate(lineage_predictions):
                         with cols[i]:
                             # Get color based on lineage type
@@ -279,6 +553,15 @@ elif st.session_state.current_page == "Dashboard":
                                 <div style="font-size: 0.8rem; color: #666;">probability</div>
                             </div>
                             """, unsafe_allow_html=True)
+                
+                if pending_trace:
+                    pending_trace.end_span(render_span)
+                    pending_trace.finish()
+            
+            # Optional timing breakdown of the last prediction, from the click to the rendered result
+            last_trace = st.session_state.get(f"last_trace_{selected_exp['id']}")
+            if last_trace and last_trace.finished and st.toggle("Show request timing", key=f"show_trace_{selected_exp['id']}"):
+                render_trace_breakdown(last_trace, selected_exp['id'])
     else:
         # Show default dashboard when no experiment is selected
         st.title("HSC Dashboard")
@@ -290,6 +573,9 @@ elif st.session_state.current_page == "Dashboard":
 st.markdown("---")
 st.caption("© 2025 Osiris Bio")
 
+# Full run duration per page, exposed on the metrics endpoint
+record("page", st.session_state.current_page, time.perf_counter() - run_started)
+
 # Main function to run the app
 if __name__ == "__main__":
     pass
@@ -0,0 +1,292 @@
+"""
+Local stand-in for the Osiris prediction backend.
+
+Serves ``/predict``, ``/predict/batch`` and ``/features`` with random predictions,
+configurable latency and error rate, and either JSON or Arrow IPC responses.
+Like the real backend it echoes the caller's ``X-Request-ID``, reports its
+phases in a ``Server-Timing`` header and logs every request under its id.
+Useful for exercising the frontends and prediction_client without a GPU backend.
+
+Run with::
+
+    python stub_backend.py --port 8080 --latency 0.2 --error-rate 0.05 --per-cell
+"""
+import io
+import json
+import time
+import random
+import argparse
+import threading
+import collections
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pyarrow as pa
+
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+
+HSC_CLASSES = ["HSC", "MPP", "Progenitor"]
+LINEAGE_CLASSES = ["Myeloid", "Lymphoid", "Erythroid"]
+
+# Gene panel advertised by /features
+STUB_FEATURES = [
+    "CD34", "KIT", "GATA2", "RUNX1", "TAL1", "BMI1", "HOXA9",
+    "MEIS1", "MECOM", "MYB", "GATA1", "SPI1", "CEBPA", "FLT3", "MPL", "IL7R", "KLF1"
+]
+STUB_ALIASES = {"PU.1": "SPI1", "SCFR": "KIT", "CD117": "KIT"}
+
+# Most recent requests kept in the request log
+REQUEST_LOG_SIZE = 1000
+
+
+def _parse_multipart(content_type, body):
+    """Return {field name: [(filename, bytes), ...]} for a multipart/form-data body"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body
+    )
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        fields.setdefault(name, []).append((part.get_filename(), part.get_payload(decode=True)))
+    return fields
+
+
+def _count_cells(content):
+    """Number of data rows in an uploaded table"""
+    return max(content.count(b"\n") - 1, 1)
+
+
+class StubBackend:
+    """
+    Configurable fake prediction server.
+
+    Parameters:
+    -----------
+    latency : float
+        Seconds each prediction takes
+    jitter : float
+        Extra uniformly random latency, in seconds
+    error_rate : float
+        Fraction of predictions answered with HTTP 500
+    per_cell : bool
+        Return one prediction per uploaded row instead of per sample
+    arrow : bool
+        Answer in Arrow IPC when the client accepts it
+    batch : bool
+        Serve /predict/batch; when False the endpoint returns 404
+    features : bool
+        Serve the /features manifest; when False it returns 404
+    seed : int
+        Seed for the random predictions and error injection
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, per_cell=False,
+                 arrow=True, batch=True, features=True, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.per_cell = per_cell
+        self.arrow = arrow
+        self.batch = batch
+        self.features = features
+        self._random = random.Random(seed)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.requests_served = 0
+        self.request_log = collections.deque(maxlen=REQUEST_LOG_SIZE)
+        self.httpd = None
+
+    def _sleep(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        time.sleep(delay)
+
+    def _log(self, request_id, path, status, phases):
+        """Record a request the way the backend logs it, keyed by the caller's request id"""
+        with self._lock:
+            self.request_log.append({"request_id": request_id, "path": path, "status": status, **phases})
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _probabilities(self, n_rows, n_classes):
+        with self._lock:
+            return self._rng.dirichlet(np.ones(n_classes), size=n_rows).astype(np.float32)
+
+    def predictions(self, content):
+        """Random predictions for one upload as {model: (classes, probabilities, cells)}"""
+        n_cells = _count_cells(content) if self.per_cell else 1
+        cells = [f"cell_{i}" for i in range(n_cells)] if self.per_cell else None
+        return {
+            "hsc": (HSC_CLASSES, self._probabilities(n_cells, len(HSC_CLASSES)), cells),
+            "lineage": (LINEAGE_CLASSES, self._probabilities(n_cells, len(LINEAGE_CLASSES)), cells),
+        }
+
+    @staticmethod
+    def to_json(predictions):
+        data = {"message": "Prediction complete (stub backend)"}
+        for model, (classes, probabilities, cells) in predictions.items():
+            records = []
+            for row, probs in enumerate(probabilities):
+                for name, p in zip(classes, probs):
+                    record = {"class": name, "probability": f"{p:.4f}"}
+                    if cells is not None:
+                        record["cell"] = cells[row]
+                    records.append(record)
+            data[f"{model}_predictions"] = records
+        return data
+
+    @staticmethod
+    def to_arrow(predictions):
+        """Encode predictions as an Arrow IPC stream, one record batch per model"""
+        schema = pa.schema(
+            [
+                ("model", pa.dictionary(pa.int8(), pa.string())),
+                ("class", pa.dictionary(pa.int8(), pa.string())),
+                ("probability", pa.float32()),
+            ] + ([("cell", pa.string())] if next(iter(predictions.values()))[2] is not None else []),
+            metadata={"message": "Prediction complete (stub backend)"}
+        )
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for model, (classes, probabilities, cells) in predictions.items():
+                n_rows, n_classes = probabilities.shape
+                columns = [
+                    pa.DictionaryArray.from_arrays(np.zeros(n_rows * n_classes, dtype=np.int8), [model]),
+                    pa.DictionaryArray.from_arrays(np.tile(np.arange(n_classes, dtype=np.int8), n_rows), classes),
+                    pa.array(probabilities.ravel()),
+                ]
+                if cells is not None:
+                    columns.append(pa.array(np.repeat(np.array(cells, dtype=object), n_classes)))
+                writer.write_batch(pa.record_batch(columns, schema=schema))
+        return sink.getvalue()
+
+    def _handler(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, body=b"", content_type="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if self.headers.get("X-Request-ID"):
+                    self.send_header("X-Request-ID", self.headers["X-Request-ID"])
+                phases = getattr(self, "phases", {})
+                if phases:
+                    self.send_header("Server-Timing", ", ".join(f"{name};dur={ms:.1f}" for name, ms in phases.items()))
+                self.end_headers()
+                self.wfile.write(body)
+                if self.command == "POST":
+                    backend._log(self.headers.get("X-Request-ID"), self.path, status, phases)
+
+            def _send_json(self, status, data):
+                self._send(status, json.dumps(data).encode())
+
+            def do_GET(self):
+                if self.path == "/features" and backend.features:
+                    self._send_json(200, {"features": STUB_FEATURES, "aliases": STUB_ALIASES, "version": "stub-1"})
+                else:
+                    self._send_json(404, {"detail": "Not found"})
+
+            def _phase(self, name, started):
+                self.phases[name] = (time.perf_counter() - started) * 1000
+
+            def do_POST(self):
+                self.phases = {}
+                started = time.perf_counter()
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                fields = _parse_multipart(self.headers.get("Content-Type", ""), body)
+                self._phase("parse", started)
+                with backend._lock:
+                    backend.requests_served += 1
+
+                if self.path == "/predict":
+                    uploads = fields.get("file", [])
+                    if not uploads:
+                        self._send_json(400, {"detail": "No file uploaded"})
+                        return
+                    started = time.perf_counter()
+                    backend._sleep()
+                    if backend._should_fail():
+                        self._phase("inference", started)
+                        self._send_json(500, {"detail": "Injected stub failure"})
+                        return
+                    predictions = backend.predictions(uploads[0][1])
+                    self._phase("inference", started)
+                    started = time.perf_counter()
+                    if backend.arrow and ARROW_STREAM_TYPE in self.headers.get("Accept", ""):
+                        body, content_type = backend.to_arrow(predictions), ARROW_STREAM_TYPE
+                    else:
+                        body, content_type = json.dumps(backend.to_json(predictions)).encode(), "application/json"
+                    self._phase("serialize", started)
+                    self._send(200, body, content_type)
+
+                elif self.path == "/predict/batch" and backend.batch:
+                    backend._sleep()
+                    results = []
+                    for filename, content in fields.get("files", []):
+                        if backend._should_fail():
+                            continue
+                        result = backend.to_json(backend.predictions(content))
+                        result["sample"] = filename
+                        results.append(result)
+                    self._send_json(200, {"results": results})
+
+                else:
+                    self._send_json(404, {"detail": "Not found"})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve on a background thread and return the /predict URL"""
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://{host}:{self.httpd.server_address[1]}/predict"
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the prediction backend")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per prediction")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random seconds per prediction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of predictions that fail")
+    parser.add_argument("--per-cell", action="store_true", help="Return one prediction per uploaded row")
+    parser.add_argument("--json-only", action="store_true", help="Never answer in Arrow, like older backends")
+    parser.add_argument("--no-batch", action="store_true", help="Disable /predict/batch")
+    parser.add_argument("--no-features", action="store_true", help="Disable the /features manifest")
+    args = parser.parse_args()
+
+    backend = StubBackend(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        per_cell=args.per_cell,
+        arrow=not args.json_only,
+        batch=not args.no_batch,
+        features=not args.no_features
+    )
+    print(f"Stub backend listening on {backend.start(args.host, args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        backend.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+from admission import AdmissionController
+
+
+def _run_in_order(controller, submissions):
+    """Submit every (user, name) pair, then release running tickets one at a time; returns the order they ran in"""
+    tickets = [controller.submit(user, name) for user, name in submissions]
+    order = []
+    while len(order) < len(tickets):
+        running = [t for t in tickets if t.state == "running"]
+        assert len(running) == 1
+        order.append(running[0].fingerprint)
+        running[0].release()
+    return order
+
+
+def test_served_user_waits_behind_later_submitters():
+    controller = AdmissionController(max_in_flight=1, max_per_user=1, max_queued_per_user=3)
+    order = _run_in_order(controller, [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")])
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_users_take_turns():
+    controller = AdmissionController(max_in_flight=1, max_per_user=1, max_queued_per_user=3)
+    order = _run_in_order(controller, [("a", "a1"), ("b", "b1"), ("a", "a2"), ("b", "b2"), ("a", "a3"), ("c", "c1")])
+    assert order == ["a1", "b1", "c1", "a2", "b2", "a3"]
+
+
+def test_positions_follow_admission_order():
+    controller = AdmissionController(max_in_flight=1, max_per_user=1, max_queued_per_user=3)
+    tickets = {name: controller.submit(user, name) for user, name in [("a", "a1"), ("a", "a2"), ("b", "b1"), ("c", "c1")]}
+    assert [tickets[name].position() for name in ("a1", "b1", "c1", "a2")] == [0, 1, 2, 3]
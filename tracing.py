@@ -0,0 +1,206 @@
+"""
+Request tracing for predictions.
+
+A `Trace` follows one prediction from the button click to the rendered result
+as a tree of timed spans (read upload, serialize, network, decode, render).
+Requests to the backend carry the trace in a W3C ``traceparent`` header and its
+id in ``X-Request-ID``, so backend logs can be joined with the frontend spans.
+Backend phases reported in a ``Server-Timing`` header become child spans of
+the network span.
+
+Finished traces are written as OTLP/JSON, one export request per line, to a
+local file and, when configured, posted to an OpenTelemetry collector.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+import requests
+
+# Where finished traces go (override with OSIRIS_TRACE_FILE; set it empty to disable the file)
+TRACE_FILE = os.environ.get("OSIRIS_TRACE_FILE", os.path.join(os.path.expanduser("~"), ".osiris", "traces.jsonl"))
+
+# OTLP/HTTP traces endpoint of a collector, e.g. http://localhost:4318/v1/traces (off when unset)
+OTLP_ENDPOINT = os.environ.get("OSIRIS_OTLP_ENDPOINT")
+
+SERVICE_NAME = os.environ.get("OSIRIS_SERVICE_NAME", "osiris-frontend")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+
+def _new_id(n_bytes):
+    return os.urandom(n_bytes).hex()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Trace:
+    """
+    Spans of one traced request, rooted at a span named after the action.
+
+    Spans are plain dicts so a trace can be kept in session state while the
+    result is rendered on the next run.
+    """
+
+    def __init__(self, name, **attributes):
+        self.trace_id = _new_id(16)
+        self.spans = []
+        self.finished = False
+        self.root = self.start_span(name, parent=False, **attributes)
+
+    @property
+    def request_id(self):
+        """Id sent to the backend in X-Request-ID"""
+        return self.trace_id
+
+    def start_span(self, name, parent=None, kind=SPAN_KIND_INTERNAL, start_ns=None, **attributes):
+        """Open a span under ``parent`` (the root by default) and return it"""
+        span = {
+            "name": name,
+            "span_id": _new_id(8),
+            "parent_id": None if parent is False else (parent or self.root)["span_id"],
+            "kind": kind,
+            "start_ns": start_ns or time.time_ns(),
+            "end_ns": None,
+            "attributes": dict(attributes),
+            "error": None
+        }
+        self.spans.append(span)
+        return span
+
+    def end_span(self, span, error=None):
+        span["end_ns"] = time.time_ns()
+        span["error"] = error
+
+    @contextmanager
+    def span(self, name, parent=None, kind=SPAN_KIND_INTERNAL, **attributes):
+        """Time the enclosed block as a span, marked as failed if it raises"""
+        span = self.start_span(name, parent, kind, **attributes)
+        try:
+            yield span
+        except Exception as e:
+            self.end_span(span, error=str(e))
+            raise
+        self.end_span(span)
+
+    def headers(self, span=None):
+        """Propagation headers for a request made inside ``span``"""
+        parent = span or self.root
+        return {
+            "traceparent": f"00-{self.trace_id}-{parent['span_id']}-01",
+            REQUEST_ID_HEADER: self.request_id
+        }
+
+    def add_server_timing(self, span, header):
+        """
+        Add the backend phases of a ``Server-Timing`` header (``queue;dur=12.5, inference;dur=80``) under ``span``.
+
+        Only durations are reported, so the phases are laid out back to back,
+        ending where the network span ends.
+        """
+        phases = []
+        for entry in (header or "").split(","):
+            parts = [part.strip() for part in entry.split(";")]
+            duration = next((part[4:] for part in parts[1:] if part.startswith("dur=")), None)
+            if parts[0] and duration is not None:
+                phases.append((parts[0], float(duration)))
+
+        start = (span["end_ns"] or time.time_ns()) - int(sum(ms for _, ms in phases) * 1e6)
+        for name, ms in phases:
+            child = self.start_span(f"backend.{name}", parent=span, start_ns=max(start, span["start_ns"]), source="server-timing")
+            start += int(ms * 1e6)
+            child["end_ns"] = max(start, child["start_ns"])
+
+    def finish(self, error=None, exporter=None):
+        """Close the root span (and any span left open) and export the trace"""
+        if self.finished:
+            return
+        for span in self.spans:
+            if span["end_ns"] is None:
+                self.end_span(span, error if span is self.root else None)
+        self.finished = True
+        (exporter or DEFAULT_EXPORTER).export(self)
+
+    def breakdown(self):
+        """Spans with their start offset from the root and duration, in milliseconds"""
+        depth = {self.root["span_id"]: 0}
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s["start_ns"]):
+            if span["parent_id"] is not None:
+                depth[span["span_id"]] = depth.get(span["parent_id"], 0) + 1
+            end = span["end_ns"] or time.time_ns()
+            rows.append({
+                "Span": "  " * depth[span["span_id"]] + span["name"],
+                "Start (ms)": (span["start_ns"] - self.root["start_ns"]) / 1e6,
+                "Duration (ms)": (end - span["start_ns"]) / 1e6,
+                "Error": span["error"] or ""
+            })
+        return pd.DataFrame(rows)
+
+    def to_otlp(self):
+        """The trace as an OTLP/JSON export request"""
+        spans = []
+        for span in self.spans:
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": span["span_id"],
+                "name": span["name"],
+                "kind": span["kind"],
+                "startTimeUnixNano": str(span["start_ns"]),
+                "endTimeUnixNano": str(span["end_ns"] or span["start_ns"]),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span["attributes"].items()],
+                "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1}
+            }
+            if span["parent_id"]:
+                otlp_span["parentSpanId"] = span["parent_id"]
+            spans.append(otlp_span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "osiris.frontend"}, "spans": spans}]
+        }]}
+
+
+class TraceExporter:
+    """Appends finished traces to a JSON lines file and posts them to an OTLP/HTTP collector"""
+
+    def __init__(self, path=TRACE_FILE, endpoint=OTLP_ENDPOINT, timeout=5):
+        self.path = path
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        payload = trace.to_otlp()
+        if self.path:
+            line = json.dumps(payload, separators=(",", ":")) + "\n"
+            with self._lock:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(line)
+        if self.endpoint:
+            # Never hold up the page for the collector
+            threading.Thread(target=self._post, args=(payload,), daemon=True).start()
+
+    def _post(self, payload):
+        try:
+            requests.post(self.endpoint, json=payload, timeout=self.timeout)
+        except requests.RequestException:
+            pass
+
+
+DEFAULT_EXPORTER = TraceExporter()